@@ -20,3 +20,7 @@ admin.site.register(SurveyInstance)
 admin.site.register(SurveyEntryInstance)
 admin.site.register(SurveyQuestionInstance)
 admin.site.register(SurveyPositionInstance)
+admin.site.register(MovementRollup)
+admin.site.register(Attendance)
+admin.site.register(ColocationMeeting)
+admin.site.register(ColocationEdge)
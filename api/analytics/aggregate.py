@@ -0,0 +1,135 @@
+from django.db import NotSupportedError
+from django.db.models import Avg, Count, F, Func, IntegerField
+
+import datetime
+import numpy as np
+
+# The date that epoch seconds are counted from. Timestamps are stored without a time zone and treated as UTC.
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch_seconds(timestamp):
+    """
+        Function Summary: This function is used to get the whole number of seconds between the epoch and a timestamp.
+
+        Args:
+            timestamp -- A DateTime object without a time zone
+
+        Return:
+            Type: int
+            Data: The seconds since the epoch
+    """
+    return int((timestamp - EPOCH).total_seconds())
+
+
+# A database function that gets the index of the time bucket a timestamp falls in, using integer division of the seconds since 'start' by 'width'.
+class TimeBucket(Func):
+    output_field = IntegerField()
+
+    # The SQL that gets the whole seconds since the epoch of a timestamp on each database. SQLite rounds to the millisecond first.
+    EPOCH_SQL = {
+        'sqlite': "CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+        'postgresql': 'CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s)) AS BIGINT)',
+        'mysql': "TIMESTAMPDIFF(SECOND, '1970-01-01', %(expressions)s)"
+    }
+
+    def __init__(self, expression, start, width, **extra):
+        super().__init__(expression, **extra)
+        self.start = int(start)
+        self.width = int(width)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        if connection.vendor not in self.EPOCH_SQL:
+            raise NotSupportedError('TimeBucket is not supported on %s' % connection.vendor)
+
+        # The seconds are whole numbers, so integer division rounds down. MySQL needs DIV since '/' always returns a decimal.
+        operator = 'DIV' if connection.vendor == 'mysql' else '/'
+        template = '((%s - %d) %s %d)' % (self.EPOCH_SQL[connection.vendor], self.start, operator, self.width)
+        return super().as_sql(compiler, connection, template=template, **extra_context)
+
+
+def bucket_to_dict(start_time, width, bucket, count, mean_x, mean_y, mean_x2, mean_y2):
+    # The spread is the root mean square distance of the samples from the mean position.
+    variance = max(mean_x2 - mean_x * mean_x, 0) + max(mean_y2 - mean_y * mean_y, 0)
+
+    return {
+        'start': start_time + datetime.timedelta(seconds=int(bucket) * width),
+        'count': int(count),
+        'x': float(mean_x),
+        'y': float(mean_y),
+        'spread': float(np.sqrt(variance))
+    }
+
+
+def aggregate_in_database(positions, start_time, width):
+    """
+        Function Summary: This function is used to get the mean position, sample count, and spread of each time bucket with a single grouped query.
+
+        Args:
+            positions -- A QuerySet of the Position objects to aggregate
+            start_time -- The start of the first bucket
+            width -- The width of each bucket in seconds
+
+        Return:
+            Type: list
+            Data: A dictionary for each bucket with at least one Position, ordered by time
+    """
+    rows = positions.order_by().annotate(bucket=TimeBucket('timestamp', to_epoch_seconds(start_time), width)) \
+        .values('bucket') \
+        .annotate(count=Count('id'), mean_x=Avg('x'), mean_y=Avg('y'),
+                  mean_x2=Avg(F('x') * F('x')), mean_y2=Avg(F('y') * F('y'))) \
+        .order_by('bucket')
+
+    return [bucket_to_dict(start_time, width, x['bucket'], x['count'], x['mean_x'], x['mean_y'], x['mean_x2'], x['mean_y2'])
+            for x in rows]
+
+
+def aggregate_with_numpy(positions, start_time, width):
+    """
+        Function Summary: This function is used to get the same buckets as 'aggregate_in_database()' by grouping the Positions with NumPy. It is used on databases that TimeBucket does not support.
+
+        Args:
+            positions -- A QuerySet of the Position objects to aggregate
+            start_time -- The start of the first bucket
+            width -- The width of each bucket in seconds
+
+        Return:
+            Type: list
+            Data: A dictionary for each bucket with at least one Position, ordered by time
+    """
+    rows = list(positions.values_list('timestamp', 'x', 'y'))
+    if len(rows) == 0:
+        return []
+
+    timestamps, xs, ys = zip(*rows)
+    # Drop the fractions of a second the same way the database does before bucketing.
+    seconds = np.array(timestamps, dtype='datetime64[us]').astype(np.int64) // 1000000 - to_epoch_seconds(start_time)
+    xs = np.array(xs, dtype=float)
+    ys = np.array(ys, dtype=float)
+
+    buckets, bucket_indexes = np.unique(seconds // width, return_inverse=True)
+    counts = np.bincount(bucket_indexes)
+
+    means = [np.bincount(bucket_indexes, weights=values) / counts for values in (xs, ys, xs * xs, ys * ys)]
+
+    return [bucket_to_dict(start_time, width, buckets[i], counts[i], means[0][i], means[1][i], means[2][i], means[3][i])
+            for i in range(len(buckets))]
+
+
+def aggregate_positions(positions, start_time, width):
+    """
+        Function Summary: This function is used to get the mean x and y, the number of samples, and the spread of the Positions in each time bucket. The grouping is done in the database when it is supported and with NumPy otherwise.
+
+        Args:
+            positions -- A QuerySet of the Position objects to aggregate
+            start_time -- The start of the first bucket
+            width -- The width of each bucket in seconds
+
+        Return:
+            Type: list
+            Data: A dictionary with the 'start', 'count', 'x', 'y', and 'spread' of each bucket with at least one Position, ordered by time
+    """
+    try:
+        return aggregate_in_database(positions, start_time, width)
+    except NotSupportedError:
+        return aggregate_with_numpy(positions, start_time, width)
@@ -0,0 +1,187 @@
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import TruncDate
+
+from api.analytics.rollup import get_rollup_settings
+from api.app_settings import get_app_settings
+from api.models import Attendance, Class, ClassEnrollment, Position
+
+import datetime
+import functools
+
+# The default configuration of the attendance. These can be overridden with ATTENDANCE in settings.py.
+DEFAULT_ATTENDANCE_SETTINGS = {
+    'MIN_SAMPLES': 10
+}
+
+
+get_attendance_settings = functools.partial(get_app_settings, 'ATTENDANCE', DEFAULT_ATTENDANCE_SETTINGS)
+
+
+def get_finished_windows(current_class, start_date, end_date, now=None):
+    """
+        Function Summary: This function is used to get the Class meetings between two dates that ended at least DELAY_MINUTES of the movement rollups ago, so Positions sent late by the clients are included.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: list
+            Data: A list of (date, start datetime, end datetime) tuples ordered by date
+    """
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(minutes=get_rollup_settings()['DELAY_MINUTES'])
+    return [x for x in current_class.get_meeting_windows(start_date, min(end_date, cutoff.date())) if x[2] <= cutoff]
+
+
+def compute_attendance(current_class, windows, student_ids):
+    """
+        Function Summary: This function is used to work out the attendance of Students at Class meetings. The samples, arrival, and departure of every Student at every meeting are counted with one grouped query.
+
+        Args:
+            current_class -- The Class object
+            windows -- A list of (date, start datetime, end datetime) tuples from 'Class.get_meeting_windows()'
+            student_ids -- The IDs of the Students enrolled in the Class
+
+        Return:
+            Type: list
+            Data: An unsaved Attendance object for every Student at every meeting, ordered by date and Student
+    """
+    if len(windows) == 0 or len(student_ids) == 0:
+        return []
+
+    # Only count the Positions between the start and end time of the Class on the meeting dates.
+    rows = Position.objects.filter(student_id__in=student_ids, timestamp__gte=windows[0][1], timestamp__lte=windows[-1][2],
+                                   timestamp__time__gte=windows[0][1].time(), timestamp__time__lte=windows[0][2].time()) \
+        .annotate(meeting_date=TruncDate('timestamp')) \
+        .values('student_id', 'meeting_date') \
+        .annotate(sample_count=Count('id'), arrival=Min('timestamp'), departure=Max('timestamp')) \
+        .order_by()
+
+    counted = {(x['student_id'], x['meeting_date']): x for x in rows}
+    min_samples = get_attendance_settings()['MIN_SAMPLES']
+
+    attendance = []
+    for meeting_date, start_time, end_time in windows:
+        for student_id in sorted(student_ids):
+            row = counted.get((student_id, meeting_date), {'sample_count': 0, 'arrival': None, 'departure': None})
+            attendance.append(Attendance(student_id=student_id, associated_class=current_class, meeting_date=meeting_date,
+                                         present=row['sample_count'] >= min_samples, sample_count=row['sample_count'],
+                                         arrival=row['arrival'], departure=row['departure']))
+
+    return attendance
+
+
+def update_attendance(current_class, start_date, end_date, now=None):
+    """
+        Function Summary: This function is used to fill in the Attendance table for the finished Class meetings between two dates. Meetings that already have the Attendance of every enrolled Student are skipped, and the rest are computed together and replace what was stored.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of meetings computed
+    """
+    windows = get_finished_windows(current_class, start_date, end_date, now)
+    if len(windows) == 0:
+        return 0
+
+    student_ids = list(ClassEnrollment.objects.filter(class_enrolled=current_class).values_list('student_id', flat=True))
+
+    # A meeting is done when every enrolled Student has an Attendance for it, so Students that enrolled later are filled in.
+    stored = Attendance.objects.filter(associated_class=current_class, student_id__in=student_ids,
+                                       meeting_date__gte=windows[0][0], meeting_date__lte=windows[-1][0]) \
+        .values('meeting_date').annotate(count=Count('id')).order_by()
+    done = set(x['meeting_date'] for x in stored if x['count'] == len(student_ids))
+
+    missing = [x for x in windows if x[0] not in done]
+    if len(missing) == 0 or len(student_ids) == 0:
+        return 0
+
+    attendance = compute_attendance(current_class, missing, student_ids)
+    with transaction.atomic():
+        Attendance.objects.filter(associated_class=current_class, meeting_date__in=[x[0] for x in missing]).delete()
+        Attendance.objects.bulk_create(attendance)
+
+    return len(missing)
+
+
+def class_attendance(current_class, start_date, end_date):
+    """
+        Function Summary: This function is used to get the Attendance of a Class for the finished meetings between two dates, computing and storing any that are not stored yet.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+
+        Return:
+            Type: QuerySet
+            Data: The Attendance objects ordered by date and Student
+    """
+    update_attendance(current_class, start_date, end_date)
+
+    return Attendance.objects.filter(associated_class=current_class, meeting_date__gte=start_date, meeting_date__lte=end_date) \
+        .order_by('meeting_date', 'student_id')
+
+
+def student_attendance(current_class, student_id, start_date, end_date):
+    """
+        Function Summary: This function is used to get the Attendance of one Student at the finished meetings of a Class between two dates. Stored Attendance is used where it exists, and only this Student's samples are counted for the meetings the workers have not filled in yet. Those are not stored, so a request never computes the Attendance of the whole Class.
+
+        Args:
+            current_class -- The Class object
+            student_id -- The ID of the Student
+            start_date -- The first date to include
+            end_date -- The last date to include
+
+        Return:
+            Type: list
+            Data: The Attendance objects ordered by date. The ones not stored yet are unsaved
+    """
+    stored = {x.meeting_date: x for x in Attendance.objects.filter(associated_class=current_class, student_id=student_id,
+                                                                    meeting_date__gte=start_date, meeting_date__lte=end_date)}
+
+    missing = [x for x in get_finished_windows(current_class, start_date, end_date) if x[0] not in stored]
+    if len(missing) != 0 and ClassEnrollment.objects.filter(class_enrolled=current_class, student_id=student_id).exists():
+        stored.update((x.meeting_date, x) for x in compute_attendance(current_class, missing, [student_id]))
+
+    return [stored[x] for x in sorted(stored)]
+
+
+def forget_meeting_attendance(meetings):
+    """
+        Function Summary: This function is used to delete the Attendance of Class meetings, so it is counted again with the Positions that were sent late.
+
+        Args:
+            meetings -- A list of (Class, date) tuples as returned by 'late_meetings()'
+
+        Return:
+            Type: None
+    """
+    for current_class, meeting_date in meetings:
+        Attendance.objects.filter(associated_class=current_class, meeting_date=meeting_date).delete()
+
+
+def attendance_finished_meetings(now=None):
+    """
+        Function Summary: This function is used to fill in the Attendance of every Class meeting that finished in the last LOOKBACK_DAYS of the movement rollups.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of meetings computed
+    """
+    now = now or datetime.datetime.now()
+    start_date = now.date() - datetime.timedelta(days=get_rollup_settings()['LOOKBACK_DAYS'])
+
+    return sum(update_attendance(x, start_date, now.date(), now) for x in Class.objects.prefetch_related('days_of_the_week'))
@@ -0,0 +1,324 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from api.analytics.movement import to_seconds
+from api.analytics.rollup import get_rollup_settings
+from api.app_settings import get_app_settings
+from api.models import Class, ClassEnrollment, Position, ColocationMeeting, ColocationEdge
+
+import datetime
+import functools
+import numpy as np
+
+# SciPy is optional. Without it, pairs are found with the NumPy grid in 'grid_pairs()'.
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# The default configuration of the co-location graphs. These can be overridden with COLOCATION in settings.py.
+DEFAULT_COLOCATION_SETTINGS = {
+    'RADIUS': 1.0,
+    'BUCKET_SECONDS': 10
+}
+
+# The cells next to a cell that are searched for pairs. Only half of the neighbours are needed, since a pair found from
+# one side is the same pair as from the other side.
+NEIGHBOUR_OFFSETS = [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]
+
+
+get_colocation_settings = functools.partial(get_app_settings, 'COLOCATION', DEFAULT_COLOCATION_SETTINGS)
+
+
+def align_to_buckets(students, times, points, start, width):
+    """
+        Function Summary: This function is used to line up the samples of different Students in time. Time is split into buckets of 'width' seconds and each Student gets their mean position in every bucket they have a sample in.
+
+        Args:
+            students -- The Student ID of each sample
+            times -- The times of the samples in seconds
+            points -- An (n, 2) array of the x and y positions of the samples
+            start -- The time the first bucket starts at, in seconds
+            width -- The width of each bucket in seconds
+
+        Return:
+            Type: tuple
+            Data: A tuple of (students, buckets, points) with one row for each Student in each bucket
+    """
+    buckets = np.floor((times - start) / width).astype(np.int64)
+    bucket_count = buckets.max() + 1
+    keys, inverse = np.unique(students * bucket_count + buckets, return_inverse=True)
+
+    counts = np.bincount(inverse, minlength=len(keys))
+    means = np.column_stack([np.bincount(inverse, weights=points[:, i], minlength=len(keys)) / counts for i in range(2)])
+
+    return keys // bucket_count, keys % bucket_count, means
+
+
+def grid_pairs(points, buckets, radius):
+    """
+        Function Summary: This function is used to find every pair of points in the same bucket that are within 'radius' of each other, without comparing every pair. Points are hashed into square cells 'radius' wide, so each point only has to be compared to the points in its own cell and the cells next to it.
+
+        Args:
+            points -- An (n, 2) array of x and y positions
+            buckets -- The time bucket of each point. Points in different buckets are never paired
+            radius -- The largest distance between the two points of a pair
+
+        Return:
+            Type: numpy.ndarray
+            Data: An (m, 2) array of the indexes of the points in each pair, with the smaller index first
+    """
+    if len(points) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Shift the cells so the neighbours of every cell are still inside of the grid, then give every (bucket, cell) one key.
+    cells = np.floor(points / radius).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    width, height = cells.max(axis=0) + 2
+    keys = (buckets * height + cells[:, 1]) * width + cells[:, 0]
+
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+
+    found = []
+    for dx, dy in NEIGHBOUR_OFFSETS:
+        targets = keys + dy * width + dx
+        lows = np.searchsorted(sorted_keys, targets, side='left')
+        counts = np.searchsorted(sorted_keys, targets, side='right') - lows
+
+        # Pair every point with each of the points in the target cell.
+        firsts = np.repeat(np.arange(len(points)), counts)
+        seconds = order[np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lows, counts)]
+
+        keep = np.hypot(*(points[firsts] - points[seconds]).T) <= radius
+        if dx == 0 and dy == 0:
+            keep &= firsts < seconds
+
+        found.append(np.column_stack((firsts[keep], seconds[keep])))
+
+    return np.sort(np.concatenate(found), axis=1)
+
+
+def tree_pairs(points, buckets, radius):
+    """
+        Function Summary: This function finds the same pairs as 'grid_pairs()' with a SciPy KD-tree. The bucket is added as a third coordinate, spaced further apart than 'radius', so points in different buckets are never paired.
+
+        Args:
+            points -- An (n, 2) array of x and y positions
+            buckets -- The time bucket of each point
+            radius -- The largest distance between the two points of a pair
+
+        Return:
+            Type: numpy.ndarray
+            Data: An (m, 2) array of the indexes of the points in each pair, with the smaller index first
+    """
+    tree = cKDTree(np.column_stack((points, buckets * 2.0 * radius)))
+    return np.sort(tree.query_pairs(radius, output_type='ndarray').astype(np.int64).reshape(-1, 2), axis=1)
+
+
+def pairs_within_radius(points, buckets, radius):
+    """
+        Function Summary: This function is used to find every pair of points in the same bucket that are within 'radius' of each other, with a KD-tree when SciPy is installed and a grid otherwise.
+
+        Args:
+            points -- An (n, 2) array of x and y positions
+            buckets -- The time bucket of each point
+            radius -- The largest distance between the two points of a pair
+
+        Return:
+            Type: numpy.ndarray
+            Data: An (m, 2) array of the indexes of the points in each pair, with the smaller index first
+    """
+    if cKDTree is not None and len(points) > 1:
+        return tree_pairs(points, buckets, radius)
+
+    return grid_pairs(points, buckets, radius)
+
+
+def colocation_edges(students, times, points, start, colocation_settings):
+    """
+        Function Summary: This function is used to get how long each pair of Students was near each other.
+
+        Args:
+            students -- The Student ID of each sample
+            times -- The times of the samples in seconds
+            points -- An (n, 2) array of the x and y positions of the samples
+            start -- The time the first bucket starts at, in seconds
+            colocation_settings -- The co-location configuration
+
+        Return:
+            Type: list
+            Data: A [first Student ID, second Student ID, seconds] list for each pair of Students that were near each other, with the smaller ID first
+    """
+    width = colocation_settings['BUCKET_SECONDS']
+    bucket_students, buckets, bucket_points = align_to_buckets(students, times, points, start, width)
+    pairs = pairs_within_radius(bucket_points, buckets, colocation_settings['RADIUS'])
+
+    if len(pairs) == 0:
+        return []
+
+    # A Student is only in a bucket once, so every pair is two different Students and is counted once per bucket.
+    edge_students = np.sort(bucket_students[pairs], axis=1)
+    id_count = edge_students.max() + 1
+    keys, counts = np.unique(edge_students[:, 0] * id_count + edge_students[:, 1], return_counts=True)
+    return [[int(a), int(b), int(count) * width] for a, b, count in zip(keys // id_count, keys % id_count, counts)]
+
+
+def meeting_colocation(window, student_ids, colocation_settings):
+    """
+        Function Summary: This function is used to compute the co-location edges of a single Class meeting from its Positions.
+
+        Args:
+            window -- A (date, start datetime, end datetime) tuple from 'Class.get_meeting_windows()'
+            student_ids -- The IDs of the Students enrolled in the Class
+            colocation_settings -- The co-location configuration
+
+        Return:
+            Type: list
+            Data: The edges as returned by 'colocation_edges()'
+    """
+    meeting_date, start_time, end_time = window
+    rows = list(Position.objects.filter(student_id__in=student_ids, timestamp__gte=start_time, timestamp__lte=end_time)
+                .values_list('student_id', 'timestamp', 'x', 'y'))
+
+    if len(rows) == 0:
+        return []
+
+    students, timestamps, xs, ys = zip(*rows)
+    points = np.column_stack((np.array(xs, dtype=float), np.array(ys, dtype=float)))
+    return colocation_edges(np.array(students, dtype=np.int64), to_seconds(timestamps), points, to_seconds([start_time])[0],
+                            colocation_settings)
+
+
+def store_meeting_colocation(current_class, window, student_ids, colocation_settings):
+    """
+        Function Summary: This function is used to compute the co-location edges of a finished Class meeting and store them as a ColocationMeeting with its ColocationEdge objects. Any edges already stored for the meeting with the same configuration are replaced.
+
+        Args:
+            current_class -- The Class object
+            window -- A (date, start datetime, end datetime) tuple from 'Class.get_meeting_windows()'
+            student_ids -- The IDs of the Students enrolled in the Class
+            colocation_settings -- The co-location configuration
+
+        Return:
+            Type: ColocationMeeting
+            Data: The new ColocationMeeting, or the one stored at the same time by another process
+    """
+    edges = meeting_colocation(window, student_ids, colocation_settings)
+    lookup = {'associated_class': current_class, 'meeting_date': window[0], 'radius': colocation_settings['RADIUS'],
+              'bucket_seconds': colocation_settings['BUCKET_SECONDS']}
+
+    # If a request and the workers store the same meeting at the same time, the insert of the second one fails and the
+    # meeting stored by the first is used.
+    try:
+        with transaction.atomic():
+            ColocationMeeting.objects.filter(**lookup).delete()
+            meeting = ColocationMeeting.objects.create(**lookup)
+            ColocationEdge.objects.bulk_create([ColocationEdge(meeting=meeting, source_id=a, target_id=b, seconds=seconds)
+                                                for a, b, seconds in edges])
+    except IntegrityError:
+        meeting = ColocationMeeting.objects.get(**lookup)
+
+    return meeting
+
+
+def class_colocation(current_class, start_date, end_date, min_seconds=0):
+    """
+        Function Summary: This function is used to get the proximity graph of the Students of a Class over the Class meetings between two dates. The edges of each meeting that has been over for DELAY_MINUTES of the movement rollups are stored the first time they are computed, and the stored edges are added up in the database. Meetings that have not been over that long are computed from their Positions every time.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+            min_seconds -- The least time two Students must have been near each other to get an edge
+
+        Return:
+            Type: dict
+            Data: A dictionary with the number of 'meetings' and the 'edges' of the graph. Each edge has a 'source' and 'target' Student ID and the 'seconds' they were near each other, ordered from most to least time
+    """
+    colocation_settings = get_colocation_settings()
+    windows = current_class.get_meeting_windows(start_date, end_date)
+    # Wait as long as the movement rollups do, so Positions sent late by the clients are included.
+    cutoff = datetime.datetime.now() - datetime.timedelta(minutes=get_rollup_settings()['DELAY_MINUTES'])
+
+    stored = dict(ColocationMeeting.objects.filter(associated_class=current_class, meeting_date__gte=start_date,
+                                                   meeting_date__lte=end_date, radius=colocation_settings['RADIUS'],
+                                                   bucket_seconds=colocation_settings['BUCKET_SECONDS'])
+                  .values_list('meeting_date', 'id'))
+
+    student_ids = None
+    meeting_ids = []
+    weights = {}
+    for window in windows:
+        if window[0] in stored:
+            meeting_ids.append(stored[window[0]])
+            continue
+
+        if student_ids is None:
+            student_ids = list(ClassEnrollment.objects.filter(class_enrolled=current_class).values_list('student_id', flat=True))
+
+        if window[2] < cutoff:
+            meeting_ids.append(store_meeting_colocation(current_class, window, student_ids, colocation_settings).id)
+        else:
+            for a, b, seconds in meeting_colocation(window, student_ids, colocation_settings):
+                weights[(a, b)] = weights.get((a, b), 0) + seconds
+
+    if len(meeting_ids) != 0:
+        totals = ColocationEdge.objects.filter(meeting_id__in=meeting_ids).values('source_id', 'target_id') \
+            .annotate(total=Sum('seconds')).values_list('source_id', 'target_id', 'total')
+        for a, b, seconds in totals:
+            weights[(a, b)] = weights.get((a, b), 0) + seconds
+
+    edges = [{'source': a, 'target': b, 'seconds': seconds} for (a, b), seconds in weights.items() if seconds >= min_seconds]
+    edges.sort(key=lambda x: (-x['seconds'], x['source'], x['target']))
+
+    return {'meetings': len(windows), 'edges': edges}
+
+
+def colocation_finished_meetings(now=None):
+    """
+        Function Summary: This function is used to store the co-location edges of every Class meeting that ended at least DELAY_MINUTES of the movement rollups ago, going back LOOKBACK_DAYS. Meetings that already have a ColocationMeeting with the current configuration are skipped.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of meetings stored
+    """
+    colocation_settings = get_colocation_settings()
+    rollup_settings = get_rollup_settings()
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(minutes=rollup_settings['DELAY_MINUTES'])
+    start_date = cutoff.date() - datetime.timedelta(days=rollup_settings['LOOKBACK_DAYS'])
+
+    done = set(ColocationMeeting.objects.filter(meeting_date__gte=start_date, radius=colocation_settings['RADIUS'],
+                                                bucket_seconds=colocation_settings['BUCKET_SECONDS'])
+               .values_list('associated_class_id', 'meeting_date'))
+
+    meetings = 0
+    for current_class in Class.objects.prefetch_related('days_of_the_week'):
+        windows = [x for x in current_class.get_meeting_windows(start_date, cutoff.date())
+                   if x[2] <= cutoff and (current_class.id, x[0]) not in done]
+
+        if len(windows) != 0:
+            student_ids = list(ClassEnrollment.objects.filter(class_enrolled=current_class).values_list('student_id', flat=True))
+            for window in windows:
+                store_meeting_colocation(current_class, window, student_ids, colocation_settings)
+                meetings += 1
+
+    return meetings
+
+
+def forget_meeting_colocation(meetings):
+    """
+        Function Summary: This function is used to delete the stored co-location edges of Class meetings, so they are computed again with the Positions that were sent late.
+
+        Args:
+            meetings -- A list of (Class, date) tuples as returned by 'late_meetings()'
+
+        Return:
+            Type: None
+    """
+    for current_class, meeting_date in meetings:
+        ColocationMeeting.objects.filter(associated_class=current_class, meeting_date=meeting_date).delete()
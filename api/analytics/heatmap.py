@@ -0,0 +1,214 @@
+from django.core.cache import caches
+
+from api.analytics.rollup import get_rollup_settings
+from api.app_settings import get_app_settings
+from api.models import ClassEnrollment, Position
+
+import datetime
+import functools
+import itertools
+import numpy as np
+import uuid
+
+# The default configuration of the heatmaps. These can be overridden with POSITION_HEATMAP in settings.py. CACHE_ALIAS is
+# None to not cache the grids unless it names a cache shared by every server process, since the grids made stale by late
+# Positions are only forgotten in that cache.
+DEFAULT_HEATMAP_SETTINGS = {
+    'EXTENT': [[0, 20], [0, 20]],
+    'DEFAULT_BINS': 40,
+    'MAX_BINS': 200,
+    'CHUNK_SIZE': 5000,
+    'CACHE_ALIAS': None,
+    'CACHE_TIMEOUT': 7 * 24 * 60 * 60
+}
+
+# The prefix of the keys the grids of each meeting are cached under.
+HEATMAP_CACHE_KEY_PREFIX = 'icba-heatmap:'
+
+# The prefix of the keys the version of the grids of each meeting is stored under.
+HEATMAP_VERSION_KEY_PREFIX = 'icba-heatmap-version:'
+
+
+get_heatmap_settings = functools.partial(get_app_settings, 'POSITION_HEATMAP', DEFAULT_HEATMAP_SETTINGS)
+
+
+def add_to_grid(grid, points, extent):
+    """
+        Function Summary: This function is used to add the counts of an array of points to a grid.
+
+        Args:
+            grid -- The (bins, bins) array of counts to add to
+            points -- An (n, 2) array of x and y positions
+            extent -- The [[min x, max x], [min y, max y]] covered by the grid
+
+        Return:
+            Type: int
+            Data: The number of points outside of the extent
+    """
+    counts, x_edges, y_edges = np.histogram2d(points[:, 0], points[:, 1], bins=grid.shape[0], range=extent)
+    grid += counts.astype(np.int64)
+    return len(points) - int(counts.sum())
+
+
+def histogram_in_chunks(rows, bins, extent, chunk_size):
+    """
+        Function Summary: This function is used to count the positions that fall in each cell of a grid. The rows are read 'chunk_size' at a time, so memory stays the same however many rows there are.
+
+        Args:
+            rows -- An iterable of (x, y) tuples
+            bins -- The number of cells along each side of the grid
+            extent -- The [[min x, max x], [min y, max y]] covered by the grid
+            chunk_size -- The most rows held in memory at once
+
+        Return:
+            Type: tuple
+            Data: A tuple of (grid, outside). 'grid' is a (bins, bins) array of counts indexed by [x][y] and 'outside' is the number of rows outside of the extent
+    """
+    grid = np.zeros((bins, bins), dtype=np.int64)
+    outside = 0
+    rows = iter(rows)
+
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if len(chunk) == 0:
+            return grid, outside
+
+        outside += add_to_grid(grid, np.array(chunk, dtype=float), extent)
+
+
+def get_version_key(class_id, meeting_date):
+    """
+        Function Summary: This function is used to get the key the version of the grids of a Class meeting is stored under. The version changes when Positions of the meeting are sent late, so every grid cached before that is no longer used.
+
+        Args:
+            class_id -- The ID of the Class
+            meeting_date -- The date of the meeting
+
+        Return:
+            Type: str
+            Data: The cache key
+    """
+    return '%s%d:%s' % (HEATMAP_VERSION_KEY_PREFIX, class_id, meeting_date.isoformat())
+
+
+def get_cache_key(current_class, meeting_date, version, bins, extent):
+    """
+        Function Summary: This function is used to get the key the grid of a Class meeting is cached under. The grid depends on the Class, the date and version of the meeting, the resolution, and the extent.
+
+        Args:
+            current_class -- The Class object
+            meeting_date -- The date of the meeting
+            version -- The version of the meeting from 'get_version_key()'
+            bins -- The number of cells along each side of the grid
+            extent -- The [[min x, max x], [min y, max y]] covered by the grid
+
+        Return:
+            Type: str
+            Data: The cache key
+    """
+    return '%s%d:%s:%s:%d:%s' % (HEATMAP_CACHE_KEY_PREFIX, current_class.id, meeting_date.isoformat(), version, bins,
+                                 ','.join(str(x) for x in itertools.chain(*extent)))
+
+
+def meeting_heatmap(current_class, window, bins, heatmap_settings, cache_key=None):
+    """
+        Function Summary: This function is used to count the Positions of a single Class meeting. The grid is cached under 'cache_key' once the meeting has been over for DELAY_MINUTES of the movement rollups, and 'forget_meeting_heatmaps()' changes the version of the meeting if Positions of it are sent after that.
+
+        Args:
+            current_class -- The Class object
+            window -- A (date, start datetime, end datetime) tuple from 'Class.get_meeting_windows()'
+            bins -- The number of cells along each side of the grid
+            heatmap_settings -- The heatmap configuration
+            cache_key -- The key to cache the grid under, or None to not cache it
+
+        Return:
+            Type: tuple
+            Data: A tuple of (grid, outside) as returned by 'histogram_in_chunks()'
+    """
+    meeting_date, start_time, end_time = window
+
+    enrolled = ClassEnrollment.objects.filter(class_enrolled=current_class).values('student_id')
+    rows = Position.objects.filter(student_id__in=enrolled, timestamp__gte=start_time, timestamp__lte=end_time) \
+        .values_list('x', 'y').iterator(chunk_size=heatmap_settings['CHUNK_SIZE'])
+
+    grid, outside = histogram_in_chunks(rows, bins, heatmap_settings['EXTENT'], heatmap_settings['CHUNK_SIZE'])
+
+    # Wait as long as the movement rollups do, so Positions sent late by the clients are included.
+    finished = end_time + datetime.timedelta(minutes=get_rollup_settings()['DELAY_MINUTES']) < datetime.datetime.now()
+    if cache_key is not None and finished:
+        caches[heatmap_settings['CACHE_ALIAS']].set(cache_key, (grid.tolist(), outside), heatmap_settings['CACHE_TIMEOUT'])
+
+    return grid, outside
+
+
+def class_heatmap(current_class, start_date, end_date, bins=None):
+    """
+        Function Summary: This function is used to get how often the Students of a Class were in each part of the room during the Class meetings between two dates.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+            bins -- The number of cells along each side of the grid, or None for the default
+
+        Return:
+            Type: dict
+            Data: A dictionary with the 'bins', the 'extent', the 'counts' of each cell as a list of rows indexed by [y][x], the 'total' Positions in the grid, the 'max' count of a cell, the number of Positions 'outside' of the extent, and the 'meetings' included
+    """
+    heatmap_settings = get_heatmap_settings()
+    bins = bins or heatmap_settings['DEFAULT_BINS']
+
+    grid = np.zeros((bins, bins), dtype=np.int64)
+    outside = 0
+
+    windows = current_class.get_meeting_windows(start_date, end_date)
+    keys = [None] * len(windows)
+    cached = {}
+
+    # Get the versions and then the cached grids of every meeting in two calls, and only count the Positions of the
+    # meetings that are missing.
+    if heatmap_settings['CACHE_ALIAS']:
+        cache = caches[heatmap_settings['CACHE_ALIAS']]
+        versions = cache.get_many([get_version_key(current_class.id, x[0]) for x in windows])
+        keys = [get_cache_key(current_class, x[0], versions.get(get_version_key(current_class.id, x[0]), 0), bins,
+                              heatmap_settings['EXTENT']) for x in windows]
+        cached = cache.get_many(keys)
+
+    for window, key in zip(windows, keys):
+        if key in cached:
+            meeting_grid, meeting_outside = np.array(cached[key][0], dtype=np.int64), cached[key][1]
+        else:
+            meeting_grid, meeting_outside = meeting_heatmap(current_class, window, bins, heatmap_settings, key)
+
+        grid += meeting_grid
+        outside += meeting_outside
+
+    # Rows of the grid go along y so the counts can be drawn top to bottom without reshaping.
+    return {
+        'bins': bins,
+        'extent': heatmap_settings['EXTENT'],
+        'counts': grid.T.tolist(),
+        'total': int(grid.sum()),
+        'max': int(grid.max()),
+        'outside': outside,
+        'meetings': len(windows)
+    }
+
+
+def forget_meeting_heatmaps(meetings):
+    """
+        Function Summary: This function is used to give Class meetings a new version, so their cached grids at every resolution are no longer used and are counted again with the Positions that were sent late.
+
+        Args:
+            meetings -- A list of (Class, date) tuples as returned by 'late_meetings()'
+
+        Return:
+            Type: None
+    """
+    heatmap_settings = get_heatmap_settings()
+    if not heatmap_settings['CACHE_ALIAS'] or len(meetings) == 0:
+        return
+
+    # The versions do not expire, so a grid cached under an older version is never used again.
+    caches[heatmap_settings['CACHE_ALIAS']].set_many({get_version_key(current_class.id, meeting_date): uuid.uuid4().hex
+                                                      for current_class, meeting_date in meetings}, None)
@@ -0,0 +1,293 @@
+from api.analytics.trajectory import positions_to_arrays
+from api.app_settings import get_app_settings
+from api.models import ClassEnrollment, Position
+
+from django.db.models import Q
+
+import datetime
+import functools
+import itertools
+import numpy as np
+import operator
+
+# The default configuration of the movement metrics. These can be overridden with MOVEMENT_METRICS in settings.py.
+DEFAULT_METRIC_SETTINGS = {
+    'MAX_GAP_SECONDS': 30,
+    'STATIONARY_SPEED': 0.2,
+    'STATIONARY_MIN_SECONDS': 60,
+    'SEAT_CHANGE_DISTANCE': 1.5,
+    'SPEED_PERCENTILES': [50, 90],
+    'ZONES': [],
+    'CHUNK_SIZE': 10000
+}
+
+
+get_metric_settings = functools.partial(get_app_settings, 'MOVEMENT_METRICS', DEFAULT_METRIC_SETTINGS)
+
+
+# Timestamps are stored without a time zone and treated as UTC, both ways.
+def to_seconds(timestamps):
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+def from_seconds(seconds):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=int(round(seconds * 1e6)))
+
+
+def group_percentiles(values, counts, percentile):
+    """
+        Function Summary: This function is used to get the same percentile of the values of every owner at once, with the linear interpolation used by 'numpy.percentile()'.
+
+        Args:
+            values -- The values, sorted by owner and then by value
+            counts -- The number of values of each owner
+            percentile -- The percentile to get, between 0 and 100
+
+        Return:
+            Type: numpy.ndarray
+            Data: The percentile of each owner, or NaN for owners without values
+    """
+    result = np.full(len(counts), np.nan)
+    has_values = counts > 0
+    if not has_values.any():
+        return result
+
+    offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))[has_values]
+    position = percentile / 100 * (counts[has_values] - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts[has_values] - 1)
+
+    result[has_values] = values[offsets + lower] + (position - lower) * (values[offsets + upper] - values[offsets + lower])
+    return result
+
+
+def find_stationary_periods(times, points, still):
+    """
+        Function Summary: This function is used to find the runs of consecutive steps where a Student was standing still, along with where they were.
+
+        Args:
+            times -- The times of the samples in seconds
+            points -- An (n, 2) array of the x and y positions of the samples
+            still -- A boolean for each step between two samples, True when the Student was still
+
+        Return:
+            Type: tuple
+            Data: A tuple of (starts, ends, durations, centroids). 'starts' and 'ends' are the indexes of the first and last sample of each run and 'centroids' is an (n, 2) array of the mean position of each run
+    """
+    edges = np.diff(np.concatenate(([0], still.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    # A run of the steps 'start' to 'end - 1' covers the samples 'start' to 'end'.
+    ends = np.flatnonzero(edges == -1)
+
+    sums = np.concatenate((np.zeros((1, 2)), np.cumsum(points, axis=0)))
+    centroids = (sums[ends + 1] - sums[starts]) / (ends - starts + 1)[:, np.newaxis]
+
+    return starts, ends, times[ends] - times[starts], centroids
+
+
+def compute_movement_metrics(students, times, points, meetings, student_ids=None, metric_settings=None):
+    """
+        Function Summary: This function is used to compute the movement metrics of many Students at once. Every metric is computed over all of the samples together with NumPy, and the results are split by Student with 'numpy.bincount()'.
+
+        Args:
+            students -- The Student ID of each sample
+            times -- The times of the samples in seconds, ordered by time within each Student
+            points -- An (n, 2) array of the x and y positions of the samples
+            meetings -- The index of the Class meeting of each sample. Steps between two meetings are not counted
+            student_ids -- The IDs of the Students to include, which must hold the Student of every sample, or None for every Student with a sample
+            metric_settings -- The metric configuration, or None for 'get_metric_settings()'
+
+        Return:
+            Type: dict
+            Data: A dictionary keyed by Student ID. Each value has the 'samples', 'tracked_seconds', 'distance', 'speed', 'stationary', 'zones', and 'seat_changes' of the Student
+    """
+    metric_settings = metric_settings or get_metric_settings()
+    student_ids = np.unique(students if student_ids is None else student_ids)
+    owners = np.searchsorted(student_ids, students)
+    count = len(student_ids)
+
+    # A step only counts when both samples are of the same Student and meeting and are close together in time, so the time
+    # the app was not running and the jump between meetings are left out.
+    gaps = np.diff(times)
+    steps = np.diff(points, axis=0)
+    lengths = np.hypot(steps[:, 0], steps[:, 1])
+    valid = (owners[1:] == owners[:-1]) & (meetings[1:] == meetings[:-1]) & (gaps > 0) & (gaps <= metric_settings['MAX_GAP_SECONDS'])
+
+    step_owners = owners[:-1][valid]
+    step_gaps = gaps[valid]
+    step_lengths = lengths[valid]
+    speeds = step_lengths / step_gaps
+    distance = np.bincount(step_owners, weights=step_lengths, minlength=count)
+    tracked_seconds = np.bincount(step_owners, weights=step_gaps, minlength=count)
+    step_counts = np.bincount(step_owners, minlength=count)
+
+    # Sort by Student and then by speed with one sort on a combined key. The speeds are scaled below 1 so they only order the
+    # steps of the same Student. This is far faster than 'numpy.lexsort()' on millions of steps.
+    sorted_speeds = speeds[np.argsort(step_owners + speeds / (speeds.max(initial=0) + 1))]
+    percentiles = {'p' + str(x): group_percentiles(sorted_speeds, step_counts, x)
+                   for x in metric_settings['SPEED_PERCENTILES']}
+    percentiles['max'] = group_percentiles(sorted_speeds, step_counts, 100)
+
+    still = np.zeros(len(gaps), dtype=bool)
+    still[valid] = speeds < metric_settings['STATIONARY_SPEED']
+    starts, ends, durations, centroids = find_stationary_periods(times, points, still)
+
+    keep = durations >= metric_settings['STATIONARY_MIN_SECONDS']
+    starts, durations, centroids = starts[keep], durations[keep], centroids[keep]
+    period_owners = owners[starts]
+    longest = np.zeros(count)
+    np.maximum.at(longest, period_owners, durations)
+
+    # A seat change is two stationary periods in a row of the same Student that are far enough apart.
+    moved = np.hypot(*(centroids[1:] - centroids[:-1]).T) > metric_settings['SEAT_CHANGE_DISTANCE']
+    changes = np.flatnonzero((period_owners[1:] == period_owners[:-1]) & moved)
+
+    zones = {}
+    step_xs = points[:-1, 0][valid]
+    step_ys = points[:-1, 1][valid]
+    for zone in metric_settings['ZONES']:
+        inside = (step_xs >= zone['x'][0]) & (step_xs < zone['x'][1]) & (step_ys >= zone['y'][0]) & (step_ys < zone['y'][1])
+        zones[zone['name']] = np.bincount(step_owners[inside], weights=step_gaps[inside], minlength=count)
+
+    samples = np.bincount(owners, minlength=count)
+    stationary_counts = np.bincount(period_owners, minlength=count)
+    stationary_seconds = np.bincount(period_owners, weights=durations, minlength=count)
+
+    metrics = {}
+    for i, student_id in enumerate(student_ids.tolist()):
+        metrics[student_id] = {
+            'samples': int(samples[i]),
+            'tracked_seconds': float(tracked_seconds[i]),
+            'distance': float(distance[i]),
+            'speed': {'mean': float(distance[i] / tracked_seconds[i]) if tracked_seconds[i] > 0 else None,
+                      **{name: None if np.isnan(values[i]) else float(values[i]) for name, values in percentiles.items()}},
+            'stationary': {'count': int(stationary_counts[i]), 'seconds': float(stationary_seconds[i]), 'longest': float(longest[i])},
+            'zones': {name: float(values[i]) for name, values in zones.items()},
+            'seat_changes': []
+        }
+
+    for i in changes.tolist():
+        metrics[int(student_ids[period_owners[i + 1]])]['seat_changes'].append({
+            'time': from_seconds(times[starts[i + 1]]),
+            'from': centroids[i].tolist(),
+            'to': centroids[i + 1].tolist()
+        })
+
+    return metrics
+
+
+def metrics_by_student(students, times, points, meetings, student_ids, metric_settings=None):
+    """
+        Function Summary: This function is used to compute the movement metrics of many Students one Student at a time. The samples of one Student fit in the CPU cache, which makes this faster than one call to 'compute_movement_metrics()' on the samples of every Student.
+
+        Args:
+            students -- The Student ID of each sample, with the samples of each Student next to each other
+            times -- The times of the samples in seconds, ordered by time within each Student
+            points -- An (n, 2) array of the x and y positions of the samples
+            meetings -- The index of the Class meeting of each sample
+            student_ids -- The IDs of the Students to include, which must hold the Student of every sample
+            metric_settings -- The metric configuration, or None for 'get_metric_settings()'
+
+        Return:
+            Type: dict
+            Data: The metrics of each Student as described in 'compute_movement_metrics()'
+    """
+    metric_settings = metric_settings or get_metric_settings()
+    bounds = np.flatnonzero(np.diff(np.concatenate(([-1], students, [-1]))))
+
+    metrics = {}
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        metrics.update(compute_movement_metrics(students[start:end], times[start:end], points[start:end], meetings[start:end],
+                                                metric_settings=metric_settings))
+
+    # The Students without any samples still get their (empty) metrics.
+    missing = np.setdiff1d(np.asarray(student_ids, dtype=np.int64), np.fromiter(metrics.keys(), dtype=np.int64))
+    metrics.update(compute_movement_metrics(np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, 2)),
+                                            np.empty(0, dtype=np.int64), missing, metric_settings))
+    return metrics
+
+
+def student_movement_metrics(rows, metric_settings=None):
+    """
+        Function Summary: This function is used to compute the movement metrics of a single Student's Positions.
+
+        Args:
+            rows -- A list of (timestamp, x, y) tuples ordered by timestamp
+            metric_settings -- The metric configuration, or None for 'get_metric_settings()'
+
+        Return:
+            Type: dict
+            Data: The metrics of the Student as described in 'compute_movement_metrics()'
+    """
+    times, points = positions_to_arrays(rows)
+    zeros = np.zeros(len(times), dtype=np.int64)
+    return compute_movement_metrics(zeros, times, points, zeros, np.zeros(1, dtype=np.int64), metric_settings)[0]
+
+
+def load_class_positions(windows, student_ids, chunk_size=None):
+    """
+        Function Summary: This function is used to read the Positions of Students during a set of Class meetings into NumPy arrays. Only the Positions inside of the meetings are read, and they are streamed 'chunk_size' rows at a time into arrays sized by counting the rows first, so the rows are never all held as Python objects at once.
+
+        Args:
+            windows -- A list of (date, start datetime, end datetime) tuples from 'Class.get_meeting_windows()'
+            student_ids -- The IDs of the Students to read the Positions of
+            chunk_size -- The number of rows converted at a time, or None for the CHUNK_SIZE of the movement metrics
+
+        Return:
+            Type: tuple
+            Data: A tuple of (students, times, points, meetings) as taken by 'compute_movement_metrics()'
+    """
+    chunk_size = chunk_size or get_metric_settings()['CHUNK_SIZE']
+    count = 0
+    if len(windows) != 0 and len(student_ids) != 0:
+        in_meetings = functools.reduce(operator.or_, [Q(timestamp__gte=x[1], timestamp__lte=x[2]) for x in windows])
+        positions = Position.objects.filter(in_meetings, student_id__in=student_ids)
+        count = positions.count()
+
+    if count == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty((0, 2)), np.empty(0, dtype=np.int64)
+
+    students = np.empty(count, dtype=np.int64)
+    times = np.empty(count)
+    points = np.empty((count, 2))
+
+    rows = positions.order_by('student_id', 'timestamp').values_list('student_id', 'timestamp', 'x', 'y') \
+        .iterator(chunk_size=chunk_size)
+    filled = 0
+    while filled < count:
+        # Positions saved after the count are left out, as if they had been saved after the read.
+        chunk = list(itertools.islice(rows, min(chunk_size, count - filled)))
+        if len(chunk) == 0:
+            break
+
+        chunk_students, chunk_timestamps, xs, ys = zip(*chunk)
+        end = filled + len(chunk)
+        students[filled:end] = chunk_students
+        times[filled:end] = to_seconds(chunk_timestamps)
+        points[filled:end, 0] = xs
+        points[filled:end, 1] = ys
+        filled = end
+
+    # Match every sample to the last meeting that started before it.
+    meetings = np.searchsorted(to_seconds([x[1] for x in windows]), times[:filled], side='right') - 1
+    return students[:filled], times[:filled], points[:filled], meetings
+
+
+def class_movement_metrics(current_class, start_date, end_date):
+    """
+        Function Summary: This function is used to get the movement metrics of every Student enrolled in a Class, over the Class meetings between two dates.
+
+        Args:
+            current_class -- The Class object
+            start_date -- The first date to include
+            end_date -- The last date to include
+
+        Return:
+            Type: tuple
+            Data: A tuple of (meetings, metrics). 'meetings' is the number of Class meetings and 'metrics' is a dictionary of the metrics of each Student as described in 'compute_movement_metrics()'
+    """
+    windows = current_class.get_meeting_windows(start_date, end_date)
+    student_ids = list(ClassEnrollment.objects.filter(class_enrolled=current_class).values_list('student_id', flat=True))
+
+    students, times, points, meetings = load_class_positions(windows, student_ids)
+    return len(windows), metrics_by_student(students, times, points, meetings, student_ids)
@@ -0,0 +1,250 @@
+from django.db import transaction
+
+from api.analytics.trajectory import positions_to_arrays
+from api.app_settings import get_app_settings
+from api.models import Class, ClassEnrollment, MovementRollup, Position
+
+import bisect
+import datetime
+import functools
+import itertools
+import numpy as np
+
+# The default configuration of the movement rollups. These can be overridden with MOVEMENT_ROLLUP in settings.py.
+DEFAULT_ROLLUP_SETTINGS = {
+    'DWELL_RADIUS': 0.5,
+    'DWELL_MIN_SECONDS': 60,
+    'DELAY_MINUTES': 15,
+    'LOOKBACK_DAYS': 7,
+    'SCHEDULE_SECONDS': 10 * 60
+}
+
+# The fields of MovementRollup that 'summarize_path()' fills in.
+ROLLUP_FIELDS = ('sample_count', 'first_timestamp', 'last_timestamp', 'centroid_x', 'centroid_y', 'path_length', 'min_x',
+                 'max_x', 'min_y', 'max_y', 'dwell_count', 'dwell_seconds', 'longest_dwell_seconds')
+
+
+get_rollup_settings = functools.partial(get_app_settings, 'MOVEMENT_ROLLUP', DEFAULT_ROLLUP_SETTINGS)
+
+
+def find_dwells(times, points, radius, min_seconds):
+    """
+        Function Summary: This function is used to find the times a Student stayed in one place. A dwell is a run of samples that all stay within 'radius' of the first sample of the run and lasts at least 'min_seconds'.
+
+        Args:
+            times -- The times of the samples in seconds, in order
+            points -- An (n, 2) array of the x and y positions of the samples
+            radius -- The furthest a sample may be from the start of the run to stay in it
+            min_seconds -- The shortest run that counts as a dwell
+
+        Return:
+            Type: list
+            Data: The length in seconds of each dwell, in order
+    """
+    dwells = []
+    xs, ys, times = points[:, 0].tolist(), points[:, 1].tolist(), times.tolist()
+    start = 0
+
+    for i in range(1, len(times) + 1):
+        # Close the current run at the end of the path or at the first sample outside of the radius.
+        if i < len(times) and (xs[i] - xs[start]) ** 2 + (ys[i] - ys[start]) ** 2 <= radius * radius:
+            continue
+
+        if times[i - 1] - times[start] >= min_seconds:
+            dwells.append(times[i - 1] - times[start])
+        start = i
+
+    return dwells
+
+
+def summarize_path(rows, dwell_radius, dwell_min_seconds):
+    """
+        Function Summary: This function is used to get the movement statistics of a Student during one Class meeting.
+
+        Args:
+            rows -- A list of (timestamp, x, y) tuples ordered by timestamp
+            dwell_radius -- The radius used by 'find_dwells()'
+            dwell_min_seconds -- The shortest dwell used by 'find_dwells()'
+
+        Return:
+            Type: dict
+            Data: A dictionary with a value for each field in ROLLUP_FIELDS. Everything except 'sample_count' is None when there are no rows
+    """
+    if len(rows) == 0:
+        summary = {field: None for field in ROLLUP_FIELDS}
+        summary['sample_count'] = 0
+        return summary
+
+    times, points = positions_to_arrays(rows)
+    steps = np.diff(points, axis=0)
+    dwells = find_dwells(times, points, dwell_radius, dwell_min_seconds)
+
+    return {
+        'sample_count': len(rows),
+        'first_timestamp': rows[0][0],
+        'last_timestamp': rows[-1][0],
+        'centroid_x': float(points[:, 0].mean()),
+        'centroid_y': float(points[:, 1].mean()),
+        'path_length': float(np.hypot(steps[:, 0], steps[:, 1]).sum()),
+        'min_x': float(points[:, 0].min()),
+        'max_x': float(points[:, 0].max()),
+        'min_y': float(points[:, 1].min()),
+        'max_y': float(points[:, 1].max()),
+        'dwell_count': len(dwells),
+        'dwell_seconds': float(sum(dwells)),
+        'longest_dwell_seconds': float(max(dwells, default=0))
+    }
+
+
+def build_meeting_rollups(current_class, window, rollup_settings=None):
+    """
+        Function Summary: This function is used to compute the MovementRollup of every Student enrolled in a Class for one meeting. The Positions of all of the Students are read in one query, and any rollups already stored for the meeting are replaced.
+
+        Args:
+            current_class -- The Class object
+            window -- A (date, start datetime, end datetime) tuple from 'Class.get_meeting_windows()'
+            rollup_settings -- The rollup configuration, or None for 'get_rollup_settings()'
+
+        Return:
+            Type: int
+            Data: The number of MovementRollup objects stored
+    """
+    rollup_settings = rollup_settings or get_rollup_settings()
+    meeting_date, start_time, end_time = window
+
+    student_ids = list(ClassEnrollment.objects.filter(class_enrolled=current_class).values_list('student_id', flat=True))
+    if len(student_ids) == 0:
+        return 0
+
+    rows = Position.objects.filter(student_id__in=student_ids, timestamp__gte=start_time, timestamp__lte=end_time) \
+        .order_by('student_id', 'timestamp').values_list('student_id', 'timestamp', 'x', 'y')
+
+    # Students without any Positions still get a rollup, so the meeting is not read from the raw Positions again.
+    rows_by_student = {x: [] for x in student_ids}
+    for student_id, student_rows in itertools.groupby(rows.iterator(), key=lambda x: x[0]):
+        rows_by_student[student_id] = [x[1:] for x in student_rows]
+
+    rollups = [MovementRollup(student_id=student_id, associated_class=current_class, meeting_date=meeting_date,
+                              **summarize_path(student_rows, rollup_settings['DWELL_RADIUS'], rollup_settings['DWELL_MIN_SECONDS']))
+               for student_id, student_rows in rows_by_student.items()]
+
+    with transaction.atomic():
+        MovementRollup.objects.filter(associated_class=current_class, meeting_date=meeting_date).delete()
+        MovementRollup.objects.bulk_create(rollups)
+
+    return len(rollups)
+
+
+def rollup_finished_meetings(now=None):
+    """
+        Function Summary: This function is used to fill in the MovementRollup objects of every Class meeting that ended at least DELAY_MINUTES ago, going back LOOKBACK_DAYS. Meetings that already have rollups are skipped, so running it again only does the new meetings.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of meetings rolled up
+    """
+    rollup_settings = get_rollup_settings()
+    now = now or datetime.datetime.now()
+    # Wait a while after each meeting ends so Positions sent late by the clients are included.
+    cutoff = now - datetime.timedelta(minutes=rollup_settings['DELAY_MINUTES'])
+    start_date = cutoff.date() - datetime.timedelta(days=rollup_settings['LOOKBACK_DAYS'])
+
+    done = set(MovementRollup.objects.filter(meeting_date__gte=start_date)
+               .values_list('associated_class_id', 'meeting_date').distinct())
+
+    meetings = 0
+    for current_class in Class.objects.prefetch_related('days_of_the_week'):
+        for window in current_class.get_meeting_windows(start_date, cutoff.date()):
+            if window[2] > cutoff or (current_class.id, window[0]) in done:
+                continue
+
+            build_meeting_rollups(current_class, window, rollup_settings)
+            meetings += 1
+
+    return meetings
+
+
+def late_meetings(student_id, timestamps, now=None):
+    """
+        Function Summary: This function is used to find the Class meetings of a Student that Positions sent with the given times fall in, out of the meetings that ended at least DELAY_MINUTES ago. Anything already computed from those meetings is missing the Positions.
+
+        Args:
+            student_id -- The ID of the Student
+            timestamps -- The times of the Positions
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: list
+            Data: A list of (Class, date) tuples, one for each meeting
+    """
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(minutes=get_rollup_settings()['DELAY_MINUTES'])
+
+    # Positions sent on time are the usual case, and need no queries.
+    late = [x for x in timestamps if x < cutoff]
+    if len(late) == 0:
+        return []
+
+    dates = sorted(set(x.date() for x in late))
+    meetings = []
+    for current_class in Class.objects.filter(classenrollment__student_id=student_id).prefetch_related('days_of_the_week'):
+        for meeting_date in dates:
+            for window in current_class.get_meeting_windows(meeting_date, meeting_date):
+                if window[2] <= cutoff and any(window[1] <= x <= window[2] for x in late):
+                    meetings.append((current_class, window[0]))
+
+    return meetings
+
+
+def forget_meeting_rollups(meetings):
+    """
+        Function Summary: This function is used to delete the MovementRollup objects of Class meetings, so the workers roll them up again with the Positions that were sent late. Until then their summaries are computed from the raw Positions.
+
+        Args:
+            meetings -- A list of (Class, date) tuples as returned by 'late_meetings()'
+
+        Return:
+            Type: None
+    """
+    for current_class, meeting_date in meetings:
+        MovementRollup.objects.filter(associated_class=current_class, meeting_date=meeting_date).delete()
+
+
+def meeting_summaries(current_class, student_id, start_date, end_date):
+    """
+        Function Summary: This function is used to get the movement statistics of a Student for every Class meeting between two dates. Meetings with a MovementRollup are read from it and the rest are computed from the raw Positions in a single query.
+
+        Args:
+            current_class -- The Class object
+            student_id -- The ID of the Student
+            start_date -- The first date to include
+            end_date -- The last date to include
+
+        Return:
+            Type: dict
+            Data: A dictionary keyed by the date of each meeting. Each value has the fields in ROLLUP_FIELDS and a 'source' of 'rollup' or 'raw'
+    """
+    windows = current_class.get_meeting_windows(start_date, end_date)
+    rollups = MovementRollup.objects.filter(student_id=student_id, associated_class=current_class,
+                                            meeting_date__gte=start_date, meeting_date__lte=end_date)
+
+    summary = {}
+    for rollup in rollups:
+        summary[str(rollup.meeting_date)] = {field: getattr(rollup, field) for field in ROLLUP_FIELDS}
+        summary[str(rollup.meeting_date)]['source'] = 'rollup'
+
+    missing = [x for x in windows if str(x[0]) not in summary]
+    if len(missing) != 0:
+        rollup_settings = get_rollup_settings()
+        rows = list(Position.objects.in_time_range(student_id, missing[0][1], missing[-1][2]).values_list('timestamp', 'x', 'y'))
+        timestamps = [x[0] for x in rows]
+
+        for meeting_date, start_time, end_time in missing:
+            meeting_rows = rows[bisect.bisect_left(timestamps, start_time):bisect.bisect_right(timestamps, end_time)]
+            summary[str(meeting_date)] = summarize_path(meeting_rows, rollup_settings['DWELL_RADIUS'], rollup_settings['DWELL_MIN_SECONDS'])
+            summary[str(meeting_date)]['source'] = 'raw'
+
+    return summary
@@ -0,0 +1,353 @@
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.analytics.movement import group_percentiles
+from api.app_settings import get_app_settings
+from api.models import Demographic, Survey, SurveyQuestion, SurveyResponse
+
+from operator import itemgetter
+import functools
+import numpy as np
+
+# The default configuration of the survey analytics. These can be overridden with SURVEY_ANALYTICS in settings.py.
+DEFAULT_SURVEY_ANALYTICS_SETTINGS = {
+    'PERCENTILES': [10, 25, 75, 90],
+    'HISTOGRAM_BINS': 10,
+    'CACHE_ALIAS': 'default',
+    'CACHE_TIMEOUT': 24 * 60 * 60
+}
+
+# The prefix of the keys the analytics of each Survey are cached under.
+SURVEY_ANALYTICS_CACHE_KEY_PREFIX = 'icba-survey-analytics:'
+
+# The Demographic fields results are broken down by, and the lookup table that names each value if there is one.
+DEMOGRAPHIC_ATTRIBUTES = [
+    ('gender', 'gender__name'),
+    ('grade_year', 'grade_year__name'),
+    ('ethnicity', 'ethnicity__name'),
+    ('race', 'race__name'),
+    ('age', None),
+    ('major', None)
+]
+
+
+get_survey_analytics_settings = functools.partial(get_app_settings, 'SURVEY_ANALYTICS', DEFAULT_SURVEY_ANALYTICS_SETTINGS)
+
+
+def parse_range_responses(texts):
+    """
+        Function Summary: This function is used to turn the text of Range responses into numbers. All of the responses are converted at once, and only when one of them is not a number are they converted one at a time.
+
+        Args:
+            texts -- A list of response strings
+
+        Return:
+            Type: numpy.ndarray
+            Data: The number of each response, or NaN for responses that are not a finite number
+    """
+    if len(texts) == 0:
+        return np.empty(0)
+
+    try:
+        values = np.fromiter(map(float, texts), dtype=np.float64, count=len(texts))
+    except ValueError:
+        values = np.empty(len(texts))
+        for i, text in enumerate(texts):
+            try:
+                values[i] = float(text)
+            except ValueError:
+                values[i] = np.nan
+
+    values[~np.isfinite(values)] = np.nan
+    return values
+
+
+def load_range_responses(survey, question_ids):
+    """
+        Function Summary: This function is used to read every response to the Range questions of a Survey, with the question, date, and Student it belongs to. The date and Student of each response are read in the same query as the response, so a SurveyInstance made while the analytics are read cannot mix them up.
+
+        Args:
+            survey -- The Survey object
+            question_ids -- The IDs of the Range questions of the Survey
+
+        Return:
+            Type: dict
+            Data: A dictionary of numpy arrays with one item per response: the 'questions' IDs, the 'dates' the SurveyInstance was generated on, the 'students' IDs, and the 'values' parsed by 'parse_range_responses()'
+    """
+    rows = list(SurveyResponse.objects.filter(survey_entry__surveyquestioninstance__question_id__in=question_ids)
+                .values_list('survey_entry__surveyquestioninstance__question_id', 'survey_entry__survey_instance__date_generated',
+                             'survey_entry__survey_instance__student_id', 'response'))
+
+    if len(rows) == 0:
+        return {'questions': np.empty(0, dtype=np.int64), 'dates': np.empty(0, dtype='datetime64[D]'),
+                'students': np.empty(0, dtype=np.int64), 'values': np.empty(0)}
+
+    return {'questions': np.fromiter(map(itemgetter(0), rows), dtype=np.int64, count=len(rows)),
+            'dates': np.array(list(map(itemgetter(1), rows)), dtype='datetime64[D]'),
+            'students': np.fromiter(map(itemgetter(2), rows), dtype=np.int64, count=len(rows)),
+            'values': parse_range_responses(list(map(itemgetter(3), rows)))}
+
+
+def histogram(values, bins):
+    """
+        Function Summary: This function is used to count the values in equal width bins between the smallest and largest value. Whole number answers on a scale no wider than 'bins' get one bin per answer instead.
+
+        Args:
+            values -- The values, without NaN
+            bins -- The most bins to use
+
+        Return:
+            Type: dict
+            Data: A dictionary with the bin 'edges' and the 'counts' in each bin
+    """
+    low, high = float(values.min()), float(values.max())
+
+    if np.all(values == np.round(values)) and high - low + 1 <= bins:
+        counts = np.bincount((values - low).astype(np.int64), minlength=int(high - low) + 1)
+        edges = np.arange(low - 0.5, high + 1)
+    else:
+        counts, edges = np.histogram(values, bins=bins, range=(low, high) if high > low else (low - 0.5, low + 0.5))
+
+    return {'edges': [float(x) for x in edges], 'counts': [int(x) for x in counts]}
+
+
+def group_summaries(sorted_values, groups, labels):
+    """
+        Function Summary: This function is used to get the count, mean, and median of the values in every group at once, such as every date or every value of a Demographic attribute.
+
+        Args:
+            sorted_values -- The values, without NaN, sorted from smallest to largest
+            groups -- The group code of each value, an index into 'labels'
+            labels -- The JSON friendly name of each group
+
+        Return:
+            Type: list
+            Data: A dictionary for each group with values, with its 'value', 'count', 'mean', and 'median', ordered by code
+    """
+    counts = np.bincount(groups, minlength=len(labels))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.bincount(groups, weights=sorted_values, minlength=len(labels)) / counts
+
+    # A stable sort by group keeps the values of each group in order, as 'group_percentiles()' needs.
+    medians = group_percentiles(sorted_values[np.argsort(groups, kind='mergesort')], counts, 50)
+
+    return [{'value': label, 'count': int(count), 'mean': float(mean), 'median': float(median)}
+            for label, count, mean, median in zip(labels, counts, means, medians) if count > 0]
+
+
+def load_demographics(student_ids):
+    """
+        Function Summary: This function is used to get the value of every Demographic attribute of a list of Students, in one query. Each attribute is returned as a small code for every Student, so responses can be grouped by it with integer operations.
+
+        Args:
+            student_ids -- A sorted numpy array of Student IDs
+
+        Return:
+            Type: dict
+            Data: A dictionary of attribute name to a tuple of (labels, codes), where 'codes' has the index into 'labels' of each Student. Students without a Demographic get the label None
+    """
+    fields = [x[1] or x[0] for x in DEMOGRAPHIC_ATTRIBUTES]
+    found = {x[0]: x[1:] for x in Demographic.objects.filter(student_id__in=student_ids.tolist())
+             .values_list('student_id', *fields)}
+
+    missing = ('',) * len(fields)
+    rows = [found.get(x, missing) for x in student_ids.tolist()]
+
+    demographics = {}
+    for i, (name, field) in enumerate(DEMOGRAPHIC_ATTRIBUTES):
+        labels, codes = np.unique(np.array([str(x[i]) for x in rows], dtype=str), return_inverse=True)
+        demographics[name] = ([str(x) or None for x in labels], codes)
+
+    return demographics
+
+
+def range_question_analytics(responses, questions, analytics_settings):
+    """
+        Function Summary: This function is used to compute the statistics of every Range question from the responses read by 'load_range_responses()'. Responses are sorted by question and then by value once, so each question works on its own sorted slice.
+
+        Args:
+            responses -- The dictionary of arrays from 'load_range_responses()'
+            questions -- A list of the (ID, prompt) of each Range question of the Survey
+            analytics_settings -- The survey analytics configuration
+
+        Return:
+            Type: list
+            Data: A dictionary for each question with its statistics, histogram, trend over the dates, and breakdown by Demographic attributes
+    """
+    invalid_counts = dict(zip(*np.unique(responses['questions'][np.isnan(responses['values'])], return_counts=True)))
+
+    valid = ~np.isnan(responses['values'])
+    order = np.lexsort((responses['values'][valid], responses['questions'][valid]))
+    question_ids = responses['questions'][valid][order]
+    values = responses['values'][valid][order]
+
+    date_labels, date_codes = np.unique(responses['dates'][valid][order], return_inverse=True)
+    date_labels = [str(x) for x in date_labels]
+
+    student_ids, student_codes = np.unique(responses['students'][valid][order], return_inverse=True)
+    demographics = load_demographics(student_ids)
+
+    results = []
+    for question_id, prompt in questions:
+        low, high = np.searchsorted(question_ids, [question_id, question_id + 1])
+        question_values = values[low:high]
+
+        result = {'question': question_id, 'prompt': prompt, 'count': int(high - low),
+                  'invalid': int(invalid_counts.get(question_id, 0))}
+
+        if len(question_values) == 0:
+            result.update({'mean': None, 'median': None, 'std': None, 'min': None, 'max': None, 'percentiles': {},
+                           'histogram': {'edges': [], 'counts': []}, 'trend': [],
+                           'demographics': {name: [] for name, field in DEMOGRAPHIC_ATTRIBUTES}})
+            results.append(result)
+            continue
+
+        # The values are already sorted, so the percentiles are read straight from them as one group.
+        counts = np.array([len(question_values)])
+        question_students = student_codes[low:high]
+
+        result.update({
+            'mean': float(question_values.mean()),
+            'median': float(group_percentiles(question_values, counts, 50)[0]),
+            'std': float(question_values.std()),
+            'min': float(question_values[0]),
+            'max': float(question_values[-1]),
+            'percentiles': {str(x): float(group_percentiles(question_values, counts, x)[0])
+                            for x in analytics_settings['PERCENTILES']},
+            'histogram': histogram(question_values, analytics_settings['HISTOGRAM_BINS']),
+            'trend': group_summaries(question_values, date_codes[low:high], date_labels),
+            'demographics': {name: group_summaries(question_values, demographics[name][1][question_students],
+                                                   demographics[name][0]) for name, field in DEMOGRAPHIC_ATTRIBUTES}
+        })
+        results.append(result)
+
+    return results
+
+
+def compute_survey_analytics(survey, analytics_settings=None):
+    """
+        Function Summary: This function is used to compute the analytics of every Range question of a Survey without the cache.
+
+        Args:
+            survey -- The Survey object
+            analytics_settings -- The survey analytics configuration, or None for 'get_survey_analytics_settings()'
+
+        Return:
+            Type: dict
+            Data: A dictionary with the 'survey' ID, the number of 'responses', and the analytics of each of the 'questions'
+    """
+    analytics_settings = analytics_settings or get_survey_analytics_settings()
+    questions = list(SurveyQuestion.objects.filter(survey=survey, type='RA').order_by('id').values_list('id', 'prompt_text'))
+    responses = load_range_responses(survey, [x[0] for x in questions])
+
+    return {'survey': survey.id, 'responses': len(responses['values']),
+            'questions': range_question_analytics(responses, questions, analytics_settings)}
+
+
+def get_cache_key(survey_id, version, analytics_settings):
+    """
+        Function Summary: This function is used to get the key the analytics of a Survey are cached under. The key changes with the 'analytics_version' of the Survey and the settings the analytics are computed with.
+
+        Args:
+            survey_id -- The ID of the Survey
+            version -- The 'analytics_version' of the Survey
+            analytics_settings -- The survey analytics configuration
+
+        Return:
+            Type: str
+            Data: The cache key
+    """
+    return '%s%d:%d:%s:%s' % (SURVEY_ANALYTICS_CACHE_KEY_PREFIX, survey_id, version,
+                              ','.join(str(x) for x in analytics_settings['PERCENTILES']), analytics_settings['HISTOGRAM_BINS'])
+
+
+def survey_range_analytics(survey):
+    """
+        Function Summary: This function is used to get the analytics of every Range question of a Survey. Results are cached under the 'analytics_version' of the Survey, which is read from the database on every call, so a result is stale in every process as soon as a response, question, or Demographic of the Survey changes.
+
+        Args:
+            survey -- The Survey object
+
+        Return:
+            Type: dict
+            Data: The analytics as returned by 'compute_survey_analytics()'
+    """
+    analytics_settings = get_survey_analytics_settings()
+    cache = caches[analytics_settings['CACHE_ALIAS']]
+
+    # The version is read before the responses, so results computed while a response is saved are stored under the old
+    # version and never read again.
+    version = Survey.objects.filter(id=survey.id).values_list('analytics_version', flat=True).first() or 0
+    key = get_cache_key(survey.id, version, analytics_settings)
+
+    analytics = cache.get(key)
+    if analytics is None:
+        analytics = compute_survey_analytics(survey, analytics_settings)
+        cache.set(key, analytics, analytics_settings['CACHE_TIMEOUT'])
+
+    return analytics
+
+
+def invalidate_survey_analytics(survey_id):
+    """
+        Function Summary: This function is used to make the cached analytics of a Survey stale, such as when new responses are saved.
+
+        Args:
+            survey_id -- The ID of the Survey
+
+        Return:
+            Type: None
+    """
+    Survey.objects.filter(id=survey_id).update(analytics_version=F('analytics_version') + 1)
+
+
+# Deleted SurveyResponse objects are not listened for, since a listener would make Django delete the responses of a
+# Survey one at a time.
+@receiver(post_save, sender=SurveyResponse)
+def invalidate_changed_response(sender, instance, **kwargs):
+    """
+        Function Summary: This function makes the cached analytics of a Survey stale when one of its SurveyResponse objects is saved on its own, such as from the admin site. Responses saved in bulk are invalidated by 'save_survey_responses()'.
+
+        Args:
+            sender -- The SurveyResponse model
+            instance -- The saved SurveyResponse object
+
+        Return:
+            Type: None
+    """
+    Survey.objects.filter(surveyinstance__surveyentryinstance=instance.survey_entry_id) \
+        .update(analytics_version=F('analytics_version') + 1)
+
+
+@receiver(post_save, sender=SurveyQuestion)
+@receiver(post_delete, sender=SurveyQuestion)
+def invalidate_changed_question(sender, instance, **kwargs):
+    """
+        Function Summary: This function makes the cached analytics of a Survey stale when one of its questions is saved or deleted, since the type or prompt of the question may have changed.
+
+        Args:
+            sender -- The SurveyQuestion model
+            instance -- The saved or deleted SurveyQuestion object
+
+        Return:
+            Type: None
+    """
+    invalidate_survey_analytics(instance.survey_id)
+
+
+@receiver(post_save, sender=Demographic)
+@receiver(post_delete, sender=Demographic)
+def invalidate_changed_demographic(sender, instance, **kwargs):
+    """
+        Function Summary: This function makes the cached analytics of every Survey a Student has a SurveyInstance of stale when their Demographic is saved or deleted, since the results are broken down by it.
+
+        Args:
+            sender -- The Demographic model
+            instance -- The saved or deleted Demographic object
+
+        Return:
+            Type: None
+    """
+    Survey.objects.filter(surveyinstance__student_id=instance.student_id).update(analytics_version=F('analytics_version') + 1)
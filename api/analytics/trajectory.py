@@ -0,0 +1,134 @@
+import numpy as np
+
+
+def positions_to_arrays(rows):
+    """
+        Function Summary: This function is used to turn Position rows from 'values_list('timestamp', 'x', 'y')' into NumPy arrays.
+
+        Args:
+            rows -- A list of (timestamp, x, y) tuples ordered by timestamp
+
+        Return:
+            Type: tuple
+            Data: A tuple of (times, points). 'times' holds the timestamps as seconds and 'points' is an (n, 2) array of the x and y positions
+    """
+    if len(rows) == 0:
+        return np.empty(0), np.empty((0, 2))
+
+    timestamps, xs, ys = zip(*rows)
+    times = np.array(timestamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+    points = np.column_stack((np.array(xs, dtype=float), np.array(ys, dtype=float)))
+
+    return times, points
+
+
+def segment_distances(points, start, end):
+    """
+        Function Summary: This function is used to get the distance of every point to the line through 'start' and 'end'.
+
+        Args:
+            points -- An (n, 2) array of points
+            start -- The first point of the line
+            end -- The last point of the line
+
+        Return:
+            Type: numpy.ndarray
+            Data: The distance of each point to the line, or to 'start' if 'start' and 'end' are the same point
+    """
+    direction = end - start
+    length = np.hypot(direction[0], direction[1])
+    offsets = points - start
+
+    if length == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+
+    return np.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+
+
+def simplify_rdp(points, tolerance):
+    """
+        Function Summary: This function is used to simplify a path with the Ramer-Douglas-Peucker algorithm. Points that are closer than 'tolerance' to the simplified path are dropped, which removes the jitter of a Student sitting in one place.
+
+        Args:
+            points -- An (n, 2) array of the points of the path, in order
+            tolerance -- The largest distance a dropped point may be from the simplified path
+
+        Return:
+            Type: numpy.ndarray
+            Data: The indexes of the points that are kept, in order. The first and last points are always kept
+    """
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Split segments with a stack instead of recursion so long sessions can not hit the recursion limit.
+    segments = [(0, count - 1)]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2:
+            continue
+
+        distances = segment_distances(points[start + 1:end], points[start], points[end])
+        farthest = int(np.argmax(distances))
+
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            segments.append((start, split))
+            segments.append((split, end))
+
+    return np.flatnonzero(keep)
+
+
+def decimate_by_time(times, max_points):
+    """
+        Function Summary: This function is used to cap the number of points in a path. The time covered by the path is split into 'max_points' equal buckets and the first point of each bucket is kept.
+
+        Args:
+            times -- The times of the points in seconds, in order
+            max_points -- The most points to keep
+
+        Return:
+            Type: numpy.ndarray
+            Data: The indexes of the points that are kept, in order
+    """
+    count = len(times)
+    if count <= max_points:
+        return np.arange(count)
+
+    span = times[-1] - times[0]
+    if span <= 0:
+        return np.unique(np.linspace(0, count - 1, max_points).astype(np.int64))
+
+    buckets = np.minimum(((times - times[0]) / span * max_points).astype(np.int64), max_points - 1)
+    unused, first_indexes = np.unique(buckets, return_index=True)
+
+    return first_indexes
+
+
+def simplify_trajectory(rows, tolerance=None, max_points=None):
+    """
+        Function Summary: This function is used to reduce the number of Positions in a path before it is sent to a client. The path is simplified with 'tolerance' first and then capped at 'max_points'.
+
+        Args:
+            rows -- A list of Position rows ordered by timestamp. The timestamp, x, and y must be the last three values of each row
+            tolerance -- The Ramer-Douglas-Peucker tolerance, or None to skip simplification
+            max_points -- The most rows to return, or None for no cap
+
+        Return:
+            Type: list
+            Data: The rows that are kept, in order
+    """
+    times, points = positions_to_arrays([row[-3:] for row in rows])
+    indexes = np.arange(len(rows))
+
+    if tolerance is not None:
+        indexes = simplify_rdp(points, tolerance)
+
+    if max_points is not None:
+        indexes = indexes[decimate_by_time(times[indexes], max_points)]
+
+    return [rows[i] for i in indexes]
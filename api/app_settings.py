@@ -0,0 +1,18 @@
+from django.conf import settings
+
+
+def get_app_settings(name, defaults):
+    """
+        Function Summary: This function gets a configuration block of settings.py, such as MOVEMENT_ROLLUP. The defaults are only kept in the module that uses the block, and settings.py only needs to list the values it changes.
+
+        Args:
+            name -- The name of the block in settings.py
+            defaults -- The value of every key the block may leave out
+
+        Return:
+            Type: dict
+            Data: The defaults updated with the block from settings.py
+    """
+    app_settings = dict(defaults)
+    app_settings.update(getattr(settings, name, {}))
+    return app_settings
@@ -2,18 +2,19 @@ from .models import Student, Session
 from django.contrib.auth.models import User
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.contrib.auth.password_validation import validate_password, ValidationError
+from django.utils.functional import SimpleLazyObject
 
+import functools
 import random
 import string
 import datetime
 
 from workers import task
 
+from api.outbox import queue_email
 from api.response_functions import Response
+from api.session_cache import get_session_cache
 
 AUTH_ERRORS = {
     100: 'No session_id in parameters of url',
@@ -33,7 +34,7 @@ AUTH_ERRORS = {
 
 def get_user_logged_in(request):
     """
-        Function Summary: This will get whether a user is logged in or not.
+        Function Summary: This will get whether a user is logged in or not. The Session is looked up through the Session cache.
 
         Args:
             request -- The request object containing the 'session_id' in GET parameters
@@ -47,12 +48,7 @@ def get_user_logged_in(request):
     else:
         return False
 
-    try:
-        Session.objects.get(id=session_id)
-    except Session.DoesNotExist:
-        return False
-
-    return True
+    return get_session_cache().resolve(session_id) is not None
 
 
 def get_user_by_session(session_id):
@@ -66,7 +62,69 @@ def get_user_by_session(session_id):
             Type: User
             Data: The User object that is connected to the 'session_id'
         """
-    return Session.objects.get(id=session_id).user
+    user_id, student_id = get_session_cache().resolve(session_id)
+    return User.objects.get(id=user_id)
+
+
+def attach_session_student(request):
+    """
+        Function Summary: This will resolve the 'session_id' in the GET parameters once per request and attach the result to the request as 'session_user_id', 'student_id', and 'student'. The Student and its User are only loaded, with a single joined query, when 'request.student' is first used.
+
+        Args:
+            request -- The request object containing the 'session_id' in GET parameters
+
+        Return:
+            Type: boolean
+            Data: True if the 'session_id' belongs to a logged in Student, False otherwise
+    """
+    # The Student has already been resolved for this request by the middleware or another decorator.
+    if hasattr(request, 'student_id'):
+        return request.student_id is not None
+
+    entry = None
+    if 'session_id' in request.GET:
+        entry = get_session_cache().resolve(request.GET['session_id'])
+
+    user_id, student_id = entry if entry is not None else (None, None)
+
+    request.session_user_id = user_id
+    request.student_id = student_id
+    request.student = None
+
+    if student_id is not None:
+        request.student = SimpleLazyObject(lambda: Student.objects.select_related('user').get(id=student_id))
+
+    return student_id is not None
+
+
+def student_login_required(request_method, errors, method_error_id, login_error_id):
+    """
+        Function Summary: This decorator checks the request method and that a Student is logged in before running a view. The view can then use 'request.student_id' and 'request.student' instead of looking up the Session itself.
+
+        Args:
+            request_method -- The request method the view accepts, such as "GET" or "POST"
+            errors -- The error dictionary of the view
+            method_error_id -- The error ID returned when the wrong request method is used
+            login_error_id -- The error ID returned when no Student is logged in
+
+        Return:
+            Type: function
+            Data: The decorated view
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Ensure the API call is using the right request method.
+            if request.method != request_method:
+                return JsonResponse(Response.get_error_status(method_error_id, errors))
+
+            # Ensure that a Student is logged in.
+            if not attach_session_student(request):
+                return JsonResponse(Response.get_error_status(login_error_id, errors))
+
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
 
 
 def is_user_session_valid(session_id):
@@ -232,15 +290,9 @@ def register(request):
     new_student = Student.objects.create(user=new_user)
     new_student.save()
 
-    # Render the email template
-    email_html = render_to_string('welcome_email.html',
-                                  {'user': {'first_name': new_user.first_name, 'last_name': new_user.last_name}})
-    text_content = strip_tags(email_html)
-
-    # Send the email to the user's email
-    email = EmailMultiAlternatives('Welcome to ICBA!', text_content, 'ICBA-NO-REPLY', [new_user.email])
-    email.attach_alternative(email_html, 'text/html')
-    email.send()
+    # Queue the welcome email to the user's email
+    queue_email('Welcome to ICBA!', 'welcome_email.html',
+                {'user': {'first_name': new_user.first_name, 'last_name': new_user.last_name}}, new_user.email)
 
     return JsonResponse(Response.get_success_status())
 
@@ -290,7 +342,7 @@ def logout(request):
 @csrf_exempt
 def request_password_reset(request, username):
     """
-        Function Summary: This function is used to request a password reset for a User. The user will receive an email containing a reset code if successful. This is only to be used for resetting Student passwords. The reset code is only active for one hour.
+        Function Summary: This function is used to request a password reset for a User. The user will receive an email containing a reset code if successful, sent by the email outbox after the response. This is only to be used for resetting Student passwords. The reset code is only active for one hour.
         Path: '/api/auth/request_password_reset/<USERNAME>'
         Request Type: GET
         Required Login: False
@@ -331,14 +383,8 @@ def request_password_reset(request, username):
     # Schedule the removal of the reset code after 1 hour
     expire_reset_code(str(student_account.id), _schedule=datetime.datetime.now() + datetime.timedelta(hours=1))
 
-    # Render the email template
-    email_html = render_to_string('reset_code_email.html', {'user': {'first_name': user_account.first_name, 'last_name': user_account.last_name}, 'reset_code': reset_code})
-    text_content = strip_tags(email_html)
-
-    # Send the email to the user's email
-    email = EmailMultiAlternatives('ICBA - Reset Code', text_content, 'ICBA-NO-REPLY', [user_account.email])
-    email.attach_alternative(email_html, 'text/html')
-    email.send()
+    # Queue the reset code email to the user's email
+    queue_email('ICBA - Reset Code', 'reset_code_email.html', {'user': {'first_name': user_account.first_name, 'last_name': user_account.last_name}, 'reset_code': reset_code}, user_account.email)
 
     return JsonResponse(Response.get_success_status())
 
@@ -388,13 +434,9 @@ def reset_password(request, reset_code):
     student_account.user.save()
     student_account.save()
 
-    # Send the user a notification email
-    email_html = render_to_string('reset_password_notification_email.html',
-                                  {'user': {'first_name': student_account.user.first_name, 'last_name': student_account.user.last_name}})
-    text_content = strip_tags(email_html)
-
-    email = EmailMultiAlternatives('ICBA - Password Changed', text_content, 'ICBA-NO-REPLY', [student_account.user.email])
-    email.attach_alternative(email_html, 'text/html')
-    email.send()
+    # Queue a notification email to the user
+    queue_email('ICBA - Password Changed', 'reset_password_notification_email.html',
+                {'user': {'first_name': student_account.user.first_name, 'last_name': student_account.user.last_name}},
+                student_account.user.email)
 
     return JsonResponse(Response.get_success_status())
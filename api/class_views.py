@@ -1,11 +1,15 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from api.auth_views import get_user_logged_in, get_user_by_session
+from api.analytics.attendance import student_attendance
+from api.analytics.rollup import meeting_summaries
+from api.auth_views import student_login_required
 from api.models import *
 
 from api.response_functions import Response
 
+import datetime
+
 CLASS_ERRORS = {
     400: 'No logged in user',
     401: 'Wrong request type',
@@ -15,11 +19,61 @@ CLASS_ERRORS = {
     405: 'No user with that username',
     406: 'No student with that id',
     407: 'Class does not exist',
-    408: 'Student already enrolled in Class'
+    408: 'Student already enrolled in Class',
+    409: 'Invalid date'
 }
 
+# The format of the start and end dates sent by the clients.
+CLASS_DATE_FORMAT = '%m/%d/%Y'
+
+
+def parse_date_range(data):
+    """
+        Function Summary: This function is used to parse the 'start_date' and 'end_date' of a request.
+
+        Args:
+            data -- The POST parameters of the request
+
+        Return:
+            Type: tuple
+            Data: A tuple of (start date, end date), or None if either date is not in CLASS_DATE_FORMAT
+    """
+    try:
+        return (datetime.datetime.strptime(data['start_date'], CLASS_DATE_FORMAT).date(),
+                datetime.datetime.strptime(data['end_date'], CLASS_DATE_FORMAT).date())
+    except ValueError:
+        return None
+
+
+def bucket_positions_by_meeting(positions, windows):
+    """
+        Function Summary: This function is used to match time ordered Positions to the Class meeting they fall in. Positions outside of every meeting are skipped.
+
+        Args:
+            positions -- An iterable of Position objects ordered by timestamp
+            windows -- A list of (date, start datetime, end datetime) tuples ordered by date
+
+        Return:
+            Type: generator
+            Data: (date, Position) tuples for every Position inside a meeting
+    """
+    window_index = 0
+
+    for position in positions:
+        # Move on to the next meeting once the Position is past the end of the current one.
+        while window_index < len(windows) and position.timestamp > windows[window_index][2]:
+            window_index += 1
+
+        if window_index == len(windows):
+            return
+
+        meeting_date, start_timestamp, end_timestamp = windows[window_index]
+        if position.timestamp >= start_timestamp:
+            yield meeting_date, position
+
 
 @csrf_exempt
+@student_login_required("GET", CLASS_ERRORS, 401, 400)
 def class_select_all(request):
     """
         Function Summary: This function is used to get all the Class objects of a Student.
@@ -40,26 +94,18 @@ def class_select_all(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(401, CLASS_ERRORS))
-
-    # Ensure the User is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(400, CLASS_ERRORS))
-
-    current_user = get_user_by_session(request.GET['session_id'])
-    current_student = Student.objects.get(user=current_user)
+    current_student_id = request.student_id
 
     # Return success status and all Class objects associated with Student.
     success_status = Response.get_success_status()
-    class_lookup = [x.class_enrolled for x in ClassEnrollment.objects.filter(student=current_student)]
+    class_lookup = Class.objects.filter(classenrollment__student_id=current_student_id).for_serialization()
     success_status['data'] = [x.to_dict() for x in class_lookup]
 
     return JsonResponse(success_status)
 
 
 @csrf_exempt
+@student_login_required("POST", CLASS_ERRORS, 401, 400)
 def class_summarize_movement(request):
     """
         Function Summary: This function is used to get all the Class objects of a Student
@@ -79,60 +125,143 @@ def class_summarize_movement(request):
             end_date -- The end date of the summary
 
         Possible Error Codes:
-            400, 401, 403, 407
+            400, 401, 403, 407, 409
 
         Return:
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using POST request.
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(401, CLASS_ERRORS))
-
-    # Ensure the User is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(400, CLASS_ERRORS))
-
     # Ensure POST parameters contain required data.
     if 'class' not in request.POST or 'start_date' not in request.POST or 'end_date' not in request.POST:
         return JsonResponse(Response.get_error_status(403, CLASS_ERRORS))
 
     # Lookup the Class objects. based on the Class ID.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
     class_lookup = Class.objects.filter(id=request.POST['class'])
 
     # Ensure the Class object exists.
     if len(class_lookup) == 0:
         return JsonResponse(Response.get_error_status(407, CLASS_ERRORS))
 
-    # Parse the start and end date into DateTime objects.
+    # Parse the start and end date into Date objects.
     current_class = class_lookup[0]
-    start_date = datetime.datetime.strptime(request.POST['start_date'], '%m/%d/%Y').date()
-    end_date = datetime.datetime.strptime(request.POST['end_date'], '%m/%d/%Y').date()
-    days_of_the_week = [x.id for x in current_class.days_of_the_week.all()]
-
-    summary = {}
-
-    # Go through each day between the start and end date.
-    for n in range((end_date - start_date).days + 1):
-        current_date = start_date + datetime.timedelta(days=n)
-        # Ensure that the date we are currently on is a day the class falls on.
-        if current_date.weekday() not in days_of_the_week:
-            continue
+    date_range = parse_date_range(request.POST)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(409, CLASS_ERRORS))
+    start_date, end_date = date_range
 
-        # Create start and end times to filter Position objects.
-        start_timestamp = datetime.datetime(year=current_date.year, month=current_date.month, day=current_date.day,
-                                            hour=current_class.start_time.hour, minute=current_class.start_time.minute)
+    # Get the start and end time of every Class meeting between the start and end date.
+    windows = current_class.get_meeting_windows(start_date, end_date)
+    summary = {str(x[0]): [] for x in windows}
 
-        end_timestamp = datetime.datetime(year=current_date.year, month=current_date.month, day=current_date.day,
-                                          hour=current_class.end_time.hour, minute=current_class.end_time.minute)
+    # Get all of the Student's positions for the whole date span in one query and sort them into the meetings.
+    if len(windows) != 0:
+        positions = Position.objects.in_time_range(current_student_id, windows[0][1], windows[-1][2])
 
-        # Get all positions that fall within the day, start time, and end time
-        positions = Position.objects.filter(student=current_student, timestamp__gte=start_timestamp, timestamp__lte=end_timestamp)
-        summary[str(current_date)] = [p.to_dict() for p in positions]
+        for meeting_date, position in bucket_positions_by_meeting(positions.iterator(), windows):
+            summary[str(meeting_date)].append(position.to_dict())
 
     # Return success status with movement summary.
     success_status = Response.get_success_status()
     success_status['data'] = summary
     return JsonResponse(success_status)
 
+
+@csrf_exempt
+@student_login_required("POST", CLASS_ERRORS, 401, 400)
+def class_meeting_summary(request):
+    """
+        Function Summary: This function is used to get the movement statistics of a Student for every Class meeting between two dates. Meetings that have been rolled up are read from their MovementRollup and the rest are computed from the raw Positions.
+        Path: '/api/class/meeting_summary'
+        Request Type: POST
+        Required Login: True
+
+        Args:
+            request -- The request made to the server by the client
+
+        Required GET Parameters:
+            session_id -- The Session ID of the logged in user
+
+        Required POST Parameters:
+            class -- The Class ID for the Class object
+            start_date -- The start date of the summary
+            end_date -- The end date of the summary
+
+        Possible Error Codes:
+            400, 401, 403, 407, 409
+
+        Return:
+            Type: JSON
+            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object keyed by the date of each meeting.
+    """
+    # Ensure POST parameters contain required data.
+    if 'class' not in request.POST or 'start_date' not in request.POST or 'end_date' not in request.POST:
+        return JsonResponse(Response.get_error_status(403, CLASS_ERRORS))
+
+    # Lookup the Class object based on the Class ID.
+    class_lookup = Class.objects.filter(id=request.POST['class'])
+
+    # Ensure the Class object exists.
+    if len(class_lookup) == 0:
+        return JsonResponse(Response.get_error_status(407, CLASS_ERRORS))
+
+    # Parse the start and end date into Date objects.
+    date_range = parse_date_range(request.POST)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(409, CLASS_ERRORS))
+    start_date, end_date = date_range
+
+    # Return success status with the statistics of each meeting.
+    success_status = Response.get_success_status()
+    success_status['data'] = meeting_summaries(class_lookup[0], request.student_id, start_date, end_date)
+    return JsonResponse(success_status)
+
+
+@csrf_exempt
+@student_login_required("POST", CLASS_ERRORS, 401, 400)
+def class_select_attendance(request):
+    """
+        Function Summary: This function is used to get the attendance of a Student at every finished Class meeting between two dates. A Student is present when enough of their Positions are inside of the meeting.
+        Path: '/api/class/attendance'
+        Request Type: POST
+        Required Login: True
+
+        Args:
+            request -- The request made to the server by the client
+
+        Required GET Parameters:
+            session_id -- The Session ID of the logged in user
+
+        Required POST Parameters:
+            class -- The Class ID for the Class object
+            start_date -- The start date of the attendance
+            end_date -- The end date of the attendance
+
+        Possible Error Codes:
+            400, 401, 403, 407, 409
+
+        Return:
+            Type: JSON
+            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON list with the attendance of each meeting.
+    """
+    # Ensure POST parameters contain required data.
+    if 'class' not in request.POST or 'start_date' not in request.POST or 'end_date' not in request.POST:
+        return JsonResponse(Response.get_error_status(403, CLASS_ERRORS))
+
+    # Lookup the Class object based on the Class ID.
+    class_lookup = Class.objects.filter(id=request.POST['class']).prefetch_related('days_of_the_week')
+
+    # Ensure the Class object exists.
+    if len(class_lookup) == 0:
+        return JsonResponse(Response.get_error_status(407, CLASS_ERRORS))
+
+    # Parse the start and end date into Date objects.
+    date_range = parse_date_range(request.POST)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(409, CLASS_ERRORS))
+    start_date, end_date = date_range
+
+    # Return success status with the attendance of each meeting.
+    success_status = Response.get_success_status()
+    success_status['data'] = [x.to_dict() for x in student_attendance(class_lookup[0], request.student_id, start_date, end_date)]
+    return JsonResponse(success_status)
@@ -1,7 +1,7 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from api.auth_views import get_user_logged_in, get_user_by_session
+from api.auth_views import student_login_required
 from api.models import *
 
 from api.response_functions import Response
@@ -18,6 +18,7 @@ DEMO_ERRORS = {
 
 
 @csrf_exempt
+@student_login_required("POST", DEMO_ERRORS, 201, 200)
 def demographic_create(request):
     """
         Function Summary: This function is used to create a new demographic object. A success status will be returned with the new Demographic object's information.
@@ -46,24 +47,16 @@ def demographic_create(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the request is using POST
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(201, DEMO_ERRORS))
-
-    # If the user is not logged in, return an error status
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(200, DEMO_ERRORS))
-
     # Get the logged in Student
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # If a Demographic object already exists, return an error status
-    if len(Demographic.objects.filter(student=current_student)) != 0:
+    if len(Demographic.objects.filter(student_id=current_student_id)) != 0:
         return JsonResponse(Response.get_error_status(204, DEMO_ERRORS))
 
     # Try to create a new demographic object. Error status will be returned in the data does not validate.
     try:
-        new_demographic = Demographic.objects.create(student=current_student,
+        new_demographic = Demographic.objects.create(student_id=current_student_id,
                                                      age=request.POST['age'],
                                                      gender=GenderLookup.objects.get(id=request.POST['gender']),
                                                      grade_year=GradeYearLookup.objects.get(id=request.POST['grade_year']),
@@ -93,6 +86,7 @@ def demographic_create(request):
 
 
 @csrf_exempt
+@student_login_required("POST", DEMO_ERRORS, 201, 200)
 def demographic_update(request):
     """
         Function Summary: This function is used to update an existing demographic object. A success status will be returned with the updated Demographic object's information.
@@ -121,20 +115,12 @@ def demographic_update(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using POST
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(201, DEMO_ERRORS))
-
-    # Ensure the user is logged in. Return an error status if the user is not logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(200, DEMO_ERRORS))
-
     # Get the logged in Student object
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # Try to get the Demographic object registered to the student. Return an error status if the user has not created a Demographic object yet.
     try:
-        demo_instance = Demographic.objects.get(student=current_student)
+        demo_instance = Demographic.objects.get(student_id=current_student_id)
 
     except Demographic.DoesNotExist:
         return JsonResponse(Response.get_error_status(206, DEMO_ERRORS))
@@ -183,6 +169,7 @@ def demographic_update(request):
 
 
 @csrf_exempt
+@student_login_required("GET", DEMO_ERRORS, 201, 200)
 def demographic_delete(request):
     """
         Function Summary: This function is used to delete a Demographic object.
@@ -203,20 +190,12 @@ def demographic_delete(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level.
     """
-    # Ensure the API call is using GET
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(201, DEMO_ERRORS))
-
-    # Ensure that the user is logged in
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(200, DEMO_ERRORS))
-
     # Get the Student object
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # Try to delete the Demographic object associated with the logged in Student object.
     try:
-        demo_instance = Demographic.objects.get(student=current_student)
+        demo_instance = Demographic.objects.get(student_id=current_student_id)
         demo_instance.delete()
         return JsonResponse(Response.get_success_status())
 
@@ -226,6 +205,7 @@ def demographic_delete(request):
 
 
 @csrf_exempt
+@student_login_required("GET", DEMO_ERRORS, 201, 200)
 def demographic_select(request):
     """
         Function Summary: This function is used to get a Student's Demographic information
@@ -246,20 +226,12 @@ def demographic_select(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(201, DEMO_ERRORS))
-
-    # Ensure the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(200, DEMO_ERRORS))
-
     # Get the currently logged in Student object.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # Get the Demographic object associated with the Student and return it.
     try:
-        demo_instance = Demographic.objects.get(student=current_student)
+        demo_instance = Demographic.objects.get(student_id=current_student_id)
         object_dict = demo_instance.to_dict()
         success_object = Response.get_success_status()
         success_object['data'] = object_dict
@@ -0,0 +1,142 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.analytics.movement import compute_movement_metrics, metrics_by_student, load_class_positions, get_metric_settings
+from api.models import Student, Position
+
+import datetime
+import numpy as np
+import time
+
+# The most rows written with one INSERT. SQLite limits how many rows a single statement can have.
+BATCH_SIZE = 500
+
+# The made up Positions are turned into objects this many at a time while they are written.
+WRITE_CHUNK_SIZE = 50000
+
+# The start of the first made up Class meeting.
+FIRST_MEETING = datetime.datetime(2019, 1, 14, 9, 0)
+
+
+def create_samples(student_count, meeting_count, sample_count, interval, seed=0):
+    """
+        Function Summary: This function creates made up Positions for a Class, ordered by Student and time. Each Student sits still with some jitter and sometimes walks to another seat.
+
+        Args:
+            student_count -- The number of Students
+            meeting_count -- The number of Class meetings
+            sample_count -- The number of samples of each Student in each meeting
+            interval -- The seconds between two samples
+
+        Return:
+            Type: tuple
+            Data: A tuple of (students, times, points, meetings) as taken by 'compute_movement_metrics()'
+    """
+    random = np.random.RandomState(seed)
+    per_student = meeting_count * sample_count
+
+    students = np.repeat(np.arange(student_count, dtype=np.int64), per_student)
+    meetings = np.tile(np.repeat(np.arange(meeting_count, dtype=np.int64), sample_count), student_count)
+    # The meetings are two days apart.
+    times = np.tile(meetings[:per_student] * 2 * 24 * 60 * 60 + np.tile(np.arange(sample_count), meeting_count) * interval,
+                    student_count).astype(float)
+
+    moves = random.normal(0, 0.02, (len(times), 2))
+    seat_changes = random.random_sample(len(times)) < 0.001
+    moves[seat_changes] += random.uniform(-5, 5, (int(seat_changes.sum()), 2))
+    points = 10 + np.cumsum(moves, axis=0)
+
+    return students, times, points, meetings
+
+
+def write_samples(students, times, points, meeting_count, sample_count, interval):
+    """
+        Function Summary: This function writes the samples from 'create_samples()' to the database as Positions of new Students.
+
+        Args:
+            students -- The index of the Student of each sample
+            times -- The times of the samples in seconds after FIRST_MEETING
+            points -- An (n, 2) array of the x and y positions of the samples
+            meeting_count -- The number of Class meetings
+            sample_count -- The number of samples of each Student in each meeting
+            interval -- The seconds between two samples
+
+        Return:
+            Type: tuple
+            Data: A tuple of (windows, student_ids) as taken by 'load_class_positions()'
+    """
+    users = User.objects.bulk_create([User(username='benchmark_student_%s_%d' % (time.time(), i)) for i in range(students.max() + 1)],
+                                     batch_size=BATCH_SIZE)
+    users = User.objects.filter(username__in=[x.username for x in users]).order_by('id')
+    Student.objects.bulk_create([Student(user=x) for x in users], batch_size=BATCH_SIZE)
+    student_ids = np.array(Student.objects.filter(user__in=users).order_by('user_id').values_list('id', flat=True), dtype=np.int64)
+
+    timestamps = np.datetime64(FIRST_MEETING, 'us') + (times * 1e6).astype('timedelta64[us]')
+    for i in range(0, len(times), WRITE_CHUNK_SIZE):
+        chunk = slice(i, i + WRITE_CHUNK_SIZE)
+        Position.objects.bulk_create([Position(student_id=int(a), timestamp=b, x=float(c[0]), y=float(c[1]))
+                                      for a, b, c in zip(student_ids[students[chunk]], timestamps[chunk].tolist(), points[chunk])],
+                                     batch_size=BATCH_SIZE)
+
+    windows = [(None, FIRST_MEETING + datetime.timedelta(days=2 * i),
+                FIRST_MEETING + datetime.timedelta(days=2 * i, seconds=sample_count * interval)) for i in range(meeting_count)]
+    return windows, student_ids.tolist()
+
+
+class Command(BaseCommand):
+    help = 'Time the movement metrics of a whole Class over a semester of made up Positions, one Student at a time against all ' \
+           'at once, and with the Positions read from the database. All data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='The number of Students in the Class')
+        parser.add_argument('--meetings', type=int, default=45, help='The number of Class meetings, about a semester')
+        parser.add_argument('--samples', type=int, default=900, help='The number of samples of each Student in each meeting')
+        parser.add_argument('--interval', type=float, default=5, help='The seconds between two samples')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of times to run each path')
+        parser.add_argument('--skip-database', action='store_true', help='Do not write the Positions and time reading them back')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['meetings'] < 1 or options['samples'] < 1 or options['repeat'] < 1:
+            raise CommandError('--students, --meetings, --samples, and --repeat must be at least 1')
+
+        students, times, points, meetings = create_samples(options['students'], options['meetings'], options['samples'],
+                                                           options['interval'])
+        metric_settings = get_metric_settings()
+        student_ids = np.arange(options['students'])
+
+        def all_at_once():
+            compute_movement_metrics(students, times, points, meetings, student_ids, metric_settings)
+
+        def by_student():
+            metrics_by_student(students, times, points, meetings, student_ids, metric_settings)
+
+        paths = [('all at once', all_at_once), ('by student', by_student)]
+        timings = {name: [] for name, path in paths}
+
+        with transaction.atomic():
+            if not options['skip_database']:
+                windows, database_ids = write_samples(students, times, points, options['meetings'], options['samples'],
+                                                      options['interval'])
+
+                def load_and_compute():
+                    metrics_by_student(*load_class_positions(windows, database_ids), database_ids, metric_settings)
+
+                paths.append(('read and by student', load_and_compute))
+                timings['read and by student'] = []
+
+            for i in range(options['repeat']):
+                for name, path in paths:
+                    start = time.perf_counter()
+                    path()
+                    timings[name].append(time.perf_counter() - start)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('%d students, %d meetings, %d samples, best of %d runs' %
+                          (options['students'], options['meetings'], len(times), options['repeat']))
+        for name, path in paths:
+            self.stdout.write('%s: %.1f ms (%.1f million samples per second)' %
+                              (name, min(timings[name]) * 1000, len(times) / min(timings[name]) / 1e6))
+
+        self.stdout.write(self.style.SUCCESS('by student is %.1fx faster' % (min(timings['all at once']) / min(timings['by student']))))
@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.analytics.survey import compute_survey_analytics, load_range_responses, survey_range_analytics
+from api.models import Class, Student, Survey, SurveyQuestion, SurveyInstance, SurveyEntryInstance, SurveyQuestionInstance, \
+    SurveyResponse
+from api.survey_generation import insert_entry_children
+
+import datetime
+import numpy as np
+import time
+
+# The most rows written with one INSERT. SQLite limits how many rows a single statement can have.
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Time the analytics of the Range questions of a Survey with made up responses. All data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500, help='The number of Students answering the Survey')
+        parser.add_argument('--meetings', type=int, default=40, help='The number of Class meetings with a SurveyInstance')
+        parser.add_argument('--questions', type=int, default=10, help='The number of Range questions in the Survey')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of times to run each path')
+
+    def handle(self, *args, **options):
+        if options['students'] < 1 or options['meetings'] < 1 or options['questions'] < 1 or options['repeat'] < 1:
+            raise CommandError('--students, --meetings, --questions, and --repeat must be at least 1')
+
+        with transaction.atomic():
+            survey = self.create_data(options['students'], options['meetings'], options['questions'])
+
+            question_ids = list(SurveyQuestion.objects.filter(survey=survey).values_list('id', flat=True))
+            paths = [('load', lambda: load_range_responses(survey, question_ids)),
+                     ('load and compute', lambda: compute_survey_analytics(survey)), ('cached', lambda: survey_range_analytics(survey))]
+            timings = {name: [] for name, path in paths}
+
+            for i in range(options['repeat']):
+                for name, path in paths:
+                    start = time.perf_counter()
+                    path()
+                    timings[name].append(time.perf_counter() - start)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('%d responses, best of %d runs' %
+                          (options['students'] * options['meetings'] * options['questions'], options['repeat']))
+        for name, path in paths:
+            self.stdout.write('%s: %.1f ms' % (name, min(timings[name]) * 1000))
+
+    @staticmethod
+    def create_data(student_count, meeting_count, question_count):
+        random = np.random.RandomState(0)
+        admin = User.objects.create(username='benchmark_admin_' + str(time.time()))
+        new_class = Class.objects.create(title='Benchmark ' + str(time.time()), admin=admin, section=1,
+                                         start_time=datetime.time(9), end_time=datetime.time(10))
+        survey = Survey.objects.create(admin=admin, associated_class=new_class)
+
+        users = User.objects.bulk_create([User(username='benchmark_student_%s_%d' % (time.time(), i)) for i in range(student_count)],
+                                      batch_size=BATCH_SIZE)
+        users = User.objects.filter(username__in=[x.username for x in users]).order_by('id')
+        Student.objects.bulk_create([Student(user=x) for x in users], batch_size=BATCH_SIZE)
+        student_ids = list(Student.objects.filter(user__in=users).values_list('id', flat=True))
+
+        SurveyQuestion.objects.bulk_create([SurveyQuestion(survey=survey, prompt_text='Question ' + str(i), type='RA')
+                                            for i in range(question_count)])
+        question_ids = list(SurveyQuestion.objects.filter(survey=survey).order_by('id').values_list('id', flat=True))
+
+        first_date = datetime.date(2019, 1, 14)
+        SurveyInstance.objects.bulk_create([SurveyInstance(survey=survey, student_id=x,
+                                                           date_generated=first_date + datetime.timedelta(days=2 * i))
+                                            for i in range(meeting_count) for x in student_ids], batch_size=BATCH_SIZE)
+        instance_ids = list(SurveyInstance.objects.filter(survey=survey).order_by('id').values_list('id', flat=True))
+
+        SurveyEntryInstance.objects.bulk_create([SurveyEntryInstance(survey_instance_id=x)
+                                                 for x in instance_ids for i in range(question_count)],
+                                                batch_size=BATCH_SIZE)
+        entry_ids = list(SurveyEntryInstance.objects.filter(survey_instance__survey=survey).order_by('id')
+                         .values_list('id', flat=True))
+        insert_entry_children(SurveyQuestionInstance, 'question', list(zip(entry_ids, question_ids * len(instance_ids))))
+
+        answers = random.randint(1, 6, len(entry_ids))
+        SurveyResponse.objects.bulk_create([SurveyResponse(survey_entry_id=x, response=str(y)) for x, y in zip(entry_ids, answers)],
+                                           batch_size=BATCH_SIZE)
+
+        return survey
@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Class, Student, Survey, SurveyQuestion, SurveyInstance, SurveyQuestionInstance, \
+    SurveyPositionInstance, Position
+from api.survey_generation import create_survey_instance
+
+import datetime
+import time
+
+
+def create_survey_instance_individually(survey, student_id, question_ids, position_ids):
+    """
+        Function Summary: This function creates a SurveyInstance the way 'end_session_create_survey_instance' did before bulk inserts, with two INSERTs per entry. It is only kept to benchmark against.
+
+        Args:
+            survey -- The Survey to create the SurveyInstance for
+            student_id -- The ID of the Student taking the Survey
+            question_ids -- The IDs of the SurveyQuestion objects to add
+            position_ids -- The IDs of the Position objects to add
+
+        Return:
+            Type: SurveyInstance
+            Data: The new SurveyInstance
+    """
+    survey_instance = SurveyInstance.objects.create(survey=survey, student_id=student_id)
+
+    for question_id in question_ids:
+        SurveyQuestionInstance.objects.create(survey_instance=survey_instance, question_id=question_id)
+
+    for position_id in position_ids:
+        SurveyPositionInstance.objects.create(survey_instance=survey_instance, position_id=position_id)
+
+    return survey_instance
+
+
+class Command(BaseCommand):
+    help = 'Time SurveyInstance generation with bulk inserts against one insert per entry. All data is rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--positions', type=int, default=4500, help='The number of positions in the class window')
+        parser.add_argument('--questions', type=int, default=10, help='The number of questions in the Survey')
+        parser.add_argument('--repeat', type=int, default=3, help='The number of times to run each path')
+
+    def handle(self, *args, **options):
+        if options['positions'] < 0 or options['questions'] < 0 or options['repeat'] < 1:
+            raise CommandError('--positions and --questions can not be negative and --repeat must be at least 1')
+
+        paths = [('individual', create_survey_instance_individually), ('bulk', create_survey_instance)]
+        timings = {name: [] for name, path in paths}
+
+        with transaction.atomic():
+            survey, student, question_ids, position_ids = self.create_data(options['questions'], options['positions'])
+
+            for i in range(options['repeat']):
+                for name, path in paths:
+                    # Run every path inside a savepoint that is rolled back, so each run starts from the same data.
+                    with transaction.atomic():
+                        start = time.perf_counter()
+                        path(survey, student.id, question_ids, position_ids)
+                        timings[name].append(time.perf_counter() - start)
+                        transaction.set_rollback(True)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('%d questions, %d positions, best of %d runs' % (len(question_ids), len(position_ids), options['repeat']))
+        for name, path in paths:
+            self.stdout.write('%s: %.1f ms' % (name, min(timings[name]) * 1000))
+
+        self.stdout.write(self.style.SUCCESS('bulk is %.1fx faster' % (min(timings['individual']) / min(timings['bulk']))))
+
+    @staticmethod
+    def create_data(question_count, position_count):
+        admin = User.objects.create(username='benchmark_admin_' + str(time.time()))
+        user = User.objects.create(username='benchmark_student_' + str(time.time()))
+        student = Student.objects.create(user=user)
+
+        now = timezone.now()
+        new_class = Class.objects.create(title='Benchmark ' + str(time.time()), admin=admin, section=1,
+                                         start_time=now, end_time=now + datetime.timedelta(minutes=75))
+        survey = Survey.objects.create(admin=admin, associated_class=new_class)
+
+        SurveyQuestion.objects.bulk_create([SurveyQuestion(survey=survey, prompt_text='Question ' + str(i))
+                                            for i in range(question_count)])
+        Position.objects.bulk_create([Position(student=student, x=i, y=i, timestamp=now + datetime.timedelta(seconds=i))
+                                      for i in range(position_count)])
+
+        question_ids = list(SurveyQuestion.objects.filter(survey=survey).order_by('id').values_list('id', flat=True))
+        position_ids = list(Position.objects.filter(student=student).order_by('timestamp').values_list('id', flat=True))
+
+        return survey, student, question_ids, position_ids
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Position, Student
+
+import datetime
+
+POSITION_INDEX_NAME = 'position_student_time_idx'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the Position time range queries and report whether they use the (student, timestamp) index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, help='The Student ID to build the queries with')
+        parser.add_argument('--start', help='The start of the time range (YYYY-MM-DD HH:MM:SS)')
+        parser.add_argument('--end', help='The end of the time range (YYYY-MM-DD HH:MM:SS)')
+        parser.add_argument('--analyze', action='store_true', help='Run EXPLAIN ANALYZE (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        try:
+            end_time = datetime.datetime.strptime(options['end'], TIME_FORMAT) if options['end'] else datetime.datetime.now()
+            start_time = datetime.datetime.strptime(options['start'], TIME_FORMAT) if options['start'] else end_time - datetime.timedelta(days=7)
+        except ValueError:
+            raise CommandError('Times must be in the format YYYY-MM-DD HH:MM:SS')
+
+        student_id = options['student']
+        if student_id is None:
+            student_id = Student.objects.order_by('id').values_list('id', flat=True).first() or 0
+
+        # The same queries the views run, built through the same QuerySet method.
+        queries = [
+            ('position_summary', Position.objects.in_time_range(student_id, start_time, end_time, inclusive=False)),
+            ('class_summarize_movement', Position.objects.in_time_range(student_id, start_time, end_time)),
+            ('end_session_create_survey_instance', Position.objects.in_time_range(student_id, start_time, end_time)),
+        ]
+
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        missed = 0
+
+        for name, queryset in queries:
+            plan = queryset.explain(**explain_options)
+            uses_index = POSITION_INDEX_NAME in plan
+
+            if uses_index:
+                self.stdout.write(self.style.SUCCESS('%s: uses %s' % (name, POSITION_INDEX_NAME)))
+            else:
+                missed += 1
+                self.stdout.write(self.style.WARNING('%s: does not use %s' % (name, POSITION_INDEX_NAME)))
+
+            if options['verbosity'] > 1 or not uses_index:
+                self.stdout.write(plan)
+
+        if missed:
+            raise CommandError('%d of %d queries do not use %s' % (missed, len(queries), POSITION_INDEX_NAME))
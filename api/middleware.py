@@ -0,0 +1,14 @@
+from api.auth_views import attach_session_student
+
+
+class SessionStudentMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # Resolve the logged in Student of API calls once so every view and decorator can share it.
+        if request.path.startswith('/api/') and 'session_id' in request.GET:
+            attach_session_student(request)
+
+        return self.get_response(request)
@@ -0,0 +1,44 @@
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_Add_Position_Student_Timestamp_Index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementRollup',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('meeting_date', models.DateField()),
+                ('sample_count', models.IntegerField()),
+                ('first_timestamp', models.DateTimeField(null=True)),
+                ('last_timestamp', models.DateTimeField(null=True)),
+                ('centroid_x', models.FloatField(null=True)),
+                ('centroid_y', models.FloatField(null=True)),
+                ('path_length', models.FloatField(null=True)),
+                ('min_x', models.FloatField(null=True)),
+                ('max_x', models.FloatField(null=True)),
+                ('min_y', models.FloatField(null=True)),
+                ('max_y', models.FloatField(null=True)),
+                ('dwell_count', models.IntegerField(null=True)),
+                ('dwell_seconds', models.FloatField(null=True)),
+                ('longest_dwell_seconds', models.FloatField(null=True)),
+                ('computed_at', models.DateTimeField(default=datetime.datetime.now)),
+                ('associated_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Student')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='movementrollup',
+            unique_together={('student', 'associated_class', 'meeting_date')},
+        ),
+        migrations.AddIndex(
+            model_name='movementrollup',
+            index=models.Index(fields=['associated_class', 'meeting_date'], name='rollup_class_date_idx'),
+        ),
+    ]
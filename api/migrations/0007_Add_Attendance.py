@@ -0,0 +1,38 @@
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_Add_Movement_Rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Attendance',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('meeting_date', models.DateField()),
+                ('present', models.BooleanField(default=False)),
+                ('sample_count', models.IntegerField(default=0)),
+                ('arrival', models.DateTimeField(null=True)),
+                ('departure', models.DateTimeField(null=True)),
+                ('computed_at', models.DateTimeField(default=datetime.datetime.now)),
+                ('associated_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Student')),
+            ],
+            options={
+                'verbose_name_plural': 'Attendance',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='attendance',
+            unique_together={('student', 'associated_class', 'meeting_date')},
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['associated_class', 'meeting_date'], name='attendance_class_date_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+# The User table belongs to django.contrib.auth, so its index on (last_name, first_name) for ordering Students by name is
+# made here with the schema editor instead of in the model.
+NAME_INDEX = models.Index(fields=['last_name', 'first_name'], name='auth_user_name_idx')
+
+
+def add_name_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model(settings.AUTH_USER_MODEL), NAME_INDEX)
+
+
+def remove_name_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model(settings.AUTH_USER_MODEL), NAME_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0007_Add_Attendance'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_name_index, remove_name_index),
+    ]
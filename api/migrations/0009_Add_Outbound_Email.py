@@ -0,0 +1,33 @@
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_Add_User_Name_Index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('html_body', models.TextField(blank=True)),
+                ('from_email', models.CharField(max_length=255)),
+                ('to', models.EmailField(max_length=254)),
+                ('created', models.DateTimeField(default=datetime.datetime.now)),
+                ('next_attempt', models.DateTimeField(default=datetime.datetime.now)),
+                ('attempts', models.IntegerField(default=0)),
+                ('claim', models.CharField(blank=True, max_length=32, null=True)),
+                ('sent', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(fields=['sent', 'next_attempt'], name='outbound_email_due_idx'),
+        ),
+    ]
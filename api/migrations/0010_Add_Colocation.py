@@ -0,0 +1,38 @@
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_Add_Outbound_Email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColocationMeeting',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('meeting_date', models.DateField()),
+                ('radius', models.FloatField()),
+                ('bucket_seconds', models.FloatField()),
+                ('computed_at', models.DateTimeField(default=datetime.datetime.now)),
+                ('associated_class', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Class')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='colocationmeeting',
+            unique_together={('associated_class', 'meeting_date', 'radius', 'bucket_seconds')},
+        ),
+        migrations.CreateModel(
+            name='ColocationEdge',
+            fields=[
+                ('id', models.AutoField(editable=False, primary_key=True, serialize=False)),
+                ('seconds', models.FloatField()),
+                ('meeting', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.ColocationMeeting')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Student')),
+                ('target', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.Student')),
+            ],
+        ),
+    ]
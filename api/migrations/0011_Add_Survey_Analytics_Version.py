@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_Add_Colocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='survey',
+            name='analytics_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
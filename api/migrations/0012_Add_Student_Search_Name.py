@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+def fill_search_names(apps, schema_editor):
+    Student = apps.get_model('api', 'Student')
+    for student_id, last_name, first_name in Student.objects.values_list('id', 'user__last_name', 'user__first_name'):
+        Student.objects.filter(id=student_id).update(search_last_name=last_name.lower(), search_first_name=first_name.lower())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_Add_Survey_Analytics_Version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_last_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='search_first_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=30),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['search_last_name', 'search_first_name'], name='api_student_search_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['search_first_name'], name='api_student_search_first_idx'),
+        ),
+    ]
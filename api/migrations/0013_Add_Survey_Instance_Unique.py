@@ -0,0 +1,58 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_entries(apps, first_id, instance_ids):
+    SurveyEntryInstance = apps.get_model('api', 'SurveyEntryInstance')
+    SurveyResponse = apps.get_model('api', 'SurveyResponse')
+
+    for model_name, field_name in (('SurveyQuestionInstance', 'question_id'), ('SurveyPositionInstance', 'position_id')):
+        entries = apps.get_model('api', model_name).objects.filter(survey_instance_id__in=instance_ids) \
+            .order_by('id').values_list('id', 'survey_instance_id', field_name)
+
+        # The entry of the first SurveyInstance is kept for each question or Position, or the oldest entry if it has none.
+        kept = {}
+        for entry_id, instance_id, key in sorted(entries, key=lambda x: (x[1] != first_id, x[0])):
+            if key not in kept:
+                kept[key] = entry_id
+                if instance_id != first_id:
+                    SurveyEntryInstance.objects.filter(id=entry_id).update(survey_instance_id=first_id)
+                continue
+
+            # A repeated entry gives its responses to the kept entry, which keeps only the newest one.
+            SurveyResponse.objects.filter(survey_entry_id=entry_id).update(survey_entry_id=kept[key])
+            SurveyEntryInstance.objects.filter(id=entry_id).delete()
+
+        for entry_id in kept.values():
+            newest = SurveyResponse.objects.filter(survey_entry_id=entry_id).order_by('-id').values_list('id', flat=True).first()
+            if newest is not None:
+                SurveyResponse.objects.filter(survey_entry_id=entry_id).exclude(id=newest).delete()
+
+
+def merge_duplicate_instances(apps, schema_editor):
+    SurveyInstance = apps.get_model('api', 'SurveyInstance')
+
+    # The entries and responses of every extra SurveyInstance of a Student on the same day are merged into the first one.
+    duplicates = SurveyInstance.objects.values('survey_id', 'student_id', 'date_generated') \
+        .annotate(count=Count('id'), first_id=Min('id')).filter(count__gt=1).order_by()
+    for duplicate in duplicates:
+        instance_ids = list(SurveyInstance.objects.filter(survey_id=duplicate['survey_id'], student_id=duplicate['student_id'],
+                                                          date_generated=duplicate['date_generated'])
+                            .values_list('id', flat=True))
+        merge_entries(apps, duplicate['first_id'], instance_ids)
+        SurveyInstance.objects.filter(id__in=instance_ids).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_Add_Student_Search_Name'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_instances, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='surveyinstance',
+            unique_together={('survey', 'student', 'date_generated')},
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 import datetime
@@ -16,18 +18,51 @@ class Session(models.Model):
 class Student(models.Model):
     class Meta:
         ordering = ('user__last_name', 'user__first_name')
+        indexes = [
+            models.Index(fields=['search_last_name', 'search_first_name'], name='api_student_search_name_idx'),
+            models.Index(fields=['search_first_name'], name='api_student_search_first_idx')
+        ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reset_password_code = models.CharField(max_length=6, null=True, blank=True)
     id = models.AutoField(primary_key=True, editable=False)
+    # The lower case names of the User, so the Student search can match any case with an index.
+    search_last_name = models.CharField(max_length=150, blank=True, default='', editable=False)
+    search_first_name = models.CharField(max_length=30, blank=True, default='', editable=False)
 
     def __str__(self):
         return self.user.last_name + ', ' + self.user.first_name
 
+    def save(self, *args, **kwargs):
+        self.search_last_name = self.user.last_name.lower()
+        self.search_first_name = self.user.first_name.lower()
+        super().save(*args, **kwargs)
+
     def to_dict(self):
         return self.id
 
 
+@receiver(post_save, sender=User)
+def update_student_search_name(sender, instance, update_fields=None, **kwargs):
+    """
+        Function Summary: This function keeps the search names of a User's Students the same as the User's names when the User is saved.
+
+        Args:
+            sender -- The User model
+            instance -- The saved User object
+            update_fields -- The fields that were saved, or None for all of them
+
+        Return:
+            Type: None
+    """
+    # Saves that do not touch the names, such as the last login, are skipped.
+    if update_fields is not None and 'first_name' not in update_fields and 'last_name' not in update_fields:
+        return
+
+    Student.objects.filter(user=instance).update(search_last_name=instance.last_name.lower(),
+                                                 search_first_name=instance.first_name.lower())
+
+
 class GenderLookup(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=25)
@@ -86,13 +121,43 @@ class Demographic(models.Model):
         return str(self.id)
 
     def to_dict(self):
-        return {'id': self.id, 'student': self.student.id, 'age': self.age, 'gender': self.gender.id,
-                'grade_year': self.grade_year.id, 'ethnicity': self.ethnicity.id, 'race': self.race.id, 'major': self.major}
+        return {'id': self.id, 'student': self.student_id, 'age': self.age, 'gender': self.gender_id,
+                'grade_year': self.grade_year_id, 'ethnicity': self.ethnicity_id, 'race': self.race_id, 'major': self.major}
+
+
+class PositionQuerySet(models.QuerySet):
+
+    def in_time_range(self, student_id, start_time, end_time, inclusive=True):
+        """
+            Function Summary: This function is used to get a Student's Positions between two times, ordered by time. The filter and ordering match the (student, timestamp) index so the database can answer it with an index range scan.
+
+            Args:
+                student_id -- The ID of the Student
+                start_time -- The start of the time range
+                end_time -- The end of the time range
+                inclusive -- Whether Positions exactly on the start or end time are included
+
+            Return:
+                Type: QuerySet
+                Data: The Position objects in the time range
+        """
+        if inclusive:
+            time_filter = {'timestamp__gte': start_time, 'timestamp__lte': end_time}
+        else:
+            time_filter = {'timestamp__gt': start_time, 'timestamp__lt': end_time}
+
+        return self.filter(student_id=student_id, **time_filter).order_by('timestamp')
 
 
 class Position(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=['student', 'timestamp'], name='position_student_time_idx')]
+
+    objects = PositionQuerySet.as_manager()
+
     id = models.AutoField(primary_key=True, editable=False)
-    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    # The (student, timestamp) index covers lookups by student, so the foreign key does not need its own index.
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, db_index=False)
     timestamp = models.DateTimeField(default=datetime.datetime.now)
     x = models.FloatField()
     y = models.FloatField()
@@ -101,7 +166,7 @@ class Position(models.Model):
         return str(self.id) + ' (' + str(self.x) + ', ' + str(self.y) + ')'
 
     def to_dict(self):
-        return {'id': self.id, 'student': self.student.id, 'timestamp': self.timestamp, 'x': self.x, 'y': self.y}
+        return {'id': self.id, 'student': self.student_id, 'timestamp': self.timestamp, 'x': self.x, 'y': self.y}
 
 
 class DayLookup(models.Model):
@@ -115,12 +180,29 @@ class DayLookup(models.Model):
         return self.name
 
 
+class ClassQuerySet(models.QuerySet):
+
+    def for_serialization(self):
+        """
+            Function Summary: This function is used to load the related data needed by 'Class.to_dict()' with the Class objects, so serializing any number of Classes takes a fixed number of queries.
+
+            Args:
+
+            Return:
+                Type: QuerySet
+                Data: The Class objects with their admin and days loaded
+        """
+        return self.select_related('admin').prefetch_related('days_of_the_week')
+
+
 class Class(models.Model):
     class Meta:
         verbose_name_plural = "Classes"
         unique_together = ('title', 'semester', 'year')
         ordering = ('title',)
 
+    objects = ClassQuerySet.as_manager()
+
     id = models.AutoField(primary_key=True, editable=False)
     title = models.CharField(max_length=50)
     admin = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -139,6 +221,35 @@ class Class(models.Model):
     def __str__(self):
         return self.title + " " + str(self.section) + ' - ' + str(self.admin.username) + ' - ' + str(self.semester) + ' ' + str(self.year)
 
+    def get_meeting_windows(self, start_date, end_date):
+        """
+            Function Summary: This function is used to get the start and end time of every meeting of the Class between two dates.
+
+            Args:
+                start_date -- The first date to include
+                end_date -- The last date to include
+
+            Return:
+                Type: list
+                Data: A list of (date, start datetime, end datetime) tuples ordered by date
+        """
+        days_of_the_week = set(x.id for x in self.days_of_the_week.all())
+        start_time = datetime.time(hour=self.start_time.hour, minute=self.start_time.minute)
+        end_time = datetime.time(hour=self.end_time.hour, minute=self.end_time.minute)
+
+        windows = []
+        for n in range((end_date - start_date).days + 1):
+            current_date = start_date + datetime.timedelta(days=n)
+
+            # Skip the dates that the Class does not meet on.
+            if current_date.weekday() not in days_of_the_week:
+                continue
+
+            windows.append((current_date, datetime.datetime.combine(current_date, start_time),
+                            datetime.datetime.combine(current_date, end_time)))
+
+        return windows
+
     def to_dict(self):
         return {'id': self.id, 'title': self.title, 'section': self.section, 'admin': self.admin.username, 'semester': self.semester,
                 'year': self.year, 'days': [str(x) for x in self.days_of_the_week.all()], 'start_time': str(self.start_time),
@@ -154,10 +265,107 @@ class ClassEnrollment(models.Model):
     class_enrolled = models.ForeignKey(Class, on_delete=models.CASCADE)
 
     def __str__(self):
-        return self.class_enrolled.title + ' - ' + str(self.student.id)
+        return self.class_enrolled.title + ' - ' + str(self.student_id)
+
+    def to_dict(self):
+        return {'student': self.student_id, 'classes': self.class_enrolled_id}
+
+
+class MovementRollup(models.Model):
+    class Meta:
+        unique_together = ('student', 'associated_class', 'meeting_date')
+        indexes = [models.Index(fields=['associated_class', 'meeting_date'], name='rollup_class_date_idx')]
+
+    id = models.AutoField(primary_key=True, editable=False)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    associated_class = models.ForeignKey(Class, on_delete=models.CASCADE)
+    meeting_date = models.DateField()
+    sample_count = models.IntegerField()
+    # The rest of the fields are null when the Student has no Positions in the meeting.
+    first_timestamp = models.DateTimeField(null=True)
+    last_timestamp = models.DateTimeField(null=True)
+    centroid_x = models.FloatField(null=True)
+    centroid_y = models.FloatField(null=True)
+    path_length = models.FloatField(null=True)
+    min_x = models.FloatField(null=True)
+    max_x = models.FloatField(null=True)
+    min_y = models.FloatField(null=True)
+    max_y = models.FloatField(null=True)
+    dwell_count = models.IntegerField(null=True)
+    dwell_seconds = models.FloatField(null=True)
+    longest_dwell_seconds = models.FloatField(null=True)
+    computed_at = models.DateTimeField(default=datetime.datetime.now)
+
+    def __str__(self):
+        return str(self.associated_class_id) + ' | ' + str(self.meeting_date) + ' | ' + str(self.student_id)
 
     def to_dict(self):
-        return {'student': self.student.id, 'classes': self.class_enrolled.id}
+        return {'student': self.student_id, 'class': self.associated_class_id, 'meeting_date': str(self.meeting_date),
+                'sample_count': self.sample_count, 'first_timestamp': self.first_timestamp, 'last_timestamp': self.last_timestamp,
+                'centroid_x': self.centroid_x, 'centroid_y': self.centroid_y, 'path_length': self.path_length,
+                'min_x': self.min_x, 'max_x': self.max_x, 'min_y': self.min_y, 'max_y': self.max_y,
+                'dwell_count': self.dwell_count, 'dwell_seconds': self.dwell_seconds,
+                'longest_dwell_seconds': self.longest_dwell_seconds}
+
+
+class Attendance(models.Model):
+    class Meta:
+        verbose_name_plural = "Attendance"
+        unique_together = ('student', 'associated_class', 'meeting_date')
+        indexes = [models.Index(fields=['associated_class', 'meeting_date'], name='attendance_class_date_idx')]
+
+    id = models.AutoField(primary_key=True, editable=False)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    associated_class = models.ForeignKey(Class, on_delete=models.CASCADE)
+    meeting_date = models.DateField()
+    present = models.BooleanField(default=False)
+    sample_count = models.IntegerField(default=0)
+    # The first and last Position of the Student in the meeting, or null if there were none.
+    arrival = models.DateTimeField(null=True)
+    departure = models.DateTimeField(null=True)
+    computed_at = models.DateTimeField(default=datetime.datetime.now)
+
+    def __str__(self):
+        return str(self.associated_class_id) + ' | ' + str(self.meeting_date) + ' | ' + str(self.student_id)
+
+    def to_dict(self):
+        return {'student': self.student_id, 'class': self.associated_class_id, 'meeting_date': str(self.meeting_date),
+                'present': self.present, 'sample_count': self.sample_count, 'arrival': self.arrival, 'departure': self.departure}
+
+
+class ColocationMeeting(models.Model):
+    class Meta:
+        unique_together = ('associated_class', 'meeting_date', 'radius', 'bucket_seconds')
+
+    id = models.AutoField(primary_key=True, editable=False)
+    associated_class = models.ForeignKey(Class, on_delete=models.CASCADE)
+    meeting_date = models.DateField()
+    # The co-location configuration the edges were computed with.
+    radius = models.FloatField()
+    bucket_seconds = models.FloatField()
+    computed_at = models.DateTimeField(default=datetime.datetime.now)
+
+    def __str__(self):
+        return str(self.associated_class_id) + ' | ' + str(self.meeting_date)
+
+    def to_dict(self):
+        return {'id': self.id, 'class': self.associated_class_id, 'meeting_date': str(self.meeting_date), 'radius': self.radius,
+                'bucket_seconds': self.bucket_seconds}
+
+
+class ColocationEdge(models.Model):
+    id = models.AutoField(primary_key=True, editable=False)
+    meeting = models.ForeignKey(ColocationMeeting, on_delete=models.CASCADE)
+    # The Student with the smaller ID is always the source.
+    source = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='+')
+    target = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='+')
+    seconds = models.FloatField()
+
+    def __str__(self):
+        return str(self.meeting_id) + ' | ' + str(self.source_id) + ' | ' + str(self.target_id)
+
+    def to_dict(self):
+        return {'meeting': self.meeting_id, 'source': self.source_id, 'target': self.target_id, 'seconds': self.seconds}
 
 
 class Survey(models.Model):
@@ -167,12 +375,14 @@ class Survey(models.Model):
     id = models.AutoField(primary_key=True, editable=False)
     admin = models.ForeignKey(User, on_delete=models.CASCADE)
     associated_class = models.ForeignKey(Class, on_delete=models.CASCADE)
+    # Changed whenever the responses, questions, or respondents of the Survey change, so cached analytics can tell they are stale.
+    analytics_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return 'Survey for ' + str(self.associated_class)
 
     def to_dict(self):
-        return {'id': str(self.id), 'admin': str(self.admin.id), 'associated_class': str(self.associated_class.id)}
+        return {'id': str(self.id), 'admin': str(self.admin_id), 'associated_class': str(self.associated_class_id)}
 
 
 class SurveyQuestion(models.Model):
@@ -190,10 +400,55 @@ class SurveyQuestion(models.Model):
         return self.prompt_text + " | " + str(self.survey.associated_class)
 
     def to_dict(self):
-        return {'id': str(self.id), 'survey': str(self.survey.id), 'type': self.type, 'prompt': self.prompt_text}
+        return {'id': str(self.id), 'survey': str(self.survey_id), 'type': self.type, 'prompt': self.prompt_text}
+
+
+class SurveyInstanceQuerySet(models.QuerySet):
+
+    def for_serialization(self):
+        """
+            Function Summary: This function is used to load the related data needed by 'SurveyInstance.to_dict()' with the SurveyInstance objects, so serializing any number of them takes a fixed number of queries.
+
+            Args:
+
+            Return:
+                Type: QuerySet
+                Data: The SurveyInstance objects with their Survey and Class loaded
+        """
+        return self.select_related('survey__associated_class__admin').prefetch_related('survey__associated_class__days_of_the_week')
+
+    def with_entry_counts(self):
+        """
+            Function Summary: This function is used to count the entries of each SurveyInstance and how many of them have a SurveyResponse, in the same query that gets the SurveyInstance objects.
+
+            Args:
+
+            Return:
+                Type: QuerySet
+                Data: The SurveyInstance objects annotated with 'entry_count' and 'answered_count'
+        """
+        return self.annotate(entry_count=models.Count('surveyentryinstance', distinct=True),
+                             answered_count=models.Count('surveyentryinstance__surveyresponse__survey_entry', distinct=True))
+
+    def open(self):
+        """
+            Function Summary: This function is used to get the SurveyInstance objects that still have a question or position without a SurveyResponse.
+
+            Args:
+
+            Return:
+                Type: QuerySet
+                Data: The open SurveyInstance objects annotated with 'entry_count' and 'answered_count'
+        """
+        return self.with_entry_counts().filter(answered_count__lt=models.F('entry_count'))
 
 
 class SurveyInstance(models.Model):
+    class Meta:
+        unique_together = ('survey', 'student', 'date_generated')
+
+    objects = SurveyInstanceQuerySet.as_manager()
+
     id = models.AutoField(primary_key=True, editable=False)
     survey = models.ForeignKey(Survey, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
@@ -203,7 +458,7 @@ class SurveyInstance(models.Model):
         return str(self.survey) + ' | ' + str(self.date_generated) + ' | ' + str(self.student)
 
     def to_dict(self):
-        return {'id': self.id, 'survey': self.survey.id, 'date_generated': str(self.date_generated), 'class': self.survey.associated_class.to_dict()}
+        return {'id': self.id, 'survey': self.survey_id, 'date_generated': str(self.date_generated), 'class': self.survey.associated_class.to_dict()}
 
 
 class SurveyEntryInstance(models.Model):
@@ -211,10 +466,10 @@ class SurveyEntryInstance(models.Model):
     survey_instance = models.ForeignKey(SurveyInstance, on_delete=models.CASCADE)
 
     def __str__(self):
-        return str(self.id) + " | " + str(self.survey_instance.id)
+        return str(self.id) + " | " + str(self.survey_instance_id)
 
     def to_dict(self):
-        return {'id': self.id, 'survey_instance': self.survey_instance.id}
+        return {'id': self.id, 'survey_instance': self.survey_instance_id}
 
 
 class SurveyQuestionInstance(SurveyEntryInstance):
@@ -224,7 +479,7 @@ class SurveyQuestionInstance(SurveyEntryInstance):
         return str(self.survey_instance) + " | " + str(self.question)
 
     def to_dict(self):
-        return {'id': self.id, 'survey_instance': self.survey_instance.id, 'question': self.question.id}
+        return {'id': self.id, 'survey_instance': self.survey_instance_id, 'question': self.question_id}
 
 
 class SurveyPositionInstance(SurveyEntryInstance):
@@ -234,10 +489,27 @@ class SurveyPositionInstance(SurveyEntryInstance):
         return str(self.survey_instance) + " | " + str(self.position)
 
     def to_dict(self):
-        return {'id': self.id, 'survey_instance': self.survey_instance.id, 'position': self.position.id}
+        return {'id': self.id, 'survey_instance': self.survey_instance_id, 'position': self.position_id}
+
+
+class SurveyResponseQuerySet(models.QuerySet):
+
+    def for_serialization(self):
+        """
+            Function Summary: This function is used to load the related data needed by 'SurveyResponse.to_dict()' with the SurveyResponse objects, so serializing any number of them takes one query.
+
+            Args:
+
+            Return:
+                Type: QuerySet
+                Data: The SurveyResponse objects with their entry and SurveyInstance loaded
+        """
+        return self.select_related('survey_entry__survey_instance')
 
 
 class SurveyResponse(models.Model):
+    objects = SurveyResponseQuerySet.as_manager()
+
     id = models.AutoField(primary_key=True, editable=False)
     survey_entry = models.ForeignKey(SurveyEntryInstance, on_delete=models.CASCADE)
     response = models.TextField()
@@ -246,7 +518,7 @@ class SurveyResponse(models.Model):
         return str(self.survey_entry.survey_instance.survey) + " | " + str(self.survey_entry.survey_instance.student)
 
     def to_dict(self):
-        return {'id': self.id, 'entry': self.survey_entry.id, 'survey_instance': self.survey_entry.survey_instance.id, 'survey': self.survey_entry.survey_instance.survey.id, 'response': self.response}
+        return {'id': self.id, 'entry': self.survey_entry_id, 'survey_instance': self.survey_entry.survey_instance_id, 'survey': self.survey_entry.survey_instance.survey_id, 'response': self.response}
 
 
 class Feedback(models.Model):
@@ -258,3 +530,30 @@ class Feedback(models.Model):
 
     def to_dict(self):
         return {'id': str(self.id), 'feedback': self.feedback}
+
+
+class OutboundEmail(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=['sent', 'next_attempt'], name='outbound_email_due_idx')]
+
+    id = models.AutoField(primary_key=True, editable=False)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.EmailField()
+    created = models.DateTimeField(default=datetime.datetime.now)
+    # The email is sent once this time has passed. It is moved forward while a worker holds the email and after a failure.
+    next_attempt = models.DateTimeField(default=datetime.datetime.now)
+    attempts = models.IntegerField(default=0)
+    # The token of the worker run holding the email, or null if no run is sending it.
+    claim = models.CharField(max_length=32, null=True, blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return str(self.id) + ' | ' + self.to + ' | ' + self.subject
+
+    def to_dict(self):
+        return {'id': self.id, 'subject': self.subject, 'to': self.to, 'created': self.created, 'attempts': self.attempts,
+                'sent': self.sent, 'last_error': self.last_error}
@@ -0,0 +1,240 @@
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+
+from workers import task
+
+from api.app_settings import get_app_settings
+from api.models import OutboundEmail
+
+import datetime
+import functools
+import itertools
+import logging
+import uuid
+
+log = logging.getLogger(__name__)
+
+# The default configuration of the email outbox. These can be overridden with EMAIL_OUTBOX in settings.py.
+DEFAULT_EMAIL_OUTBOX_SETTINGS = {
+    'FROM_EMAIL': 'ICBA-NO-REPLY',
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_SECONDS': 60,
+    'LEASE_SECONDS': 5 * 60,
+    'RETENTION_DAYS': 7,
+    'SCHEDULE_SECONDS': 60
+}
+
+
+get_email_outbox_settings = functools.partial(get_app_settings, 'EMAIL_OUTBOX', DEFAULT_EMAIL_OUTBOX_SETTINGS)
+
+
+def queue_email(subject, template_name, context, to):
+    """
+        Function Summary: This function is used to render an email template and add the email to the outbox. The email is sent by the 'deliver_outbound_email' task, so the request does not wait on the mail server.
+
+        Args:
+            subject -- The subject of the email
+            template_name -- The HTML template of the email. The plain text body is the template without its tags
+            context -- The context to render the template with
+            to -- The email address to send the email to
+
+        Return:
+            Type: OutboundEmail
+            Data: The new OutboundEmail
+    """
+    email_html = render_to_string(template_name, context)
+    email = OutboundEmail.objects.create(subject=subject, body=strip_tags(email_html), html_body=email_html,
+                                         from_email=get_email_outbox_settings()['FROM_EMAIL'], to=to)
+
+    # Start a delivery right away instead of waiting for the next scheduled one.
+    deliver_outbound_email()
+
+    return email
+
+
+def claim_emails(now):
+    """
+        Function Summary: This function is used to take up to BATCH_SIZE of the emails that are due, so no other worker sends them at the same time. Each email counts an attempt and is held for LEASE_SECONDS, after which it is due again if the worker never recorded the result.
+
+        Args:
+            now -- The current time
+
+        Return:
+            Type: list
+            Data: The OutboundEmail objects that were taken, ordered by ID
+    """
+    outbox_settings = get_email_outbox_settings()
+    due_ids = list(OutboundEmail.objects.filter(sent__isnull=True, next_attempt__lte=now, attempts__lt=outbox_settings['MAX_ATTEMPTS'])
+                   .order_by('next_attempt', 'id').values_list('id', flat=True)[:outbox_settings['BATCH_SIZE']])
+
+    if len(due_ids) == 0:
+        return []
+
+    # Only the emails still due are taken, in case another worker took some of them first.
+    claim = uuid.uuid4().hex
+    OutboundEmail.objects.filter(id__in=due_ids, sent__isnull=True, next_attempt__lte=now) \
+        .update(claim=claim, attempts=F('attempts') + 1,
+                next_attempt=now + datetime.timedelta(seconds=outbox_settings['LEASE_SECONDS']))
+
+    return list(OutboundEmail.objects.filter(claim=claim).order_by('id'))
+
+
+def send_emails(connection, emails):
+    """
+        Function Summary: This function is used to send emails one at a time over an open connection, so one bad email does not stop the others. The connection is opened again after a failure in case the failure broke it.
+
+        Args:
+            connection -- The open email backend connection
+            emails -- The OutboundEmail objects to send
+
+        Return:
+            Type: dict
+            Data: The error text of each email that failed, by OutboundEmail ID
+    """
+    errors = {}
+    for email in emails:
+        message = EmailMultiAlternatives(email.subject, email.body, email.from_email, [email.to], connection=connection)
+        if email.html_body:
+            message.attach_alternative(email.html_body, 'text/html')
+
+        try:
+            if connection.send_messages([message]) != 1:
+                errors[email.id] = 'The email backend did not send the email'
+        except Exception as e:
+            errors[email.id] = str(e) or type(e).__name__
+
+            try:
+                connection.close()
+                connection.open()
+            except Exception as e:
+                log.warning('email outbox: could not reopen the email connection: %s', e)
+
+    return errors
+
+
+def record_results(emails, errors, now):
+    """
+        Function Summary: This function is used to save the results of sending a batch of emails. The bodies of the sent emails are cleared. The failed emails are due again after RETRY_SECONDS, doubled for each attempt already made. The emails that failed MAX_ATTEMPTS times are not tried again, and are logged as errors.
+
+        Args:
+            emails -- The OutboundEmail objects that were sent
+            errors -- The error text of each email that failed, by OutboundEmail ID
+            now -- The current time
+
+        Return:
+            Type: None
+    """
+    outbox_settings = get_email_outbox_settings()
+    retry_seconds = outbox_settings['RETRY_SECONDS']
+
+    # The bodies of sent emails are cleared, since they can hold codes such as the password reset code.
+    OutboundEmail.objects.filter(id__in=[x.id for x in emails if x.id not in errors]) \
+        .update(sent=now, claim=None, last_error='', body='', html_body='')
+
+    # The emails that failed the same way on the same attempt are saved with one query.
+    failed = sorted((x.attempts, errors[x.id], x.id) for x in emails if x.id in errors)
+    for (attempts, error), group in itertools.groupby(failed, key=lambda x: x[:2]):
+        email_ids = [x[2] for x in group]
+        OutboundEmail.objects.filter(id__in=email_ids) \
+            .update(claim=None, last_error=error,
+                    next_attempt=now + datetime.timedelta(seconds=retry_seconds * 2 ** (attempts - 1)))
+
+        if attempts >= outbox_settings['MAX_ATTEMPTS']:
+            log.error('email outbox: gave up on emails %s after %d attempts: %s', email_ids, attempts, error)
+
+
+def release_emails(emails, error, now):
+    """
+        Function Summary: This function is used to give back a batch of emails that could not be sent because the connection to the mail server could not be opened. The attempt counted when they were taken is undone, so the emails are not dropped while the mail server is down, and they are due again after RETRY_SECONDS.
+
+        Args:
+            emails -- The OutboundEmail objects that were taken
+            error -- The error text of the connection
+            now -- The current time
+
+        Return:
+            Type: None
+    """
+    retry_seconds = get_email_outbox_settings()['RETRY_SECONDS']
+
+    OutboundEmail.objects.filter(id__in=[x.id for x in emails]) \
+        .update(claim=None, attempts=F('attempts') - 1, last_error=error,
+                next_attempt=now + datetime.timedelta(seconds=retry_seconds))
+
+
+def deliver_outbox(now=None):
+    """
+        Function Summary: This function is used to send every email in the outbox that is due, BATCH_SIZE at a time, over a single connection to the mail server. If the connection cannot be opened, the batch is retried later without counting an attempt and the rest of the outbox is left for the next delivery.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of emails sent
+    """
+    now = now or datetime.datetime.now()
+    connection = get_connection()
+    sent = 0
+
+    try:
+        while True:
+            emails = claim_emails(now)
+            if len(emails) == 0:
+                break
+
+            try:
+                connection.open()
+            except Exception as e:
+                log.warning('email outbox: could not open the email connection: %s', e)
+                release_emails(emails, str(e) or type(e).__name__, now)
+                break
+
+            errors = send_emails(connection, emails)
+            record_results(emails, errors, now)
+            sent += len(emails) - len(errors)
+    finally:
+        try:
+            connection.close()
+        except Exception as e:
+            log.warning('email outbox: could not close the email connection: %s', e)
+
+    return sent
+
+
+def purge_outbox(now=None):
+    """
+        Function Summary: This function is used to delete the emails that were sent, or that failed MAX_ATTEMPTS times, more than RETENTION_DAYS ago.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of emails deleted
+    """
+    outbox_settings = get_email_outbox_settings()
+    now = now or datetime.datetime.now()
+    cutoff = now - datetime.timedelta(days=outbox_settings['RETENTION_DAYS'])
+
+    sent = OutboundEmail.objects.filter(sent__lt=cutoff).delete()[0]
+    given_up = OutboundEmail.objects.filter(sent__isnull=True, attempts__gte=outbox_settings['MAX_ATTEMPTS'],
+                                            next_attempt__lt=cutoff).delete()[0]
+    return sent + given_up
+
+
+@task(schedule=get_email_outbox_settings()['SCHEDULE_SECONDS'])
+def deliver_outbound_email():
+    """
+        Function Summary: This function is a task that sends the emails in the outbox and deletes the old ones. It is run by the Django-Workers library every SCHEDULE_SECONDS of the email outbox, and right after an email is queued.
+
+        Args:
+
+        Return:
+            Type: None
+    """
+    deliver_outbox()
+    purge_outbox()
@@ -0,0 +1,82 @@
+from django.db.models import Q
+
+import base64
+import datetime
+
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(timestamp, object_id):
+    """
+        Function Summary: This function is used to build the cursor that points just past an object in a list ordered by (timestamp, id).
+
+        Args:
+            timestamp -- The timestamp of the last object returned
+            object_id -- The ID of the last object returned
+
+        Return:
+            Type: string
+            Data: An opaque, URL safe cursor string
+    """
+    raw_cursor = timestamp.strftime(CURSOR_TIME_FORMAT) + '|' + str(object_id)
+    return base64.urlsafe_b64encode(raw_cursor.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+        Function Summary: This function is used to read a cursor made by 'encode_cursor()'.
+
+        Args:
+            cursor -- The cursor string sent by the client
+
+        Return:
+            Type: tuple
+            Data: The (timestamp, id) the cursor points past. ValueError is raised if the cursor is invalid
+    """
+    try:
+        raw_cursor = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, object_id = raw_cursor.split('|')
+        return datetime.datetime.strptime(timestamp, CURSOR_TIME_FORMAT), int(object_id)
+
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def paginate_by_time(queryset, cursor=None, limit=None, descending=False):
+    """
+        Function Summary: This function is used to get one page of a QuerySet using keyset pagination on (timestamp, id). Unlike OFFSET pagination, every page costs the same no matter how deep into the list it is.
+
+        Args:
+            queryset -- The QuerySet of objects with a 'timestamp' field
+            cursor -- The cursor returned with the previous page, or None for the first page
+            limit -- The most objects on the page, or None for every remaining object
+            descending -- Whether the newest objects come first
+
+        Return:
+            Type: tuple
+            Data: A tuple of (objects, next_cursor). 'objects' is a QuerySet when there is no limit and a list otherwise. 'next_cursor' is None on the last page
+    """
+    if descending:
+        queryset = queryset.order_by('-timestamp', '-id')
+    else:
+        queryset = queryset.order_by('timestamp', 'id')
+
+    # Only keep the objects after the cursor.
+    if cursor is not None:
+        timestamp, object_id = decode_cursor(cursor)
+
+        if descending:
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=object_id))
+        else:
+            queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=object_id))
+
+    if limit is None:
+        return queryset, None
+
+    # Get one extra object to find out if there is another page.
+    page = list(queryset[:limit + 1])
+    if len(page) <= limit:
+        return page, None
+
+    page = page[:limit]
+    return page, encode_cursor(page[-1].timestamp, page[-1].id)
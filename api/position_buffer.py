@@ -0,0 +1,311 @@
+from django.db import InterfaceError, OperationalError, connection, transaction
+
+from api.app_settings import get_app_settings
+from api.models import Position
+
+import atexit
+import functools
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# The default configuration of the buffer. These can be overridden with POSITION_WRITE_BUFFER in settings.py.
+DEFAULT_BUFFER_SETTINGS = {
+    'ENABLED': False,
+    'FLUSH_INTERVAL_MS': 500,
+    'FLUSH_SIZE': 500,
+    'MAX_SIZE': 10000,
+    'PUT_TIMEOUT_MS': 1000,
+    'ACKNOWLEDGE': 'flush',
+    'ACK_TIMEOUT_MS': 5000,
+    'WRITE_RETRIES': 3,
+    'RETRY_DELAY_MS': 1000
+}
+
+# The acknowledgement modes of the buffer. 'flush' replies once the Position is written, 'enqueue' replies right away.
+ACK_ON_FLUSH = 'flush'
+ACK_ON_ENQUEUE = 'enqueue'
+
+
+class PendingPosition:
+
+    # The states of a Position in the buffer.
+    QUEUED = 'queued'
+    WRITING = 'writing'
+    CANCELLED = 'cancelled'
+    DONE = 'done'
+
+    def __init__(self, position):
+        self.position = position
+        self.error = None
+        self._state = PendingPosition.QUEUED
+        self._lock = threading.Lock()
+        self._written = threading.Event()
+
+    def claim(self):
+        """
+            Function Summary: This function is used by the buffer to take the Position for writing, unless it was cancelled.
+
+            Args:
+
+            Return:
+                Type: boolean
+                Data: True if the Position should be written, False if it was cancelled
+        """
+        with self._lock:
+            if self._state != PendingPosition.QUEUED:
+                return False
+
+            self._state = PendingPosition.WRITING
+            return True
+
+    def cancel(self):
+        """
+            Function Summary: This function is used to take the Position back out of the buffer, so it is never written. It only works before the buffer starts writing it.
+
+            Args:
+
+            Return:
+                Type: boolean
+                Data: True if the Position will not be written, False if it is being written or was already written
+        """
+        with self._lock:
+            if self._state != PendingPosition.QUEUED:
+                return self._state == PendingPosition.CANCELLED
+
+            self._state = PendingPosition.CANCELLED
+            return True
+
+    def mark_written(self, error=None):
+        """
+            Function Summary: This function is used by the buffer to signal that the Position has been written or has failed.
+
+            Args:
+                error -- The exception raised while writing the Position, or None if it was saved
+
+            Return:
+                Type: None
+        """
+        with self._lock:
+            self._state = PendingPosition.DONE
+            self.error = error
+        self._written.set()
+
+    def wait(self, timeout=None):
+        """
+            Function Summary: This function will block until the Position has been flushed to the database.
+
+            Args:
+                timeout -- The most seconds to wait for the flush, or None to wait until it is done
+
+            Return:
+                Type: boolean
+                Data: True if the Position was saved before the timeout, False otherwise
+        """
+        return self._written.wait(timeout) and self.error is None
+
+
+class PositionWriteBuffer:
+
+    def __init__(self, flush_interval_ms=500, flush_size=500, max_size=10000, put_timeout_ms=1000, write_retries=3,
+                 retry_delay_ms=1000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_size = flush_size
+        self.put_timeout = put_timeout_ms / 1000
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay_ms / 1000
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+            Function Summary: This function starts the background thread that flushes the buffer. Calling it on a running buffer does nothing.
+
+            Args:
+
+            Return:
+                Type: None
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='position-write-buffer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+            Function Summary: This function stops the background thread and writes anything still waiting in the buffer. It is registered to run when the server shuts down.
+
+            Args:
+
+            Return:
+                Type: None
+        """
+        self._stopping.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.flush()
+
+    def put(self, position):
+        """
+            Function Summary: This function adds an unsaved Position to the buffer. If the buffer is full, the caller is blocked for up to 'put_timeout' seconds before giving up. Once the buffer has been stopped, the Position is written right away by the calling thread, since nothing would flush it.
+
+            Args:
+                position -- The unsaved Position object
+
+            Return:
+                Type: PendingPosition
+                Data: A handle that can be waited on until the Position is written. queue.Full is raised if the buffer stays full
+        """
+        pending = PendingPosition(position)
+
+        if self._stopping.is_set():
+            self._write_batch([pending])
+        else:
+            self._queue.put(pending, timeout=self.put_timeout)
+
+        return pending
+
+    def flush(self):
+        """
+            Function Summary: This function writes everything currently in the buffer using the calling thread.
+
+            Args:
+
+            Return:
+                Type: None
+        """
+        while True:
+            batch = self._take_batch(block=False)
+
+            if len(batch) == 0:
+                return
+
+            self._write_batch(batch)
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        try:
+            while not self._stopping.is_set():
+                batch = self._take_batch(block=True)
+
+                if len(batch) != 0:
+                    self._write_batch(batch)
+        finally:
+            # The thread has its own database connection that has to be closed by the thread itself.
+            connection.close()
+
+    def _take_batch(self, block):
+        batch = []
+        deadline = None
+
+        # Collect Positions until the batch is full or the flush interval has passed since the first one arrived.
+        while len(batch) < self.flush_size:
+            try:
+                if not block:
+                    pending = self._queue.get_nowait()
+                else:
+                    timeout = self.flush_interval if deadline is None else deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    pending = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+
+            batch.append(pending)
+
+        return batch
+
+    def _write_batch(self, batch):
+        # Positions the request stopped waiting for were cancelled and are not written.
+        batch = [x for x in batch if x.claim()]
+        if len(batch) == 0:
+            return
+
+        for attempt in range(self.write_retries + 1):
+            try:
+                with transaction.atomic():
+                    Position.objects.bulk_create([x.position for x in batch])
+
+            except (OperationalError, InterfaceError):
+                # The database connection was lost. Connect again and write the same batch.
+                log.warning('position buffer: database error writing %d rows, attempt %d of %d', len(batch), attempt + 1,
+                            self.write_retries + 1, exc_info=True)
+                self._reconnect()
+                if attempt < self.write_retries:
+                    time.sleep(self.retry_delay)
+
+            except Exception:
+                # A bad row fails the whole insert, so save the rows one at a time to find which ones are broken.
+                log.exception('position buffer: bulk insert of %d rows failed, retrying individually', len(batch))
+                break
+
+            else:
+                for pending in batch:
+                    pending.mark_written()
+                return
+
+        for pending in batch:
+            try:
+                pending.position.save()
+                pending.mark_written()
+            except Exception as e:
+                log.error('position buffer: dropped position for student %s at %s', pending.position.student_id,
+                          pending.position.timestamp, exc_info=True)
+                pending.mark_written(e)
+
+    def _reconnect(self):
+        # A connection inside of a transaction cannot be replaced, so it is left to the code that opened the transaction.
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+get_buffer_settings = functools.partial(get_app_settings, 'POSITION_WRITE_BUFFER', DEFAULT_BUFFER_SETTINGS)
+
+
+def get_position_buffer():
+    """
+        Function Summary: This function gets the buffer shared by every request thread in this process. The buffer is created and started on first use.
+
+        Args:
+
+        Return:
+            Type: PositionWriteBuffer
+            Data: The running buffer
+    """
+    global _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            buffer_settings = get_buffer_settings()
+            _buffer = PositionWriteBuffer(flush_interval_ms=buffer_settings['FLUSH_INTERVAL_MS'],
+                                          flush_size=buffer_settings['FLUSH_SIZE'],
+                                          max_size=buffer_settings['MAX_SIZE'],
+                                          put_timeout_ms=buffer_settings['PUT_TIMEOUT_MS'],
+                                          write_retries=buffer_settings['WRITE_RETRIES'],
+                                          retry_delay_ms=buffer_settings['RETRY_DELAY_MS'])
+            _buffer.start()
+
+            # Make sure nothing in the buffer is lost when the server shuts down.
+            atexit.register(_buffer.stop)
+
+    return _buffer
@@ -1,12 +1,25 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.dateparse import parse_datetime
+from django.db import transaction
 
-from api.auth_views import get_user_logged_in, get_user_by_session
+from api.auth_views import student_login_required
 from api.models import *
+from api.position_buffer import get_position_buffer, get_buffer_settings, ACK_ON_FLUSH
+from api.pagination import paginate_by_time
+from api.analytics.trajectory import simplify_trajectory
+from api.analytics.aggregate import aggregate_positions
+from api.analytics.colocation import forget_meeting_colocation
+from api.analytics.heatmap import forget_meeting_heatmaps
+from api.analytics.rollup import late_meetings, forget_meeting_rollups
+from api.analytics.attendance import forget_meeting_attendance
 
 from api.response_functions import Response
 import datetime
+import json
+import math
+import queue
+import re
 
 POSITION_ERRORS = {
     300: 'No logged in user',
@@ -15,14 +28,41 @@ POSITION_ERRORS = {
     303: 'Position does not exist',
     304: 'Invalid Student associated with Position',
     305: 'Invalid datetime object',
-    306: 'Invalid datetime format'
+    306: 'Invalid datetime format',
+    307: 'Not enough POST data',
+    308: 'Invalid positions data',
+    309: 'Too many positions in batch',
+    310: 'Position buffer is full',
+    311: 'Position could not be saved',
+    312: 'Invalid cursor',
+    313: 'Invalid limit',
+    314: 'Invalid simplify tolerance',
+    315: 'Invalid max_points',
+    316: 'Invalid bucket width'
 }
 
+# The most samples a client may send in a single call to 'position_create_batch'.
+POSITION_BATCH_MAX_SIZE = 1000
+
+# The most Positions that can be requested in one page from 'position_select_all'.
+POSITION_PAGE_MAX_SIZE = 5000
+
+# The number of Positions read from the database at a time when streaming.
+POSITION_STREAM_CHUNK_SIZE = 2000
+
+# The timestamp format used by clients when sending Position data.
+POSITION_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The units a bucket width can be given in, such as '10s', '1m', or '5m'. A width without a unit is in seconds.
+POSITION_BUCKET_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600}
+POSITION_BUCKET_FORMAT = re.compile(r'^(\d+)([smh]?)$')
+
 
 @csrf_exempt
+@student_login_required("GET", POSITION_ERRORS, 301, 300)
 def position_create(request):
     """
-        Function Summary: This function is used to create a Position object.
+        Function Summary: This function is used to create a Position object. If the write buffer is enabled in settings.py, the Position is handed to the buffer and written with other Positions in bulk.
         Path: 'api/position/create'
         Request Type: GET
         Required Login: True
@@ -36,43 +76,163 @@ def position_create(request):
             y -- The y position of the user
 
         Possible Error Codes:
-            300, 301, 302
+            300, 301, 302, 308, 310, 311
 
         Return:
             Type: JSON
-            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
+            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object. The 'id' will be null if the Position was buffered.
     """
-    # Ensure the API call is using a GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(301, POSITION_ERRORS))
-
-    # Ensure that the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(300, POSITION_ERRORS))
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
 
-    # Get the currently logged in Student object.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    # Ensure that the request's GET parameters include 'x' and 'y'.
+    if 'x' not in request.GET or 'y' not in request.GET:
+        return JsonResponse(Response.get_error_status(302, POSITION_ERRORS))
 
-    # Try to create a new Position object and return a success status.
+    # Ensure that the position is made of finite numbers.
     try:
-        x = request.GET['x']
-        y = request.GET['y']
-        time = datetime.datetime.now()
-        new_position = Position.objects.create(student=current_student, x=x, y=y, timestamp=time)
+        x = float(request.GET['x'])
+        y = float(request.GET['y'])
+    except ValueError:
+        return JsonResponse(Response.get_error_status(308, POSITION_ERRORS))
+
+    if not math.isfinite(x) or not math.isfinite(y):
+        return JsonResponse(Response.get_error_status(308, POSITION_ERRORS))
+
+    new_position = Position(student_id=current_student_id, x=x, y=y, timestamp=datetime.datetime.now())
+    buffer_settings = get_buffer_settings()
+
+    if not buffer_settings['ENABLED']:
         new_position.save()
 
-        success_status = Response.get_success_status()
-        success_status['data'] = new_position.to_dict()
-        return JsonResponse(success_status)
+    else:
+        # Hand the Position to the write buffer. An error status is returned if the buffer stays full.
+        try:
+            pending = get_position_buffer().put(new_position)
+        except queue.Full:
+            return JsonResponse(Response.get_error_status(310, POSITION_ERRORS))
 
-    except KeyError:
-        return JsonResponse(Response.get_error_status(302, POSITION_ERRORS))
+        # Wait for the buffer to write the Position if the reply should come after the flush. On a timeout the Position is
+        # taken out of the buffer so a retry by the client does not save it twice, unless the buffer is already writing it.
+        if buffer_settings['ACKNOWLEDGE'] == ACK_ON_FLUSH and not pending.wait(buffer_settings['ACK_TIMEOUT_MS'] / 1000):
+            if pending.cancel() or not pending.wait():
+                return JsonResponse(Response.get_error_status(311, POSITION_ERRORS))
+
+    # Return a success status with the Position data.
+    success_status = Response.get_success_status()
+    success_status['data'] = new_position.to_dict()
+    return JsonResponse(success_status)
+
+
+def parse_position_sample(sample):
+    """
+        Function Summary: This function is used to validate a single Position sample sent in a batch.
+
+        Args:
+            sample -- A dictionary containing the 'x', 'y', and 'timestamp' of the sample
+
+        Return:
+            Type: tuple
+            Data: A tuple of (status, values). The status is 'created' if the sample is valid, and 'values' will then contain the parsed x, y, and timestamp
+    """
+    if not isinstance(sample, dict) or 'x' not in sample or 'y' not in sample or 'timestamp' not in sample:
+        return 'missing data', None
+
+    try:
+        x = float(sample['x'])
+        y = float(sample['y'])
+    except (TypeError, ValueError):
+        return 'bad position', None
+
+    if not math.isfinite(x) or not math.isfinite(y):
+        return 'bad position', None
+
+    try:
+        timestamp = datetime.datetime.strptime(str(sample['timestamp']), POSITION_TIME_FORMAT)
+    except ValueError:
+        return 'bad timestamp', None
+
+    return 'created', (x, y, timestamp)
+
+
+@csrf_exempt
+@student_login_required("POST", POSITION_ERRORS, 301, 300)
+def position_create_batch(request):
+    """
+        Function Summary: This function is used to create many Position objects in a single call. All of the samples are validated first and the valid samples are then written with one bulk insert. Samples of Class meetings that ended more than DELAY_MINUTES of the movement rollups ago clear the heatmaps and co-location edges of those meetings.
+        Path: 'api/position/create_batch'
+        Request Type: POST
+        Required Login: True
+
+        Args:
+            request -- The request made to the server by the client
+
+        Required GET Parameters:
+            session_id -- The Session ID of the logged in user
+
+        Required POST Parameters:
+            positions -- A JSON array of objects, each containing an 'x', 'y', and 'timestamp' (YYYY-MM-DD HH:MM:SS)
+
+        Possible Error Codes:
+            300, 301, 307, 308, 309
+
+        Return:
+            Type: JSON
+            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON array with the status of each sample in the order they were sent.
+    """
+    # Ensure that the POST parameters include 'positions'.
+    if 'positions' not in request.POST:
+        return JsonResponse(Response.get_error_status(307, POSITION_ERRORS))
+
+    # Parse the samples and make sure they were sent as a JSON array.
+    try:
+        samples = json.loads(request.POST['positions'])
+    except ValueError:
+        return JsonResponse(Response.get_error_status(308, POSITION_ERRORS))
+
+    if not isinstance(samples, list):
+        return JsonResponse(Response.get_error_status(308, POSITION_ERRORS))
+
+    # Ensure the batch is not larger than the server allows.
+    if len(samples) > POSITION_BATCH_MAX_SIZE:
+        return JsonResponse(Response.get_error_status(309, POSITION_ERRORS))
+
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
+
+    # Validate every sample before anything is written.
+    statuses = []
+    new_positions = []
+    for sample in samples:
+        status, values = parse_position_sample(sample)
+        statuses.append(status)
+
+        if values is not None:
+            x, y, timestamp = values
+            new_positions.append(Position(student_id=current_student_id, x=x, y=y, timestamp=timestamp))
+
+    # Write all of the valid samples with a single insert.
+    with transaction.atomic():
+        Position.objects.bulk_create(new_positions)
+
+    # Samples of meetings that have already been computed make the cached grids, stored co-location edges, movement
+    # rollups, and Attendance out of date.
+    meetings = late_meetings(current_student_id, [x.timestamp for x in new_positions])
+    forget_meeting_heatmaps(meetings)
+    forget_meeting_colocation(meetings)
+    forget_meeting_rollups(meetings)
+    forget_meeting_attendance(meetings)
+
+    success_status = Response.get_success_status()
+    success_status['data'] = statuses
+    return JsonResponse(success_status)
 
 
 @csrf_exempt
+@student_login_required("GET", POSITION_ERRORS, 301, 300)
 def position_select_all(request):
     """
-        Function Summary: This function is used to get all of the Positions objects for a Student.
+        Function Summary: This function is used to get all of the Positions objects for a Student, ordered by time. The Positions can be paged through with 'limit' and 'cursor', or streamed to the client with 'stream'.
         Path: 'api/position/all'
         Request Type: GET
         Required Login: True
@@ -83,35 +243,58 @@ def position_select_all(request):
         Required GET Parameters:
             session_id -- The Session ID of the logged in user
 
+        Optional GET Parameters:
+            limit -- The most Positions to return. The response will contain a 'next_cursor' to get the next page with
+            cursor -- The 'next_cursor' from the previous page
+            stream -- If 'true', every Position after the cursor is streamed back as it is read from the database. 'limit' is ignored
+
         Possible Error Codes:
-            300, 301
+            300, 301, 312, 313
 
         Return:
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using a GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(301, POSITION_ERRORS))
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
 
-    # Ensure the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(300, POSITION_ERRORS))
+    stream = request.GET.get('stream', 'false').lower() == 'true'
+    cursor = request.GET.get('cursor') or None
 
-    # Get the currently logged in Student object.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    # Ensure that the limit is a positive number no larger than the server allows.
+    limit = None
+    if 'limit' in request.GET and not stream:
+        try:
+            limit = int(request.GET['limit'])
+        except ValueError:
+            return JsonResponse(Response.get_error_status(313, POSITION_ERRORS))
+
+        if limit < 1 or limit > POSITION_PAGE_MAX_SIZE:
+            return JsonResponse(Response.get_error_status(313, POSITION_ERRORS))
+
+    # Get the Positions after the cursor. Return an error status if the cursor is invalid.
+    try:
+        positions, next_cursor = paginate_by_time(Position.objects.filter(student_id=current_student_id), cursor, limit)
+    except ValueError:
+        return JsonResponse(Response.get_error_status(312, POSITION_ERRORS))
 
-    # Get all of the dictionary objects of the Position objects for the current Student.
-    positions = [x.to_dict() for x in Position.objects.filter(student=current_student)]
+    # Stream the Positions back in chunks so the whole list is never held in memory.
+    if stream:
+        position_dicts = (x.to_dict() for x in positions.iterator(chunk_size=POSITION_STREAM_CHUNK_SIZE))
+        return StreamingHttpResponse(Response.get_streaming_success_status(position_dicts), content_type='application/json')
 
     # Return the success status with the Position objects.
     success_status = Response.get_success_status()
-    success_status['data'] = positions
+    success_status['data'] = [x.to_dict() for x in positions]
+
+    if limit is not None:
+        success_status['next_cursor'] = next_cursor
 
     return JsonResponse(success_status)
 
 
 @csrf_exempt
+@student_login_required("GET", POSITION_ERRORS, 301, 300)
 def position_select_id(request):
     """
         Function Summary: This function is used to get a single Position object's information.
@@ -133,16 +316,8 @@ def position_select_id(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using a GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(301, POSITION_ERRORS))
-
-    # Ensure the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(300, POSITION_ERRORS))
-
-    # Get the currently logged in Student object.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
 
     # Ensure that the request's GET parameters include 'position_id'.
     if 'position_id' not in request.GET:
@@ -159,7 +334,7 @@ def position_select_id(request):
     current_position = position_lookup[0]
 
     # If the logged in User is not the User listed in the Position, return an error status
-    if current_position.student != current_student:
+    if current_position.student_id != current_student_id:
         return JsonResponse(Response.get_error_status(304, POSITION_ERRORS))
 
     # Return a success status with the Position data.
@@ -168,10 +343,59 @@ def position_select_id(request):
     return JsonResponse(success_status)
 
 
+def parse_time_range(parameters):
+    """
+        Function Summary: This function is used to read the 'start_time' and 'end_time' of the Position history endpoints.
+
+        Args:
+            parameters -- The GET parameters of the request
+
+        Return:
+            Type: tuple
+            Data: A tuple of (error_id, times). The error_id is None if both times are valid, and 'times' will then contain the start and end DateTime objects
+    """
+    # Ensure that 'start_time' and 'end_time' are in the GET parameters.
+    if 'start_time' not in parameters or 'end_time' not in parameters:
+        return 302, None
+
+    # Try to parse the start and end times into DateTime objects. Return error status if the string is invalid.
+    try:
+        start_datetime = datetime.datetime.strptime(parameters['start_time'], POSITION_TIME_FORMAT)
+        end_datetime = datetime.datetime.strptime(parameters['end_time'], POSITION_TIME_FORMAT)
+
+    except ValueError:
+        return 305, None
+
+    if start_datetime is None or end_datetime is None:
+        return 306, None
+
+    return None, (start_datetime, end_datetime)
+
+
+def parse_bucket_width(width):
+    """
+        Function Summary: This function is used to read a bucket width such as '10s', '1m', or '5m'.
+
+        Args:
+            width -- The bucket width string
+
+        Return:
+            Type: int
+            Data: The width in seconds, or None if the width is invalid
+    """
+    match = POSITION_BUCKET_FORMAT.match(width)
+    if match is None:
+        return None
+
+    seconds = int(match.group(1)) * POSITION_BUCKET_UNITS[match.group(2)]
+    return seconds if seconds > 0 else None
+
+
 @csrf_exempt
+@student_login_required("GET", POSITION_ERRORS, 301, 300)
 def position_summary(request):
     """
-        Function Summary: This function is used to get the Position history of a User.
+        Function Summary: This function is used to get the Position history of a User. The history can be simplified on the server to drop the jitter of a Student sitting in one place.
         Path: 'api/position/summary'
         Request Type: GET
         Required Login: True
@@ -184,41 +408,113 @@ def position_summary(request):
             start_time -- The start time to search for
             end_time -- The end time to search for
 
+        Optional GET Parameters:
+            simplify -- The Ramer-Douglas-Peucker tolerance. Positions closer than this to the simplified path are dropped
+            max_points -- The most Positions to return. The time range is split into this many buckets and the first Position of each is kept
+
         Possible Error Codes:
-            300, 301, 302, 305, 306
+            300, 301, 302, 305, 306, 314, 315
 
         Return:
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using a GET request.
-    if request.method != "GET":
-        return JsonResponse(Response.get_error_status(301, POSITION_ERRORS))
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
 
-    # Ensure the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(300, POSITION_ERRORS))
+    # Get the start and end time. Return an error status if either is missing or invalid.
+    error_id, times = parse_time_range(request.GET)
+    if error_id is not None:
+        return JsonResponse(Response.get_error_status(error_id, POSITION_ERRORS))
 
-    # Get the currently logged in Student object.
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    start_datetime, end_datetime = times
 
-    # Ensure that 'start_time' and 'end_time' are in the GET parameters.
-    if 'start_time' not in request.GET or 'end_time' not in request.GET:
-        return JsonResponse(Response.get_error_status(302, POSITION_ERRORS))
+    # Ensure that the simplify tolerance is a number that is not negative.
+    tolerance = None
+    if 'simplify' in request.GET:
+        try:
+            tolerance = float(request.GET['simplify'])
+        except ValueError:
+            return JsonResponse(Response.get_error_status(314, POSITION_ERRORS))
 
-    # Try to parse the start and end times into DateTime objects. Return error status if the string is invalid.
-    try:
-        start_datetime = datetime.datetime.strptime(request.GET['start_time'], '%Y-%m-%d %H:%M:%S')
-        end_datetime = datetime.datetime.strptime(request.GET['end_time'], '%Y-%m-%d %H:%M:%S')
+        if not math.isfinite(tolerance) or tolerance < 0:
+            return JsonResponse(Response.get_error_status(314, POSITION_ERRORS))
 
-    except ValueError:
-        return JsonResponse(Response.get_error_status(305, POSITION_ERRORS))
+    # Ensure that the max_points is a positive number.
+    max_points = None
+    if 'max_points' in request.GET:
+        try:
+            max_points = int(request.GET['max_points'])
+        except ValueError:
+            return JsonResponse(Response.get_error_status(315, POSITION_ERRORS))
 
-    if start_datetime is None or end_datetime is None:
-        return JsonResponse(Response.get_error_status(306, POSITION_ERRORS))
+        if max_points < 1:
+            return JsonResponse(Response.get_error_status(315, POSITION_ERRORS))
+
+    positions = Position.objects.in_time_range(current_student_id, start_datetime, end_datetime, inclusive=False)
 
     # Return a success status with the position summary information.
     success_object = Response.get_success_status()
-    success_object['data'] = [x.to_dict() for x in Position.objects.filter(student=current_student, timestamp__gt=start_datetime, timestamp__lt=end_datetime).order_by('timestamp')]
+
+    if tolerance is None and max_points is None:
+        success_object['data'] = [x.to_dict() for x in positions]
+    else:
+        # Simplify the raw rows so no model objects are built for the Positions that are dropped.
+        rows = list(positions.values_list('id', 'timestamp', 'x', 'y'))
+        success_object['data'] = [{'id': position_id, 'student': current_student_id, 'timestamp': timestamp, 'x': x, 'y': y}
+                                  for position_id, timestamp, x, y in simplify_trajectory(rows, tolerance, max_points)]
+
+    return JsonResponse(success_object)
+
+
+@csrf_exempt
+@student_login_required("GET", POSITION_ERRORS, 301, 300)
+def position_aggregate(request):
+    """
+        Function Summary: This function is used to get the Position history of a User grouped into time buckets, such as where the Student was every minute. The grouping is done by the database.
+        Path: 'api/position/aggregate'
+        Request Type: GET
+        Required Login: True
+
+        Args:
+            request -- The request made to the server by the client
+
+        Required GET Parameters:
+            session_id -- The Session ID of the logged in user
+            start_time -- The start time to search for
+            end_time -- The end time to search for
+            bucket -- The width of each bucket, such as '10s', '1m', or '5m'
+
+        Possible Error Codes:
+            300, 301, 302, 305, 306, 316
+
+        Return:
+            Type: JSON
+            Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON array with the 'start', sample 'count', mean 'x' and 'y', and 'spread' of each bucket that has Positions.
+    """
+    # Get the ID of the currently logged in Student.
+    current_student_id = request.student_id
+
+    # Get the start and end time. Return an error status if either is missing or invalid.
+    error_id, times = parse_time_range(request.GET)
+    if error_id is not None:
+        return JsonResponse(Response.get_error_status(error_id, POSITION_ERRORS))
+
+    start_datetime, end_datetime = times
+
+    # Ensure that the 'bucket' is in the GET parameters.
+    if 'bucket' not in request.GET:
+        return JsonResponse(Response.get_error_status(302, POSITION_ERRORS))
+
+    # Ensure the bucket width is valid.
+    width = parse_bucket_width(request.GET['bucket'])
+    if width is None:
+        return JsonResponse(Response.get_error_status(316, POSITION_ERRORS))
+
+    positions = Position.objects.in_time_range(current_student_id, start_datetime, end_datetime, inclusive=False)
+
+    # Return a success status with the buckets.
+    success_object = Response.get_success_status()
+    success_object['data'] = aggregate_positions(positions, start_datetime, width)
 
     return JsonResponse(success_object)
@@ -1,3 +1,8 @@
+from django.core.serializers.json import DjangoJSONEncoder
+
+# The number of objects written to the client at a time by a streaming response.
+STREAM_CHUNK_SIZE = 500
+
 
 class Response:
 
@@ -36,3 +41,33 @@ class Response:
         return {
             'status': 'success'
         }
+
+    @staticmethod
+    def get_streaming_success_status(data):
+        """
+            Function Summary: This static function is used to build a success status for API returns one piece at a time. It produces the same JSON as a JsonResponse of a success status with a 'data' list, without holding the whole list in memory.
+
+            Args:
+                data -- An iterable of JSON serializable objects
+
+            Return:
+                Type: generator
+                Data: The pieces of the JSON text, to be passed to a StreamingHttpResponse
+        """
+        encoder = DjangoJSONEncoder()
+        yield '{"status": "success", "data": ['
+
+        chunk = []
+        first = True
+        for item in data:
+            chunk.append(encoder.encode(item))
+
+            if len(chunk) == STREAM_CHUNK_SIZE:
+                yield ('' if first else ', ') + ', '.join(chunk)
+                chunk = []
+                first = False
+
+        if len(chunk) != 0:
+            yield ('' if first else ', ') + ', '.join(chunk)
+
+        yield ']}'
@@ -0,0 +1,219 @@
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.app_settings import get_app_settings
+from api.models import Session
+
+from collections import OrderedDict
+import threading
+import time
+
+# The default configuration of the cache. These can be overridden with API_SESSION_CACHE in settings.py. ENABLED is None
+# to only cache Sessions when CACHE_ALIAS names a cache shared by every server process, since a logout only clears the
+# entries of the process that handled it otherwise.
+DEFAULT_SESSION_CACHE_SETTINGS = {
+    'ENABLED': None,
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'CACHE_ALIAS': None
+}
+
+# The prefix of the keys stored in a shared Django cache.
+SHARED_CACHE_KEY_PREFIX = 'icba-session:'
+
+
+class SessionCache:
+
+    def __init__(self, max_size=10000, ttl=300, cache_alias=None, enabled=True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+        self._shared_cache = caches[cache_alias] if cache_alias else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def resolve(self, session_id):
+        """
+            Function Summary: This function is used to get the User and Student connected to a 'session_id'. The database is only queried when the Session is not already cached.
+
+            Args:
+                session_id -- The Session ID to look up
+
+            Return:
+                Type: tuple
+                Data: A tuple of (user_id, student_id), or None if the Session does not exist. The student_id is None for a User without a Student
+        """
+        key = str(session_id)
+
+        # Nothing is counted when the cache is disabled, so the stats only describe lookups that used it.
+        if self.enabled:
+            entry = self._get(key)
+            self._count(hit=entry is not None)
+
+            if entry is not None:
+                return entry
+
+        # Get the User and Student IDs with a single query.
+        try:
+            entry = Session.objects.filter(id=session_id).values_list('user_id', 'user__student__id').first()
+        except ValueError:
+            return None
+
+        if entry is None:
+            return None
+
+        # A User without a Student is not cached, so a Student made for them is seen on the next request.
+        if self.enabled and entry[1] is not None:
+            self._set(key, entry)
+
+        return entry
+
+    def invalidate(self, session_id):
+        """
+            Function Summary: This function is used to remove a Session from the cache. It should be called whenever a Session is deleted.
+
+            Args:
+                session_id -- The ID of the Session to remove
+
+            Return:
+                Type: None
+        """
+        key = str(session_id)
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+        if self._shared_cache is not None:
+            self._shared_cache.delete(SHARED_CACHE_KEY_PREFIX + key)
+
+    def clear(self):
+        """
+            Function Summary: This function is used to empty the cache and reset the hit and miss counters.
+
+            Args:
+
+            Return:
+                Type: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+            Function Summary: This function is used to get the hit and miss counters of the cache. Lookups made while the cache is disabled are not counted.
+
+            Args:
+
+            Return:
+                Type: dict
+                Data: A dictionary containing the 'hits', 'misses', and the number of Sessions held in this process as 'size'
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _get(self, key):
+        # Sessions are shared between worker processes through the Django cache when one is configured.
+        if self._shared_cache is not None:
+            entry = self._shared_cache.get(SHARED_CACHE_KEY_PREFIX + key)
+            return tuple(entry) if entry is not None else None
+
+        with self._lock:
+            cached = self._entries.get(key)
+
+            if cached is None:
+                return None
+
+            entry, expires = cached
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return entry
+
+    def _set(self, key, entry):
+        if self._shared_cache is not None:
+            self._shared_cache.set(SHARED_CACHE_KEY_PREFIX + key, entry, timeout=self.ttl)
+            return
+
+        with self._lock:
+            self._entries[key] = (entry, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            # Drop the least recently used Sessions once the cache is full.
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+
+def get_session_cache():
+    """
+        Function Summary: This function gets the Session cache for this process. It is created from API_SESSION_CACHE in settings.py on first use, and only caches Sessions when ENABLED is True or a shared CACHE_ALIAS is set.
+
+        Args:
+
+        Return:
+            Type: SessionCache
+            Data: The Session cache
+    """
+    global _session_cache
+
+    with _session_cache_lock:
+        if _session_cache is None:
+            cache_settings = get_app_settings('API_SESSION_CACHE', DEFAULT_SESSION_CACHE_SETTINGS)
+            enabled = cache_settings['ENABLED']
+            if enabled is None:
+                enabled = cache_settings['CACHE_ALIAS'] is not None
+
+            _session_cache = SessionCache(max_size=cache_settings['MAX_SIZE'], ttl=cache_settings['TTL'],
+                                          cache_alias=cache_settings['CACHE_ALIAS'], enabled=enabled)
+
+    return _session_cache
+
+
+@receiver(post_delete, sender=Session)
+def invalidate_deleted_session(sender, instance, **kwargs):
+    """
+        Function Summary: This function removes a Session from the cache when it is deleted, such as on logout.
+
+        Args:
+            sender -- The Session model
+            instance -- The deleted Session object
+
+        Return:
+            Type: None
+    """
+    get_session_cache().invalidate(instance.id)
+
+
+@receiver(post_save, sender=Session)
+def invalidate_created_session(sender, instance, created, **kwargs):
+    """
+        Function Summary: This function removes a Session ID from the cache when a new Session is created with it. SQLite can reuse the ID of a Session that was removed without going through Django, which would otherwise leave the old User cached under it.
+
+        Args:
+            sender -- The Session model
+            instance -- The saved Session object
+            created -- Whether the Session was just created
+
+        Return:
+            Type: None
+    """
+    if created:
+        get_session_cache().invalidate(instance.id)
@@ -0,0 +1,272 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+
+from api.app_settings import get_app_settings
+from api.models import ClassEnrollment, Position, Survey, SurveyQuestion, SurveyInstance, SurveyEntryInstance, \
+    SurveyQuestionInstance, SurveyPositionInstance
+
+import datetime
+import functools
+
+# The most entries written with a single INSERT statement.
+ENTRY_CHUNK_SIZE = 500
+
+# The default configuration of the survey generation. These can be overridden with SURVEY_GENERATION in settings.py.
+DEFAULT_SURVEY_GENERATION_SETTINGS = {
+    'LEAD_MINUTES': 5,
+    'LOOKBACK_MINUTES': 60,
+    'SCHEDULE_SECONDS': 60
+}
+
+
+get_survey_generation_settings = functools.partial(get_app_settings, 'SURVEY_GENERATION', DEFAULT_SURVEY_GENERATION_SETTINGS)
+
+
+def chunk_list(items, chunk_size):
+    """
+        Function Summary: This function is used to split a list into smaller lists.
+
+        Args:
+            items -- The list to split
+            chunk_size -- The most items in each smaller list
+
+        Return:
+            Type: generator
+            Data: Lists of at most 'chunk_size' items, in order
+    """
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
+
+def insert_entry_parents(survey_instance, count, last_id=0):
+    """
+        Function Summary: This function is used to insert 'count' SurveyEntryInstance rows for a SurveyInstance with one statement.
+
+        Args:
+            survey_instance -- The SurveyInstance the entries belong to
+            count -- The number of rows to insert
+            last_id -- The highest ID of the entries already inserted for the SurveyInstance
+
+        Return:
+            Type: list
+            Data: The IDs of the new rows in the order they were inserted
+    """
+    parents = SurveyEntryInstance.objects.bulk_create(
+        [SurveyEntryInstance(survey_instance=survey_instance) for i in range(count)])
+
+    # Databases that return IDs from a bulk insert (PostgreSQL) fill them in. Otherwise read them back in insert order.
+    if parents[0].id is not None:
+        return [x.id for x in parents]
+
+    return list(SurveyEntryInstance.objects.filter(survey_instance=survey_instance, id__gt=last_id).order_by('id')
+                .values_list('id', flat=True))
+
+
+def insert_entry_children(model, field_name, rows):
+    """
+        Function Summary: This function is used to insert the child rows of SurveyEntryInstance subclasses. Django can not bulk create multi-table inherited models, so the rows are written with one executemany call.
+
+        Args:
+            model -- The child model, SurveyQuestionInstance or SurveyPositionInstance
+            field_name -- The name of the foreign key stored on the child, such as 'question'
+            rows -- A list of (parent ID, foreign key ID) tuples
+
+        Return:
+            Type: None
+    """
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (quote_name(model._meta.db_table),
+                                                       quote_name(model._meta.pk.column),
+                                                       quote_name(model._meta.get_field(field_name).column))
+
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def insert_entries(survey_instance, model, field_name, ids, chunk_size=ENTRY_CHUNK_SIZE, last_id=0):
+    """
+        Function Summary: This function is used to add an entry to a SurveyInstance for each ID, inserted in chunks.
+
+        Args:
+            survey_instance -- The SurveyInstance the entries belong to
+            model -- The entry model, SurveyQuestionInstance or SurveyPositionInstance
+            field_name -- The name of the foreign key stored on the entry, such as 'question'
+            ids -- The IDs of the objects to add an entry for
+            chunk_size -- The most entries inserted with one statement
+            last_id -- The highest ID of the entries already inserted for the SurveyInstance
+
+        Return:
+            Type: int
+            Data: The highest ID of the entries of the SurveyInstance after the insert
+    """
+    for chunk in chunk_list(ids, chunk_size):
+        parent_ids = insert_entry_parents(survey_instance, len(chunk), last_id)
+        insert_entry_children(model, field_name, list(zip(parent_ids, chunk)))
+        last_id = parent_ids[-1]
+
+    return last_id
+
+
+def create_survey_instance(survey, student_id, question_ids, position_ids, chunk_size=ENTRY_CHUNK_SIZE):
+    """
+        Function Summary: This function is used to create a SurveyInstance with a SurveyQuestionInstance for every question and a SurveyPositionInstance for every position. The entries are inserted in chunks inside a single transaction, so a Survey with thousands of positions takes a handful of statements instead of two per entry.
+
+        Args:
+            survey -- The Survey to create the SurveyInstance for
+            student_id -- The ID of the Student taking the Survey
+            question_ids -- The IDs of the SurveyQuestion objects to add
+            position_ids -- The IDs of the Position objects to add
+            chunk_size -- The most entries inserted with one statement
+
+        Return:
+            Type: SurveyInstance
+            Data: The new SurveyInstance. Raises IntegrityError if the Student already has a SurveyInstance of the Survey today
+    """
+    with transaction.atomic():
+        survey_instance = SurveyInstance.objects.create(survey=survey, student_id=student_id)
+        last_id = insert_entries(survey_instance, SurveyQuestionInstance, 'question', list(question_ids), chunk_size)
+        insert_entries(survey_instance, SurveyPositionInstance, 'position', list(position_ids), chunk_size, last_id)
+
+    return survey_instance
+
+
+def add_new_positions(survey_instance, start_time, end_time, chunk_size=ENTRY_CHUNK_SIZE):
+    """
+        Function Summary: This function is used to add the Positions of the Student in a Class meeting that were saved after their SurveyInstance was made, such as when it was made before the meeting ended. Positions get higher IDs as they are saved, so only the ones after the highest Position already in the SurveyInstance are added.
+
+        Args:
+            survey_instance -- The SurveyInstance
+            start_time -- The start of the meeting
+            end_time -- The end of the meeting
+            chunk_size -- The most entries inserted with one statement
+
+        Return:
+            Type: int
+            Data: The number of Positions added
+    """
+    with transaction.atomic():
+        # Lock the SurveyInstance so two requests at once do not both add the same Positions.
+        list(SurveyInstance.objects.select_for_update().filter(id=survey_instance.id).values_list('id', flat=True))
+
+        last_position_id = SurveyPositionInstance.objects.filter(survey_instance=survey_instance) \
+            .aggregate(last=Max('position_id'))['last'] or 0
+        position_ids = list(Position.objects.in_time_range(survey_instance.student_id, start_time, end_time)
+                            .filter(id__gt=last_position_id).values_list('id', flat=True))
+
+        if len(position_ids) != 0:
+            last_id = SurveyEntryInstance.objects.filter(survey_instance=survey_instance).aggregate(last=Max('id'))['last'] or 0
+            insert_entries(survey_instance, SurveyPositionInstance, 'position', position_ids, chunk_size, last_id)
+
+    return len(position_ids)
+
+
+def create_meeting_survey_instances(survey, window, student_ids, chunk_size=ENTRY_CHUNK_SIZE):
+    """
+        Function Summary: This function is used to create the SurveyInstance of every Student at a Class meeting that does not have one yet. The SurveyInstances, entries, and Positions of all of the Students are read and written in bulk, so the number of statements does not grow with the number of Students.
+
+        Args:
+            survey -- The Survey of the Class
+            window -- A (date, start datetime, end datetime) tuple from 'Class.get_meeting_windows()'
+            student_ids -- The IDs of the Students enrolled in the Class
+            chunk_size -- The most rows inserted with one statement
+
+        Return:
+            Type: int
+            Data: The number of SurveyInstances created
+    """
+    meeting_date, start_time, end_time = window
+    question_ids = None
+
+    while True:
+        existing = SurveyInstance.objects.filter(survey=survey, date_generated=meeting_date, student_id__in=student_ids) \
+            .values_list('student_id', flat=True)
+        missing_ids = sorted(set(student_ids) - set(existing))
+
+        if len(missing_ids) == 0:
+            return 0
+
+        if question_ids is None:
+            question_ids = list(SurveyQuestion.objects.filter(survey=survey).order_by('id').values_list('id', flat=True))
+        positions = list(Position.objects.filter(student_id__in=missing_ids, timestamp__gte=start_time, timestamp__lte=end_time)
+                         .order_by('student_id', 'timestamp').values_list('student_id', 'id'))
+
+        # A SurveyInstance made at the same time by 'end_session_create_survey_instance()' makes the insert fail. The
+        # transaction is rolled back and the Students still missing one are tried again.
+        try:
+            with transaction.atomic():
+                insert_meeting_survey_instances(survey, meeting_date, missing_ids, question_ids, positions, chunk_size)
+            return len(missing_ids)
+        except IntegrityError:
+            if not SurveyInstance.objects.filter(survey=survey, date_generated=meeting_date, student_id__in=missing_ids).exists():
+                raise
+
+
+def insert_meeting_survey_instances(survey, meeting_date, student_ids, question_ids, positions, chunk_size):
+    """
+        Function Summary: This function is used to insert the SurveyInstances of Students at a Class meeting with their entries. It must be run in a transaction, since the rows are read back by the IDs of the SurveyInstances it inserted.
+
+        Args:
+            survey -- The Survey of the Class
+            meeting_date -- The date of the meeting
+            student_ids -- The IDs of the Students that do not have a SurveyInstance yet, sorted
+            question_ids -- The IDs of the questions of the Survey
+            positions -- A list of (Student ID, Position ID) tuples of the Positions in the meeting, ordered by Student
+            chunk_size -- The most rows inserted with one statement
+
+        Return:
+            Type: None
+    """
+    SurveyInstance.objects.bulk_create([SurveyInstance(survey=survey, student_id=x, date_generated=meeting_date)
+                                        for x in student_ids], batch_size=chunk_size)
+    # Each Student has one SurveyInstance of the Survey per date, so these are the rows just inserted.
+    instance_ids = dict(SurveyInstance.objects.filter(survey=survey, date_generated=meeting_date, student_id__in=student_ids)
+                        .values_list('student_id', 'id'))
+
+    # A question entry for each question of each SurveyInstance, then a position entry for each Position.
+    question_rows = [(instance_ids[x], y) for x in student_ids for y in question_ids]
+    position_rows = [(instance_ids[x], y) for x, y in positions]
+
+    SurveyEntryInstance.objects.bulk_create([SurveyEntryInstance(survey_instance_id=x[0])
+                                             for x in question_rows + position_rows], batch_size=chunk_size)
+    parent_ids = list(SurveyEntryInstance.objects.filter(survey_instance_id__in=list(instance_ids.values()))
+                      .order_by('id').values_list('id', flat=True))
+
+    insert_entry_children(SurveyQuestionInstance, 'question', list(zip(parent_ids, [x[1] for x in question_rows])))
+    insert_entry_children(SurveyPositionInstance, 'position',
+                          list(zip(parent_ids[len(question_rows):], [x[1] for x in position_rows])))
+
+
+def generate_finished_meetings(now=None):
+    """
+        Function Summary: This function is used to create the SurveyInstances of the Class meetings that ended in the last LOOKBACK_MINUTES or end in the next LEAD_MINUTES, so the Students' surveys are ready when they end their sessions at the end of the meeting. Positions saved after a SurveyInstance is made are added to it by 'add_new_positions()'. Meetings that already have their SurveyInstances are skipped.
+
+        Args:
+            now -- The current time, or None for 'datetime.datetime.now()'
+
+        Return:
+            Type: int
+            Data: The number of SurveyInstances created
+    """
+    generation_settings = get_survey_generation_settings()
+    now = now or datetime.datetime.now()
+    start = now - datetime.timedelta(minutes=generation_settings['LOOKBACK_MINUTES'])
+    end = now + datetime.timedelta(minutes=generation_settings['LEAD_MINUTES'])
+    created = 0
+
+    # A Class only uses its first Survey, the same as 'end_session_create_survey_instance()'.
+    surveys = {}
+    for survey in Survey.objects.select_related('associated_class').prefetch_related('associated_class__days_of_the_week') \
+            .order_by('id'):
+        surveys.setdefault(survey.associated_class_id, survey)
+
+    for survey in surveys.values():
+        windows = [x for x in survey.associated_class.get_meeting_windows(start.date(), end.date()) if start < x[2] <= end]
+        if len(windows) == 0:
+            continue
+
+        student_ids = list(ClassEnrollment.objects.filter(class_enrolled_id=survey.associated_class_id)
+                           .values_list('student_id', flat=True))
+        for window in windows:
+            created += create_meeting_survey_instances(survey, window, student_ids)
+
+    return created
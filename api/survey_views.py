@@ -1,10 +1,14 @@
 from .models import Class, Student, Survey, SurveyQuestion, SurveyResponse, SurveyInstance, SurveyQuestionInstance, \
     SurveyPositionInstance, Position, SurveyEntryInstance
 from .response_functions import Response
-from api.auth_views import get_user_logged_in, get_user_by_session
+from api.analytics.survey import invalidate_survey_analytics
+from api.auth_views import student_login_required
+from api.survey_generation import create_survey_instance, add_new_positions
 
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Case, When, Value, TextField
 
 import datetime
 
@@ -22,11 +26,15 @@ SURVEY_ERRORS = {
     510: 'Survey Instance already exists'
 }
 
+# The most existing SurveyResponse objects changed with a single UPDATE.
+RESPONSE_UPDATE_CHUNK_SIZE = 250
+
 
 @csrf_exempt
+@student_login_required("POST", SURVEY_ERRORS, 501, 500)
 def end_session_create_survey_instance(request):
     """
-        Function Summary: This function is used to end a Student's session and to create a Survey Instance for them to add responses to.
+        Function Summary: This function is used to end a Student's session and to get the Survey Instance for them to add responses to. The Survey Instances are made in bulk by the 'generate_survey_instances' task shortly before the Class ends, so this normally returns the one already made for today with the positions saved since then added, and only creates it when the task has not run yet.
         Path: '/api/survey/generate
         Request Type: POST
         Required Login: True
@@ -41,20 +49,12 @@ def end_session_create_survey_instance(request):
             class -- The class from which the student was in during the session
 
         Possible Error Codes:
-            500, 501, 503, 504, 506, 510
+            500, 501, 503, 504, 506
 
         Return:
             Type: JSON
-            Data: A JSON object with a 'status' at the top level.
+            Data: A JSON object with a 'status' at the top level, and the SurveyInstance in 'data'.
     """
-    # Ensure that the API call is using POST request.
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(501, SURVEY_ERRORS))
-
-    # Ensure that the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(500, SURVEY_ERRORS))
-
     # Ensure 'class' is in POST parameters
     if 'class' not in request.POST:
         return JsonResponse(Response.get_error_status(503, SURVEY_ERRORS))
@@ -76,38 +76,38 @@ def end_session_create_survey_instance(request):
 
     # Add the SurveyQuestions from Survey object.
     current_survey = survey_lookup[0]
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
-
-    if len(SurveyInstance.objects.filter(survey=current_survey, student=current_student,
-                                         date_generated=datetime.datetime.now().date())) != 0:
-        return JsonResponse(Response.get_error_status(510, SURVEY_ERRORS))
-
-    # Create a new SurveyInstance object.
-    new_survey_instance = SurveyInstance.objects.create(survey=current_survey, student=current_student)
-    new_survey_instance.save()
+    current_student_id = request.student_id
+
+    start_time_stamp = datetime.datetime.now().replace(hour=current_class.start_time.hour, minute=current_class.start_time.minute)
+    end_time_stamp = datetime.datetime.now().replace(hour=current_class.end_time.hour, minute=current_class.end_time.minute)
+
+    # Use the SurveyInstance made for today before the Class ended, with the positions saved since then.
+    survey_instance = SurveyInstance.objects.filter(survey=current_survey, student_id=current_student_id,
+                                                    date_generated=datetime.datetime.now().date()).for_serialization().first()
+    if survey_instance is not None:
+        add_new_positions(survey_instance, start_time_stamp, end_time_stamp)
+    else:
+        # Get the IDs of the Survey's questions and of all of the positions between the start and end timestamp.
+        question_ids = SurveyQuestion.objects.filter(survey=current_survey).order_by('id').values_list('id', flat=True)
+        position_ids = Position.objects.in_time_range(current_student_id, start_time_stamp, end_time_stamp) \
+            .values_list('id', flat=True)
+
+        # Create the SurveyInstance with a question entry for each question and a position entry for each position. If the
+        # task made it at the same time, use that one.
+        try:
+            survey_instance = create_survey_instance(current_survey, current_student_id, question_ids, position_ids)
+        except IntegrityError:
+            survey_instance = SurveyInstance.objects.get(survey=current_survey, student_id=current_student_id,
+                                                         date_generated=datetime.datetime.now().date())
+        survey_instance = SurveyInstance.objects.for_serialization().get(id=survey_instance.id)
 
-    # Create SurveyQuestionInstance objects for each question associated with the Survey.
-    for question in SurveyQuestion.objects.filter(survey=current_survey):
-        new_question_instance = SurveyQuestionInstance.objects.create(survey_instance=new_survey_instance,
-                                                                      question=question)
-        new_question_instance.save()
-
-    start_time_stamp = datetime.datetime.now().replace(hour=current_class.start_time.hour,
-                                              minute=current_class.start_time.minute)
-    end_time_stamp = datetime.datetime.now().replace(hour=current_class.end_time.hour,
-                                            minute=current_class.end_time.minute)
-
-    # Get all of the positions between the start and end timestamp and create position questions.
-    for position in Position.objects.filter(student=current_student, timestamp__lte=end_time_stamp,
-                                            timestamp__gte=start_time_stamp):
-        new_position_instance = SurveyPositionInstance.objects.create(survey_instance=new_survey_instance,
-                                                                      position=position)
-        new_position_instance.save()
-
-    return JsonResponse(Response.get_success_status())
+    success_object = Response.get_success_status()
+    success_object['data'] = survey_instance.to_dict()
+    return JsonResponse(success_object)
 
 
 @csrf_exempt
+@student_login_required("POST", SURVEY_ERRORS, 501, 500)
 def get_all_open_survey_instances(request):
     """
         Function Summary: This function is used to get all of the open SurveyInstance objects for a Student.
@@ -126,35 +126,28 @@ def get_all_open_survey_instances(request):
 
         Return:
             Type: JSON
-            Data: A JSON object with a 'status' at the top level. Will contain a 'data' JSON object.
+            Data: A JSON object with a 'status' at the top level. Will contain a 'data' JSON object. Each SurveyInstance includes its 'open_count' and 'answered_count'.
     """
-    # Ensure that the API call is using POST request.
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(501, SURVEY_ERRORS))
-
-    # Ensure that the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(500, SURVEY_ERRORS))
-
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
-    # Get all of the Survey Instance objects with a question or position without response objects.
-    open_surveys = set()
-    for survey in SurveyInstance.objects.filter(student=current_student):
-        for question in SurveyQuestionInstance.objects.filter(survey_instance=survey):
-            if len(SurveyResponse.objects.filter(survey_entry_id=question.id)) == 0:
-                open_surveys.add(survey)
+    # Get all of the Survey Instance objects with a question or position without response objects in one query.
+    open_surveys = SurveyInstance.objects.filter(student_id=current_student_id).open().for_serialization() \
+        .order_by('date_generated', 'id')
 
-        for position in SurveyPositionInstance.objects.filter(survey_instance=survey):
-            if len(SurveyResponse.objects.filter(survey_entry_id=position.id)) == 0:
-                open_surveys.add(survey)
+    surveys = []
+    for survey in open_surveys:
+        survey_dict = survey.to_dict()
+        survey_dict['open_count'] = survey.entry_count - survey.answered_count
+        survey_dict['answered_count'] = survey.answered_count
+        surveys.append(survey_dict)
 
     success_object = Response.get_success_status()
-    success_object['data'] = [x.to_dict() for x in open_surveys]
+    success_object['data'] = surveys
     return JsonResponse(success_object)
 
 
 @csrf_exempt
+@student_login_required("POST", SURVEY_ERRORS, 501, 500)
 def get_survey_by_id(request):
     """
         Function Summary: This function is used to get the information about a SurveyInstance given an id.
@@ -176,44 +169,43 @@ def get_survey_by_id(request):
 
         Return:
             Type: JSON
-            Data: A JSON object with a 'status' at the top level. Will contain a 'data' JSON object.
+            Data: A JSON object with a 'status' at the top level. Will contain a 'data' JSON object. Each question and position includes its submitted 'response', or null if it has not been answered.
     """
-    # Ensure that the API call is using POST request.
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(501, SURVEY_ERRORS))
-
-    # Ensure that the user is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(500, SURVEY_ERRORS))
-
     # Ensure 'class' is in POST parameters
     if 'survey_id' not in request.POST:
         return JsonResponse(Response.get_error_status(503, SURVEY_ERRORS))
 
-    survey_lookup = SurveyInstance.objects.filter(id=request.POST['survey_id'])
+    survey_lookup = SurveyInstance.objects.filter(id=request.POST['survey_id']).for_serialization()
 
     if len(survey_lookup) == 0:
         return JsonResponse(Response.get_error_status(504, SURVEY_ERRORS))
 
     current_survey = survey_lookup[0]
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # Check that the Survey object belongs to the student logged in.
-    if current_student != current_survey.student:
+    if current_student_id != current_survey.student_id:
         return JsonResponse(Response.get_error_status(509, SURVEY_ERRORS))
 
-    # Get all open question instance objects and append it to the question list
+    # Get the responses already submitted for the SurveyInstance, keeping the newest response of each entry.
+    responses = {}
+    for response in SurveyResponse.objects.filter(survey_entry__survey_instance=current_survey).order_by('id'):
+        responses[response.survey_entry_id] = {'id': response.id, 'response': response.response}
+
+    # Get all question instance objects and append it to the question list
     questions = []
-    for question_instance in SurveyQuestionInstance.objects.filter(survey_instance=current_survey):
+    for question_instance in SurveyQuestionInstance.objects.filter(survey_instance=current_survey).select_related('question'):
         question_dict = question_instance.to_dict()
         question_dict['question'] = question_instance.question.to_dict()
+        question_dict['response'] = responses.get(question_instance.id)
         questions.append(question_dict)
 
-    # Get all open position instance objects and append it to the position list
+    # Get all position instance objects and append it to the position list
     positions = []
-    for position_instance in SurveyPositionInstance.objects.filter(survey_instance=current_survey):
+    for position_instance in SurveyPositionInstance.objects.filter(survey_instance=current_survey).select_related('position'):
         position_dict = position_instance.to_dict()
         position_dict['position'] = position_instance.position.to_dict()
+        position_dict['response'] = responses.get(position_instance.id)
         positions.append(position_dict)
 
     survey = current_survey.to_dict()
@@ -224,7 +216,67 @@ def get_survey_by_id(request):
     return JsonResponse(success_object)
 
 
+def save_survey_responses(survey_instance, responses):
+    """
+        Function Summary: This function is used to create or update the SurveyResponse objects of a SurveyInstance. The entries and existing responses are looked up with two queries and everything is written in one transaction.
+
+        Args:
+            survey_instance -- The SurveyInstance the responses are for
+            responses -- A dictionary of entry ID to response text
+
+        Return:
+            Type: dict
+            Data: A dictionary of entry ID to 'created', 'updated', or 'bad id' if the entry does not belong to the SurveyInstance
+    """
+    statuses = {}
+    entry_ids = {}
+
+    for key in responses:
+        try:
+            entry_ids[key] = int(key)
+        except ValueError:
+            statuses[key] = "bad id"
+
+    # Get the entries of this SurveyInstance that were sent and which of them already have a response.
+    valid_ids = set(SurveyEntryInstance.objects.filter(survey_instance=survey_instance, id__in=entry_ids.values())
+                    .values_list('id', flat=True))
+    answered_ids = set(SurveyResponse.objects.filter(survey_entry_id__in=valid_ids)
+                       .values_list('survey_entry_id', flat=True))
+
+    # Keys such as '1' and '01' are the same entry, so the responses are kept by entry ID and the last key sent wins.
+    new_responses = {}
+    updated_responses = {}
+
+    for key, entry_id in entry_ids.items():
+        if entry_id not in valid_ids:
+            statuses[key] = "bad id"
+        elif entry_id in answered_ids:
+            updated_responses[entry_id] = responses[key]
+            statuses[key] = "updated"
+        else:
+            new_responses[entry_id] = SurveyResponse(survey_entry_id=entry_id, response=responses[key])
+            statuses[key] = "created"
+
+    with transaction.atomic():
+        SurveyResponse.objects.bulk_create(list(new_responses.values()))
+
+        # Update the existing responses in chunks with a single UPDATE per chunk.
+        updated_ids = list(updated_responses)
+        for i in range(0, len(updated_ids), RESPONSE_UPDATE_CHUNK_SIZE):
+            chunk = updated_ids[i:i + RESPONSE_UPDATE_CHUNK_SIZE]
+            SurveyResponse.objects.filter(survey_entry_id__in=chunk).update(response=Case(
+                *[When(survey_entry_id=x, then=Value(updated_responses[x])) for x in chunk],
+                output_field=TextField()
+            ))
+
+    if len(new_responses) != 0 or len(updated_responses) != 0:
+        invalidate_survey_analytics(survey_instance.survey_id)
+
+    return statuses
+
+
 @csrf_exempt
+@student_login_required("POST", SURVEY_ERRORS, 501, 500)
 def add_responses_to_survey(request):
     """
         Function Summary: This function is used to add SurveyResponse objects.
@@ -242,7 +294,7 @@ def add_responses_to_survey(request):
             survey_id -- The Class ID of the associated Survey Instance object
 
         Optional POST Parameters:
-            <SURVEYQUESTION_ID> -- The ID of a SurveyQuestion to attach a response to
+            <SURVEYENTRY_ID> -- The ID of a question or position entry of the SurveyInstance to attach a response to. An existing response is replaced
 
         Possible Error Codes:
             500, 501, 503, 504, 509
@@ -251,14 +303,6 @@ def add_responses_to_survey(request):
             Type: JSON
             Data: A JSON object with a 'status' at the top level. Will contain a "data" JSON object.
     """
-    # Ensure the API call is using POST request.
-    if request.method != "POST":
-        return JsonResponse(Response.get_error_status(501, SURVEY_ERRORS))
-
-    # Ensure the User is logged in.
-    if not get_user_logged_in(request):
-        return JsonResponse(Response.get_error_status(500, SURVEY_ERRORS))
-
     # Ensure 'survey' in POST parameters.
     if 'survey_id' not in request.POST:
         return JsonResponse(Response.get_error_status(503, SURVEY_ERRORS))
@@ -270,33 +314,16 @@ def add_responses_to_survey(request):
         return JsonResponse(Response.get_error_status(504, SURVEY_ERRORS))
 
     survey_instance = survey_lookup[0]
-    current_student = Student.objects.get(user=get_user_by_session(request.GET['session_id']))
+    current_student_id = request.student_id
 
     # Return an error if the survey instance
-    if current_student != survey_instance.student:
+    if current_student_id != survey_instance.student_id:
         return JsonResponse(Response.get_error_status(509, SURVEY_ERRORS))
 
     # Make a copy of the POST parameters and remove the 'survey' parameter.
     post_data = request.POST.copy()
     del post_data['survey_id']
 
-    data_object = {}
-
-    for entry_id, response in post_data.items():
-        response_exists = len(SurveyResponse.objects.filter(survey_entry_id=entry_id)) != 0
-
-        if len(SurveyEntryInstance.objects.filter(id=entry_id)) == 0:
-            data_object[entry_id] = "bad id"
-            continue
-
-        if response_exists:
-            SurveyResponse.objects.get(survey_entry_id=entry_id).response = response
-            data_object[entry_id] = "updated"
-        else:
-            new_response = SurveyResponse.objects.create(survey_entry_id=entry_id, response=response)
-            new_response.save()
-            data_object[entry_id] = "created"
-
     success_object = Response.get_success_status()
-    success_object['data'] = data_object
+    success_object['data'] = save_survey_responses(survey_instance, post_data)
     return JsonResponse(success_object)
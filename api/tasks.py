@@ -0,0 +1,62 @@
+from workers import task
+
+from api.analytics.attendance import attendance_finished_meetings
+from api.analytics.colocation import colocation_finished_meetings
+from api.analytics.rollup import get_rollup_settings, rollup_finished_meetings
+from api.survey_generation import generate_finished_meetings, get_survey_generation_settings
+
+# Import the tasks defined with the views and the email outbox so the workers register them as well.
+import api.auth_views
+import api.outbox
+
+
+@task(schedule=get_rollup_settings()['SCHEDULE_SECONDS'])
+def rollup_movement():
+    """
+        Function Summary: This function is a task that fills in the MovementRollup objects of the Class meetings that have ended. It is run by the Django-Workers library every SCHEDULE_SECONDS.
+
+        Args:
+
+        Return:
+            Type: None
+    """
+    rollup_finished_meetings()
+
+
+@task(schedule=get_rollup_settings()['SCHEDULE_SECONDS'])
+def update_colocation():
+    """
+        Function Summary: This function is a task that stores the co-location edges of the Class meetings that have ended, so the proximity graph of each Class grows as new meetings finish. It is run by the Django-Workers library every SCHEDULE_SECONDS of the movement rollups.
+
+        Args:
+
+        Return:
+            Type: None
+    """
+    colocation_finished_meetings()
+
+
+@task(schedule=get_rollup_settings()['SCHEDULE_SECONDS'])
+def update_attendance():
+    """
+        Function Summary: This function is a task that fills in the Attendance of the Class meetings that have ended. It is run by the Django-Workers library every SCHEDULE_SECONDS of the movement rollups.
+
+        Args:
+
+        Return:
+            Type: None
+    """
+    attendance_finished_meetings()
+
+
+@task(schedule=get_survey_generation_settings()['SCHEDULE_SECONDS'])
+def generate_survey_instances():
+    """
+        Function Summary: This function is a task that creates the SurveyInstances of every Student at the Class meetings that have ended, so ending a session only has to look up the SurveyInstance. It is run by the Django-Workers library every SCHEDULE_SECONDS of the survey generation.
+
+        Args:
+
+        Return:
+            Type: None
+    """
+    generate_finished_meetings()
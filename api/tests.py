@@ -3,4 +3,6 @@ from api_tests.demographic_tests import *
 from api_tests.position_tests import *
 from api_tests.class_tests import *
 from api_tests.survey_tests import *
-from api_tests.feedback_tests import *
\ No newline at end of file
+from api_tests.feedback_tests import *
+from api_tests.analytics_tests import *
+from api_tests.outbox_tests import *
\ No newline at end of file
@@ -27,13 +27,17 @@ urlpatterns = [
 
     # Position Requests
     path('position/create', position_create),
+    path('position/create_batch', position_create_batch),
     path('position/select/all', position_select_all),
     path('position/select', position_select_id),
     path('position/summary', position_summary),
+    path('position/aggregate', position_aggregate),
 
     # Class Requests
     path('class/select/all', class_select_all),
     path('class/movement_summary', class_summarize_movement),
+    path('class/meeting_summary', class_meeting_summary),
+    path('class/attendance', class_select_attendance),
 
     # Survey Requests
     path('survey/respond', add_responses_to_survey),
@@ -0,0 +1,632 @@
+from api.analytics.trajectory import simplify_rdp, decimate_by_time, simplify_trajectory
+from api.analytics.aggregate import aggregate_in_database, aggregate_with_numpy
+from api.analytics.heatmap import histogram_in_chunks, class_heatmap, forget_meeting_heatmaps
+from api.analytics.rollup import summarize_path, rollup_finished_meetings, meeting_summaries
+from api.analytics.movement import compute_movement_metrics, metrics_by_student, student_movement_metrics, \
+    class_movement_metrics, get_metric_settings
+from api.analytics.colocation import grid_pairs, colocation_edges, class_colocation, colocation_finished_meetings, \
+    get_colocation_settings, meeting_colocation
+from api.analytics.attendance import update_attendance, attendance_finished_meetings
+from api.analytics.survey import parse_range_responses, load_range_responses, histogram, compute_survey_analytics, \
+    survey_range_analytics
+from api.models import Student, Position, Class, ClassEnrollment, DayLookup, MovementRollup, Attendance, Survey, \
+    SurveyQuestion, SurveyInstance, SurveyQuestionInstance, SurveyResponse, Demographic, GenderLookup, GradeYearLookup, \
+    RaceLookup, EthnicityLookup, ColocationMeeting, ColocationEdge
+from api.survey_views import save_survey_responses
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection
+from django.core.cache import caches
+from django.contrib.auth.models import User
+
+from datetime import datetime, date, time, timedelta
+from unittest import mock
+import numpy as np
+
+
+class TrajectoryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.start_time = datetime(2019, 4, 1, 9, 0)
+
+    def test_straight_line_simplified(self):
+        points = np.array([[i, 2 * i] for i in range(100)], dtype=float)
+
+        self.assertEqual([0, 99], list(simplify_rdp(points, 0.01)))
+
+    def test_corner_kept(self):
+        points = np.array([[0, 0], [1, 0.01], [2, 0], [2, 1], [2, 2]], dtype=float)
+
+        self.assertEqual([0, 2, 4], list(simplify_rdp(points, 0.1)))
+
+    def test_jitter_removed(self):
+        random = np.random.RandomState(0)
+        seat = np.array([5.0, 5.0]) + random.uniform(-0.05, 0.05, (500, 2))
+        points = np.vstack(([0.0, 0.0], seat, [10.0, 10.0]))
+
+        self.assertLess(len(simplify_rdp(points, 0.5)), 10)
+
+    def test_repeated_point(self):
+        points = np.array([[1, 1], [3, 1], [1, 1]], dtype=float)
+
+        self.assertEqual([0, 1, 2], list(simplify_rdp(points, 0.5)))
+
+    def test_decimate_by_time(self):
+        times = np.arange(1000, dtype=float)
+        indexes = decimate_by_time(times, 10)
+
+        self.assertEqual(list(range(0, 1000, 100)), list(indexes))
+
+    def test_decimate_under_cap(self):
+        self.assertEqual([0, 1, 2], list(decimate_by_time(np.arange(3, dtype=float), 10)))
+
+    def test_simplify_trajectory_rows(self):
+        rows = [(i, self.start_time + timedelta(seconds=i), i, 0) for i in range(50)]
+
+        self.assertEqual([0, 49], [x[0] for x in simplify_trajectory(rows, tolerance=0.1)])
+        self.assertEqual(5, len(simplify_trajectory(rows, max_points=5)))
+        self.assertEqual(rows, simplify_trajectory(rows))
+        self.assertEqual([], simplify_trajectory([], tolerance=1, max_points=5))
+
+
+class AggregateTests(TestCase):
+
+    def setUp(self):
+        self.new_student = Student.objects.create(user=User.objects.create(username='test_user'))
+        self.start_time = datetime(2019, 4, 1, 9, 0)
+
+        random = np.random.RandomState(0)
+        Position.objects.bulk_create([
+            Position(student=self.new_student, x=random.uniform(0, 10), y=random.uniform(0, 10),
+                     timestamp=self.start_time + timedelta(milliseconds=int(random.uniform(0, 3600000))))
+            for i in range(500)
+        ])
+
+    def test_numpy_matches_database(self):
+        positions = Position.objects.filter(student=self.new_student)
+
+        for width in [1, 10, 60, 300]:
+            database_buckets = aggregate_in_database(positions, self.start_time, width)
+            numpy_buckets = aggregate_with_numpy(positions, self.start_time, width)
+
+            self.assertEqual([x['start'] for x in database_buckets], [x['start'] for x in numpy_buckets])
+            self.assertEqual([x['count'] for x in database_buckets], [x['count'] for x in numpy_buckets])
+            self.assertTrue(np.allclose([x['spread'] for x in database_buckets], [x['spread'] for x in numpy_buckets]))
+            self.assertTrue(np.allclose([x['x'] for x in database_buckets], [x['x'] for x in numpy_buckets]))
+
+    def test_no_positions(self):
+        positions = Position.objects.filter(student=self.new_student, x__lt=0)
+
+        self.assertEqual([], aggregate_in_database(positions, self.start_time, 60))
+        self.assertEqual([], aggregate_with_numpy(positions, self.start_time, 60))
+
+
+class HeatmapTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+
+        admin = User.objects.create(username='test_admin')
+        self.new_student = Student.objects.create(user=User.objects.create(username='test_user'))
+        other_student = Student.objects.create(user=User.objects.create(username='other_user'))
+
+        # The Class meets on Mondays and Wednesdays from 9:00 to 10:00
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0),
+                                              end_time=time(10, 0))
+        self.new_class.days_of_the_week.set([0, 2])
+        ClassEnrollment.objects.create(student=self.new_student, class_enrolled=self.new_class)
+
+        monday = datetime(2019, 4, 1, 9, 30)
+        Position.objects.bulk_create([
+            # In the Monday and Wednesday meetings
+            Position(student=self.new_student, x=1, y=1, timestamp=monday),
+            Position(student=self.new_student, x=1.2, y=1.3, timestamp=monday + timedelta(minutes=5)),
+            Position(student=self.new_student, x=19, y=10, timestamp=monday + timedelta(days=2)),
+            Position(student=self.new_student, x=50, y=50, timestamp=monday + timedelta(days=2, minutes=1)),
+            # Outside of the meetings
+            Position(student=self.new_student, x=1, y=1, timestamp=monday + timedelta(hours=2)),
+            Position(student=self.new_student, x=1, y=1, timestamp=monday + timedelta(days=1)),
+            # A Student that is not enrolled
+            Position(student=other_student, x=1, y=1, timestamp=monday),
+        ])
+
+    def test_chunks_match_single_histogram(self):
+        random = np.random.RandomState(0)
+        points = random.uniform(-1, 11, (1000, 2))
+
+        grid, outside = histogram_in_chunks([tuple(x) for x in points], 10, [[0, 10], [0, 10]], 7)
+        expected, x_edges, y_edges = np.histogram2d(points[:, 0], points[:, 1], bins=10, range=[[0, 10], [0, 10]])
+
+        self.assertTrue(np.array_equal(expected.astype(np.int64), grid))
+        self.assertEqual(1000 - int(expected.sum()), outside)
+
+    def test_class_heatmap(self):
+        heatmap = class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)
+
+        self.assertEqual(2, heatmap['meetings'])
+        self.assertEqual(3, heatmap['total'])
+        self.assertEqual(1, heatmap['outside'])
+        self.assertEqual(2, heatmap['counts'][1][1])
+        self.assertEqual(1, heatmap['counts'][10][19])
+        self.assertEqual(2, heatmap['max'])
+
+    @override_settings(POSITION_HEATMAP={'CACHE_ALIAS': 'default'})
+    def test_finished_meetings_stored(self):
+        class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)
+
+        # Only the Class days are loaded once every meeting grid is cached
+        with self.assertNumQueries(1):
+            heatmap = class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)
+
+        self.assertEqual(3, heatmap['total'])
+        self.assertEqual(1, class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=10)['outside'])
+
+        # A grid cached with one extent is not used for another.
+        with self.settings(POSITION_HEATMAP={'CACHE_ALIAS': 'default', 'EXTENT': [[0, 10], [0, 10]]}):
+            self.assertEqual(2, class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)['outside'])
+
+        # A late Position gives the meeting a new version, so every grid of it is counted again.
+        Position.objects.create(student=self.new_student, x=1, y=1, timestamp=datetime(2019, 4, 1, 9, 45))
+        forget_meeting_heatmaps([(self.new_class, date(2019, 4, 1))])
+        self.assertEqual(4, class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)['total'])
+        self.assertEqual(4, class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=10)['total'])
+
+    def test_not_cached_without_shared_cache(self):
+        class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)
+        forget_meeting_heatmaps([(self.new_class, date(2019, 4, 1))])
+
+        # Without a shared cache the Positions of every meeting are read on each request.
+        with self.assertNumQueries(3):
+            self.assertEqual(3, class_heatmap(self.new_class, date(2019, 4, 1), date(2019, 4, 7), bins=20)['total'])
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create(username='test_admin')
+        self.new_student = Student.objects.create(user=User.objects.create(username='test_user'))
+        other_student = Student.objects.create(user=User.objects.create(username='other_user'))
+
+        # The Class meets on Mondays and Wednesdays from 9:00 to 10:00
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0),
+                                              end_time=time(10, 0))
+        self.new_class.days_of_the_week.set([0, 2])
+        ClassEnrollment.objects.create(student=self.new_student, class_enrolled=self.new_class)
+        ClassEnrollment.objects.create(student=other_student, class_enrolled=self.new_class)
+
+        # Two minutes near (1, 1), then a short stop at (4, 5) on Monday and one Position on Wednesday.
+        monday = datetime(2019, 4, 1, 9, 0)
+        self.rows = [(monday, 1, 1), (monday + timedelta(minutes=1), 1.1, 1), (monday + timedelta(minutes=2), 1, 1),
+                     (monday + timedelta(minutes=3), 4, 5), (monday + timedelta(minutes=3, seconds=30), 4, 5)]
+        Position.objects.bulk_create([Position(student=self.new_student, timestamp=x[0], x=x[1], y=x[2]) for x in self.rows] +
+                                     [Position(student=self.new_student, timestamp=monday + timedelta(days=2), x=2, y=2)])
+
+    def test_summarize_path(self):
+        summary = summarize_path(self.rows, 0.5, 60)
+
+        self.assertEqual(5, summary['sample_count'])
+        self.assertEqual(self.rows[-1][0], summary['last_timestamp'])
+        self.assertAlmostEqual(2.22, summary['centroid_x'])
+        self.assertAlmostEqual(5.2, summary['path_length'])
+        self.assertEqual((1, 4, 1, 5), (summary['min_x'], summary['max_x'], summary['min_y'], summary['max_y']))
+        self.assertEqual(1, summary['dwell_count'])
+        self.assertEqual(120, summary['longest_dwell_seconds'])
+
+    def test_empty_path(self):
+        summary = summarize_path([], 0.5, 60)
+
+        self.assertEqual(0, summary['sample_count'])
+        self.assertIsNone(summary['path_length'])
+
+    def test_rollup_is_incremental(self):
+        # The Wednesday meeting has not been over for long enough yet.
+        self.assertEqual(2, rollup_finished_meetings(datetime(2019, 4, 3, 10, 5)))
+        self.assertEqual(4, MovementRollup.objects.count())
+        self.assertEqual(5, MovementRollup.objects.get(student=self.new_student, meeting_date=date(2019, 4, 1)).sample_count)
+
+        self.assertEqual(0, rollup_finished_meetings(datetime(2019, 4, 3, 10, 5)))
+        self.assertEqual(1, rollup_finished_meetings(datetime(2019, 4, 3, 10, 30)))
+        self.assertEqual(6, MovementRollup.objects.count())
+
+    def test_summaries_fall_back_to_raw_positions(self):
+        rollup_finished_meetings(datetime(2019, 4, 3, 10, 5))
+
+        # The days of the Class, the MovementRollup objects, and the Positions of the meetings without one
+        with self.assertNumQueries(3):
+            summary = meeting_summaries(self.new_class, self.new_student.id, date(2019, 4, 1), date(2019, 4, 3))
+
+        self.assertEqual('rollup', summary['2019-04-01']['source'])
+        self.assertEqual('raw', summary['2019-04-03']['source'])
+        self.assertEqual(1, summary['2019-04-03']['sample_count'])
+        self.assertAlmostEqual(summarize_path(self.rows, 0.5, 60)['path_length'], summary['2019-04-01']['path_length'])
+
+
+class MovementMetricTests(TestCase):
+
+    def setUp(self):
+        self.metric_settings = dict(get_metric_settings(), ZONES=[{'name': 'front', 'x': [0, 20], 'y': [0, 5]}])
+
+        # A sample every 5 seconds, sitting at (1, 1) for 145 seconds and then at (5, 5) for 145 seconds.
+        start_time = datetime(2019, 4, 1, 9, 0)
+        self.rows = [(start_time + timedelta(seconds=5 * i), 1, 1) for i in range(30)] + \
+                    [(start_time + timedelta(seconds=150 + 5 * i), 5, 5) for i in range(30)]
+
+    def test_student_metrics(self):
+        metrics = student_movement_metrics(self.rows, self.metric_settings)
+
+        self.assertEqual(60, metrics['samples'])
+        self.assertEqual(295, metrics['tracked_seconds'])
+        self.assertAlmostEqual(4 * np.sqrt(2), metrics['distance'])
+        self.assertEqual({'count': 2, 'seconds': 290, 'longest': 145}, metrics['stationary'])
+        self.assertEqual({'front': 150}, metrics['zones'])
+        self.assertEqual(1, len(metrics['seat_changes']))
+        self.assertEqual(self.rows[30][0], metrics['seat_changes'][0]['time'])
+        self.assertEqual([5, 5], metrics['seat_changes'][0]['to'])
+
+    def test_long_gaps_not_counted(self):
+        rows = self.rows[:30] + [(x[0] + timedelta(minutes=10), x[1], x[2]) for x in self.rows[30:]]
+        metrics = student_movement_metrics(rows, self.metric_settings)
+
+        self.assertEqual(0, metrics['distance'])
+        self.assertEqual(290, metrics['tracked_seconds'])
+
+    def test_speed_percentiles(self):
+        random = np.random.RandomState(0)
+        students = np.repeat([3, 7], 500)
+        times = np.tile(np.arange(500, dtype=float), 2)
+        points = random.uniform(0, 1, (1000, 2))
+        meetings = np.zeros(1000, dtype=np.int64)
+
+        metrics = compute_movement_metrics(students, times, points, meetings, metric_settings=self.metric_settings)
+
+        for i, student_id in enumerate([3, 7]):
+            steps = np.diff(points[i * 500:(i + 1) * 500], axis=0)
+            speeds = np.hypot(steps[:, 0], steps[:, 1])
+
+            self.assertAlmostEqual(np.percentile(speeds, 50), metrics[student_id]['speed']['p50'])
+            self.assertAlmostEqual(np.percentile(speeds, 90), metrics[student_id]['speed']['p90'])
+            self.assertAlmostEqual(speeds.max(), metrics[student_id]['speed']['max'])
+
+        self.assertEqual(metrics, metrics_by_student(students, times, points, meetings, [3, 7], self.metric_settings))
+
+    def test_class_metrics(self):
+        admin = User.objects.create(username='test_admin')
+        new_student = Student.objects.create(user=User.objects.create(username='test_user'))
+        absent_student = Student.objects.create(user=User.objects.create(username='absent_user'))
+        other_student = Student.objects.create(user=User.objects.create(username='other_user'))
+
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0), end_time=time(10, 0))
+        new_class.days_of_the_week.set([0, 2])
+        ClassEnrollment.objects.create(student=new_student, class_enrolled=new_class)
+        ClassEnrollment.objects.create(student=absent_student, class_enrolled=new_class)
+
+        # The last sample of Monday and the first of Wednesday are far apart, but are in different meetings.
+        Position.objects.bulk_create([Position(student=new_student, timestamp=x[0], x=x[1], y=x[2]) for x in self.rows[:30]] +
+                                     [Position(student=new_student, timestamp=x[0] + timedelta(days=2), x=x[1], y=x[2]) for x in self.rows[30:]] +
+                                     [Position(student=new_student, timestamp=datetime(2019, 4, 1, 11, 0), x=9, y=9),
+                                      Position(student=other_student, timestamp=datetime(2019, 4, 1, 9, 0), x=9, y=9)])
+
+        meetings, metrics = class_movement_metrics(new_class, date(2019, 4, 1), date(2019, 4, 7))
+
+        self.assertEqual(2, meetings)
+        self.assertEqual({new_student.id, absent_student.id}, set(metrics.keys()))
+        self.assertEqual(60, metrics[new_student.id]['samples'])
+        self.assertEqual(0, metrics[new_student.id]['distance'])
+        self.assertEqual(1, len(metrics[new_student.id]['seat_changes']))
+        self.assertEqual(0, metrics[absent_student.id]['samples'])
+
+
+class ColocationTests(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create(username='test_admin')
+        self.students = [Student.objects.create(user=User.objects.create(username='test_user_' + str(i))) for i in range(3)]
+
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0),
+                                              end_time=time(10, 0))
+        self.new_class.days_of_the_week.set([0, 2])
+        for student in self.students:
+            ClassEnrollment.objects.create(student=student, class_enrolled=self.new_class)
+
+        # The first two Students sit together for a minute on Monday and Wednesday. The third sits across the room.
+        positions = []
+        for day in [0, 2]:
+            for i in range(6):
+                timestamp = datetime(2019, 4, 1 + day, 9, 0) + timedelta(seconds=10 * i)
+                positions += [Position(student=self.students[0], timestamp=timestamp, x=2, y=2),
+                              Position(student=self.students[1], timestamp=timestamp + timedelta(seconds=1), x=2.5, y=2),
+                              Position(student=self.students[2], timestamp=timestamp, x=15, y=15)]
+        Position.objects.bulk_create(positions)
+
+    def test_grid_matches_pairwise(self):
+        random = np.random.RandomState(0)
+        points = random.uniform(-5, 5, (300, 2))
+        buckets = random.randint(0, 3, 300)
+
+        expected = [(i, j) for i in range(300) for j in range(i + 1, 300)
+                    if buckets[i] == buckets[j] and np.hypot(*(points[i] - points[j])) <= 1]
+
+        self.assertEqual(expected, sorted(map(tuple, grid_pairs(points, buckets, 1).tolist())))
+
+    def test_edges_use_same_bucket(self):
+        points = np.array([[0, 0], [0.5, 0], [0, 0], [0.5, 0]], dtype=float)
+        edges = colocation_edges(np.array([1, 2, 1, 2]), np.array([0, 5, 20, 35], dtype=float), points, 0,
+                                 get_colocation_settings())
+
+        self.assertEqual([[1, 2, 10]], edges)
+
+    def test_class_graph(self):
+        graph = class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 7))
+
+        self.assertEqual(2, graph['meetings'])
+        self.assertEqual([{'source': self.students[0].id, 'target': self.students[1].id, 'seconds': 120}], graph['edges'])
+        self.assertEqual([], class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 7), min_seconds=121)['edges'])
+
+    def test_finished_meetings_stored(self):
+        # The meetings of the last week, from Wednesday the 27th to Monday the 1st.
+        self.assertEqual(2, colocation_finished_meetings(datetime(2019, 4, 2, 12, 0)))
+        self.assertEqual(0, colocation_finished_meetings(datetime(2019, 4, 2, 12, 0)))
+        self.assertEqual(1, colocation_finished_meetings(datetime(2019, 4, 3, 12, 0)))
+
+        self.assertEqual(3, ColocationMeeting.objects.count())
+
+        # The days of the Class, the stored meetings, and the sums of their edges are read once every meeting is stored.
+        with self.assertNumQueries(3):
+            graph = class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 7))
+
+        self.assertEqual(120, graph['edges'][0]['seconds'])
+
+    def test_stored_with_configuration(self):
+        class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 7))
+        self.assertEqual(2, ColocationMeeting.objects.count())
+        self.assertEqual(2, ColocationEdge.objects.count())
+
+        # A different radius does not use the edges stored with the old one.
+        with self.settings(COLOCATION={'RADIUS': 0.1}):
+            self.assertEqual([], class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 7))['edges'])
+
+        self.assertEqual(4, ColocationMeeting.objects.count())
+        self.assertEqual(2, ColocationEdge.objects.count())
+
+    def test_stored_at_same_time(self):
+        def store_at_same_time(window, student_ids, colocation_settings):
+            # The workers store the meeting while the request is computing it.
+            edges = meeting_colocation(window, student_ids, colocation_settings)
+            ColocationMeeting.objects.bulk_create([ColocationMeeting(associated_class=self.new_class, meeting_date=window[0],
+                                                                     radius=colocation_settings['RADIUS'],
+                                                                     bucket_seconds=colocation_settings['BUCKET_SECONDS'])])
+            meeting = ColocationMeeting.objects.get(meeting_date=window[0])
+            ColocationEdge.objects.bulk_create([ColocationEdge(meeting=meeting, source_id=a, target_id=b, seconds=seconds)
+                                                for a, b, seconds in edges])
+            return edges
+
+        # The insert of the request fails because the meeting was stored by the workers first.
+        with mock.patch('api.analytics.colocation.meeting_colocation', side_effect=store_at_same_time), \
+                mock.patch.object(ColocationMeeting.objects, 'create', side_effect=IntegrityError):
+            graph = class_colocation(self.new_class, date(2019, 4, 1), date(2019, 4, 1))
+
+        self.assertEqual(60, graph['edges'][0]['seconds'])
+        self.assertEqual(1, ColocationMeeting.objects.count())
+
+
+class AttendanceTests(TestCase):
+
+    def setUp(self):
+        admin = User.objects.create(username='test_admin')
+        self.new_student = Student.objects.create(user=User.objects.create(username='test_user'))
+        self.absent_student = Student.objects.create(user=User.objects.create(username='absent_user'))
+        other_student = Student.objects.create(user=User.objects.create(username='other_user'))
+
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0),
+                                              end_time=time(10, 0))
+        self.new_class.days_of_the_week.set([0, 2])
+        ClassEnrollment.objects.create(student=self.new_student, class_enrolled=self.new_class)
+        ClassEnrollment.objects.create(student=self.absent_student, class_enrolled=self.new_class)
+
+        # Twelve samples on Monday and three on Wednesday. The rest are outside of the meetings or of a Student not enrolled.
+        monday = datetime(2019, 4, 1, 9, 5)
+        Position.objects.bulk_create([Position(student=self.new_student, timestamp=monday + timedelta(minutes=i), x=1, y=1)
+                                      for i in range(12)] +
+                                     [Position(student=self.new_student, timestamp=monday + timedelta(days=2, minutes=i), x=1, y=1)
+                                      for i in range(3)] +
+                                     [Position(student=self.new_student, timestamp=monday + timedelta(hours=2, minutes=i), x=1, y=1)
+                                      for i in range(12)] +
+                                     [Position(student=self.new_student, timestamp=monday + timedelta(days=1, minutes=i), x=1, y=1)
+                                      for i in range(12)] +
+                                     [Position(student=other_student, timestamp=monday + timedelta(minutes=i), x=1, y=1)
+                                      for i in range(12)])
+
+    def test_attendance(self):
+        self.assertEqual(2, update_attendance(self.new_class, date(2019, 4, 1), date(2019, 4, 7), datetime(2019, 4, 7)))
+        self.assertEqual(4, Attendance.objects.count())
+
+        monday = Attendance.objects.get(student=self.new_student, meeting_date=date(2019, 4, 1))
+        self.assertTrue(monday.present)
+        self.assertEqual(12, monday.sample_count)
+        self.assertEqual(datetime(2019, 4, 1, 9, 5), monday.arrival)
+        self.assertEqual(datetime(2019, 4, 1, 9, 16), monday.departure)
+
+        wednesday = Attendance.objects.get(student=self.new_student, meeting_date=date(2019, 4, 3))
+        self.assertFalse(wednesday.present)
+        self.assertEqual(3, wednesday.sample_count)
+
+        absent = Attendance.objects.get(student=self.absent_student, meeting_date=date(2019, 4, 1))
+        self.assertEqual((False, 0, None), (absent.present, absent.sample_count, absent.arrival))
+
+    def test_only_new_meetings_computed(self):
+        # The Wednesday meeting has not ended yet.
+        self.assertEqual(2, attendance_finished_meetings(datetime(2019, 4, 3, 9, 30)))
+        self.assertEqual(0, attendance_finished_meetings(datetime(2019, 4, 3, 9, 30)))
+        self.assertEqual(1, attendance_finished_meetings(datetime(2019, 4, 3, 12, 0)))
+
+        # A Student enrolling later gets the meetings they are missing.
+        late_student = Student.objects.create(user=User.objects.create(username='late_user'))
+        ClassEnrollment.objects.create(student=late_student, class_enrolled=self.new_class)
+
+        self.assertEqual(3, attendance_finished_meetings(datetime(2019, 4, 3, 12, 0)))
+        self.assertEqual(3, Attendance.objects.filter(student=late_student).count())
+
+    def test_constant_query_count(self):
+        def count_queries():
+            Attendance.objects.all().delete()
+            with CaptureQueriesContext(connection) as queries:
+                update_attendance(self.new_class, date(2019, 4, 1), date(2019, 4, 7), datetime(2019, 4, 7))
+            return len(queries.captured_queries)
+
+        before = count_queries()
+        for i in range(10):
+            student = Student.objects.create(user=User.objects.create(username='extra_user_' + str(i)))
+            ClassEnrollment.objects.create(student=student, class_enrolled=self.new_class)
+
+        self.assertEqual(before, count_queries())
+        self.assertEqual(24, Attendance.objects.count())
+
+
+class SurveyAnalyticsTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        admin = User.objects.create(username='test_admin')
+        new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0), end_time=time(10, 0))
+        self.new_survey = Survey.objects.create(admin=admin, associated_class=new_class)
+        self.range_question = SurveyQuestion.objects.create(survey=self.new_survey, prompt_text='How full was the room?', type='RA')
+        self.text_question = SurveyQuestion.objects.create(survey=self.new_survey, prompt_text='Anything else?', type='SA')
+
+        lookups = [x.objects.create(name='Test') for x in (GenderLookup, GradeYearLookup, EthnicityLookup, RaceLookup)]
+        self.other_gender = GenderLookup.objects.create(name='Other')
+
+        self.students = []
+        for i in range(4):
+            student = Student.objects.create(user=User.objects.create(username='test_user_' + str(i)))
+            self.students.append(student)
+
+            # The last Student has no Demographic.
+            if i < 3:
+                Demographic.objects.create(student=student, age=20, gender=self.other_gender if i == 2 else lookups[0],
+                                           grade_year=lookups[1], ethnicity=lookups[2], race=lookups[3], major='Biology')
+
+        # Student i answers i + 1 on April 1st and i + 2 on April 3rd.
+        for day, offset in ((date(2019, 4, 1), 1), (date(2019, 4, 3), 2)):
+            for i, student in enumerate(self.students):
+                self.add_response(student, day, str(i + offset))
+
+        self.add_response(self.students[0], date(2019, 4, 3), 'not a number')
+        self.add_response(self.students[0], date(2019, 4, 3), 'Fine', self.text_question)
+
+    def add_response(self, student, day, text, question=None):
+        survey_instance = SurveyInstance.objects.get_or_create(survey=self.new_survey, student=student, date_generated=day)[0]
+        entry = SurveyQuestionInstance.objects.create(survey_instance=survey_instance, question=question or self.range_question)
+        SurveyResponse.objects.create(survey_entry=entry, response=text)
+        return survey_instance, entry
+
+    def test_parse(self):
+        self.assertEqual([1.5, 3.0], list(parse_range_responses([' 1.5', '3'])))
+        self.assertTrue(np.isnan(parse_range_responses(['1', 'nan', 'inf', 'seven'])[1:]).all())
+
+    def test_histogram(self):
+        self.assertEqual({'edges': [0.5, 1.5, 2.5, 3.5], 'counts': [1, 0, 2]}, histogram(np.array([1.0, 3.0, 3.0]), 10))
+        self.assertEqual([2, 1], histogram(np.array([0.0, 0.5, 10.0]), 2)['counts'])
+
+    def test_responses_read_with_instances(self):
+        # A SurveyInstance without responses, generated before the others, does not shift the dates of the responses.
+        SurveyInstance.objects.create(survey=self.new_survey, student=self.students[1], date_generated=date(2019, 3, 1))
+
+        with self.assertNumQueries(1):
+            responses = load_range_responses(self.new_survey, [self.range_question.id])
+
+        order = np.lexsort((responses['values'], responses['students'], responses['dates']))
+        self.assertEqual(['2019-04-01'] * 4 + ['2019-04-03'] * 5, [str(x) for x in responses['dates'][order]])
+        self.assertEqual([x.id for x in self.students] + [self.students[0].id] + [x.id for x in self.students],
+                         list(responses['students'][order]))
+
+    def test_analytics(self):
+        analytics = compute_survey_analytics(self.new_survey)
+
+        self.assertEqual(9, analytics['responses'])
+        self.assertEqual(1, len(analytics['questions']))
+
+        question = analytics['questions'][0]
+        self.assertEqual((8, 1), (question['count'], question['invalid']))
+        self.assertEqual(3.0, question['mean'])
+        self.assertEqual(3.0, question['median'])
+        self.assertEqual((1.0, 5.0), (question['min'], question['max']))
+        self.assertEqual(2.0, question['percentiles']['25'])
+        self.assertEqual([1, 2, 2, 2, 1], question['histogram']['counts'])
+
+        self.assertEqual([{'value': '2019-04-01', 'count': 4, 'mean': 2.5, 'median': 2.5},
+                          {'value': '2019-04-03', 'count': 4, 'mean': 3.5, 'median': 3.5}], question['trend'])
+
+        genders = {x['value']: x for x in question['demographics']['gender']}
+        self.assertEqual((4, 2.0), (genders['Test']['count'], genders['Test']['mean']))
+        self.assertEqual((2, 3.5), (genders['Other']['count'], genders['Other']['mean']))
+        self.assertEqual((2, 4.5), (genders[None]['count'], genders[None]['mean']))
+        self.assertEqual([None, '20'], [x['value'] for x in question['demographics']['age']])
+
+    def test_constant_query_count(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                compute_survey_analytics(self.new_survey)
+            return len(queries.captured_queries)
+
+        before = count_queries()
+        for student in self.students:
+            self.add_response(student, date(2019, 4, 5), '3')
+
+        self.assertEqual(before, count_queries())
+
+    def test_cache_invalidated(self):
+        self.assertEqual(8, survey_range_analytics(self.new_survey)['questions'][0]['count'])
+
+        # A cached result only reads the version of the Survey.
+        with self.assertNumQueries(1):
+            survey_range_analytics(self.new_survey)
+
+        # Saving responses through the API makes the cached result stale.
+        survey_instance = SurveyInstance.objects.create(survey=self.new_survey, student=self.students[1])
+        entry = SurveyQuestionInstance.objects.create(survey_instance=survey_instance, question=self.range_question)
+        save_survey_responses(survey_instance, {str(entry.id): '5'})
+        self.assertEqual(9, survey_range_analytics(self.new_survey)['questions'][0]['count'])
+
+        save_survey_responses(survey_instance, {str(entry.id): 'unsure'})
+        self.assertEqual(8, survey_range_analytics(self.new_survey)['questions'][0]['count'])
+
+        # So does changing a question.
+        self.text_question.type = 'RA'
+        self.text_question.save()
+        self.assertEqual(2, len(survey_range_analytics(self.new_survey)['questions']))
+
+    def test_cache_shared_through_version(self):
+        survey_range_analytics(self.new_survey)
+
+        # Another process sees the version change even though its own cache was never told.
+        version = Survey.objects.get(id=self.new_survey.id).analytics_version
+        Survey.objects.filter(id=self.new_survey.id).update(analytics_version=version + 1)
+        SurveyResponse.objects.filter(survey_entry__surveyquestioninstance__question=self.range_question).update(response='5')
+        self.assertEqual(5.0, survey_range_analytics(self.new_survey)['questions'][0]['mean'])
+
+    def test_demographic_change_invalidates(self):
+        genders = {x['value']: x for x in survey_range_analytics(self.new_survey)['questions'][0]['demographics']['gender']}
+        self.assertEqual(4, genders['Test']['count'])
+
+        demographic = Demographic.objects.get(student=self.students[0])
+        demographic.gender = self.other_gender
+        demographic.save()
+
+        genders = {x['value']: x for x in survey_range_analytics(self.new_survey)['questions'][0]['demographics']['gender']}
+        self.assertEqual((2, 4), (genders['Test']['count'], genders['Other']['count']))
@@ -1,9 +1,14 @@
-from api.auth_views import login, register, logout, request_password_reset, reset_password
+from api.auth_views import login, register, logout, request_password_reset, reset_password, get_user_logged_in, \
+    student_login_required, AUTH_ERRORS
+from api.middleware import SessionStudentMiddleware
 from api.models import Student, Session
+from api.session_cache import SessionCache, get_session_cache
+import api.session_cache
 
 from django.test import TestCase
 from django.test.client import RequestFactory
 from django.contrib.auth.models import User
+from django.http import JsonResponse
 
 import json
 
@@ -190,6 +195,147 @@ class UserLogoutTests(TestCase):
         self.assertTrue('"error_id": 100' in response.content.decode('utf-8'))
 
 
+class SessionCacheTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.new_session = Session.objects.create(user=self.new_user)
+
+        get_session_cache().clear()
+
+    def test_session_resolved(self):
+        session_cache = SessionCache()
+
+        self.assertEqual((self.new_user.id, self.new_student.id), session_cache.resolve(self.new_session.id))
+        self.assertIsNone(session_cache.resolve(self.new_session.id + 1))
+        self.assertIsNone(session_cache.resolve('not a session'))
+
+    def test_hits_and_misses(self):
+        session_cache = SessionCache()
+
+        with self.assertNumQueries(1):
+            session_cache.resolve(self.new_session.id)
+            session_cache.resolve(self.new_session.id)
+            session_cache.resolve(str(self.new_session.id))
+
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1}, session_cache.get_stats())
+
+    def test_disabled_not_counted(self):
+        session_cache = SessionCache(enabled=False)
+        session_cache.resolve(self.new_session.id)
+        session_cache.resolve(self.new_session.id)
+
+        self.assertEqual({'hits': 0, 'misses': 0, 'size': 0}, session_cache.get_stats())
+
+    def test_expired_entry(self):
+        session_cache = SessionCache(ttl=-1)
+        session_cache.resolve(self.new_session.id)
+        session_cache.resolve(self.new_session.id)
+
+        self.assertEqual(0, session_cache.get_stats()['hits'])
+
+    def test_least_recently_used_dropped(self):
+        other_session = Session.objects.create(user=self.new_user)
+        session_cache = SessionCache(max_size=1)
+        session_cache.resolve(self.new_session.id)
+        session_cache.resolve(other_session.id)
+
+        self.assertEqual(1, session_cache.get_stats()['size'])
+
+        with self.assertNumQueries(1):
+            session_cache.resolve(self.new_session.id)
+
+    def test_user_without_student_not_cached(self):
+        new_user = User.objects.create(username='test_admin', email='admin@test.com')
+        new_session = Session.objects.create(user=new_user)
+        session_cache = SessionCache()
+
+        self.assertEqual((new_user.id, None), session_cache.resolve(new_session.id))
+        self.assertEqual(0, session_cache.get_stats()['size'])
+
+        new_student = Student.objects.create(user=new_user)
+        self.assertEqual((new_user.id, new_student.id), session_cache.resolve(new_session.id))
+
+    def test_disabled_without_shared_cache(self):
+        api.session_cache._session_cache = None
+        self.addCleanup(setattr, api.session_cache, '_session_cache', None)
+
+        with self.settings(API_SESSION_CACHE={}):
+            self.assertFalse(get_session_cache().enabled)
+
+        api.session_cache._session_cache = None
+        with self.settings(API_SESSION_CACHE={'CACHE_ALIAS': 'default'}):
+            self.assertTrue(get_session_cache().enabled)
+
+    def test_logout_invalidates_session(self):
+        request = rf.get('/api/logout', {'session_id': self.new_session.id})
+
+        self.assertTrue(get_user_logged_in(request))
+
+        logout(request)
+
+        self.assertFalse(get_user_logged_in(request))
+
+
+class StudentLoginRequiredTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.new_session = Session.objects.create(user=self.new_user)
+
+        @student_login_required("GET", AUTH_ERRORS, 101, 109)
+        def view(request):
+            return JsonResponse({'student': request.student.user.username, 'student_id': request.student_id})
+
+        self.view = view
+        get_session_cache().clear()
+
+    def test_student_attached(self):
+        request = rf.get('/api/test?session_id=' + str(self.new_session.id))
+
+        # Session lookup, then the Student and User in a single joined query
+        with self.assertNumQueries(2):
+            response = self.view(request)
+
+        self.assertEqual({'student': 'test_user', 'student_id': self.new_student.id},
+                         json.loads(response.content.decode('utf-8')))
+
+    def test_wrong_request_type(self):
+        request = rf.post('/api/test?session_id=' + str(self.new_session.id))
+        response = self.view(request)
+
+        self.assertTrue('"error_id": 101' in response.content.decode('utf-8'))
+
+    def test_no_logged_in_user(self):
+        request = rf.get('/api/test')
+        response = self.view(request)
+
+        self.assertTrue('"error_id": 109' in response.content.decode('utf-8'))
+
+    def test_user_without_student(self):
+        other_user = User.objects.create(username='other_user')
+        other_session = Session.objects.create(user=other_user)
+        request = rf.get('/api/test?session_id=' + str(other_session.id))
+        response = self.view(request)
+
+        self.assertTrue('"error_id": 109' in response.content.decode('utf-8'))
+
+    def test_middleware_resolves_once(self):
+        request = rf.get('/api/test?session_id=' + str(self.new_session.id))
+        middleware = SessionStudentMiddleware(self.view)
+
+        # The decorator reuses what the middleware attached, so the Session is only looked up once
+        with self.assertNumQueries(2):
+            middleware(request)
+
+        self.assertEqual(self.new_student.id, request.student_id)
+        self.assertEqual(self.new_user.id, request.session_user_id)
+
+
 class RequestPasswordResetTests(TestCase):
 
     def setUp(self):
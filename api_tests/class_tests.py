@@ -1,8 +1,11 @@
-from api.class_views import class_select_all, class_summarize_movement
-from api.models import Student, Session, Class, DayLookup, ClassEnrollment, Position
+from api.class_views import class_select_all, class_summarize_movement, class_meeting_summary, class_select_attendance
+from api.models import Student, Session, Class, DayLookup, ClassEnrollment, Position, Attendance
+from api.session_cache import get_session_cache
 
 from django.test import TestCase
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth.models import User
 
 import json
@@ -65,6 +68,21 @@ class ClassSelectAllTests(TestCase):
         self.assertTrue('data' in json_obj)
         self.assertEqual(1, len(json_obj['data']))
 
+    def test_query_count(self):
+        for i in range(3):
+            extra_class = Class.objects.create(title='Extra Class ' + str(i), admin=self.new_admin, semester='FL', section=1,
+                                               year=2019, start_time=datetime.time(hour=9), end_time=datetime.time(hour=10))
+            extra_class.days_of_the_week.add(DayLookup.objects.get(id=i))
+            ClassEnrollment.objects.create(class_enrolled=extra_class, student=self.new_student)
+
+        get_session_cache().clear()
+
+        # Session lookup, the Class objects and their days
+        with self.assertNumQueries(3):
+            response = class_select_all(self.request)
+
+        self.assertEqual(4, len(json.loads(response.content.decode('utf-8'))['data']))
+
     def test_wrong_request_type(self):
         mock_request = rf.post('/api/class/select/all', {
             'session_id': str(self.session_id)
@@ -146,6 +164,44 @@ class ClassSummerizeMovement(TestCase):
 
         self.assertEqual(self.new_position.x, json_obj['data'][today_date][0]['x'])
 
+    def test_positions_sorted_into_meetings(self):
+        self.new_class.start_time = datetime.time(hour=9)
+        self.new_class.end_time = datetime.time(hour=10, minute=15)
+        self.new_class.save()
+        self.new_class.days_of_the_week.remove(DayLookup.objects.get(id=1))
+
+        # Monday, Tuesday (not a meeting day) and Wednesday of the same week.
+        monday = datetime.date(2019, 4, 1)
+        for day, hour, minute in [(0, 9, 0), (0, 10, 15), (0, 10, 16), (1, 9, 30), (2, 8, 59), (2, 9, 45), (2, 9, 30)]:
+            Position.objects.create(x=day, y=minute, student=self.new_student,
+                                    timestamp=datetime.datetime.combine(monday + datetime.timedelta(days=day), datetime.time(hour, minute)))
+
+        request = rf.post('/api/class/movement_summary?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': '04/01/2019',
+            'end_date': '04/03/2019'
+        })
+        json_obj = json.loads(class_summarize_movement(request).content.decode('utf-8'))
+
+        self.assertEqual(['2019-04-01', '2019-04-03'], list(json_obj['data'].keys()))
+        self.assertEqual([0, 15], [x['y'] for x in json_obj['data']['2019-04-01']])
+        self.assertEqual([30, 45], [x['y'] for x in json_obj['data']['2019-04-03']])
+
+    def test_constant_query_count(self):
+        def count_queries(days):
+            request = rf.post('/api/class/movement_summary?session_id=' + str(self.session_id), {
+                'class': str(self.new_class.id),
+                'start_date': (datetime.date.today() - datetime.timedelta(days=days)).strftime('%m/%d/%Y'),
+                'end_date': (datetime.date.today() + datetime.timedelta(days=1)).strftime('%m/%d/%Y')
+            })
+            with CaptureQueriesContext(connection) as queries:
+                class_summarize_movement(request)
+            return len(queries.captured_queries)
+
+        # The first request also looks up the Session, so warm the Session cache first.
+        count_queries(1)
+        self.assertEqual(count_queries(1), count_queries(120))
+
     def test_wrong_request_type(self):
         mock_request = rf.get('/api/class/movement_summary?session_id=' + str(self.session_id), {
             'class': str(self.new_class.id),
@@ -183,4 +239,123 @@ class ClassSummerizeMovement(TestCase):
         })
         response = class_summarize_movement(mock_request)
 
-        self.assertTrue('"error_id": 407' in response.content.decode('utf-8'))
\ No newline at end of file
+        self.assertTrue('"error_id": 407' in response.content.decode('utf-8'))
+
+    def test_invalid_date(self):
+        mock_request = rf.post('/api/class/movement_summary?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': (datetime.date.today() - datetime.timedelta(days=1)).strftime('%m/%d/%Y'),
+            'end_date': 'tomorrow'
+        })
+        response = class_summarize_movement(mock_request)
+
+        self.assertTrue('"error_id": 409' in response.content.decode('utf-8'))
+
+
+class ClassMeetingSummaryTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user')
+        self.new_admin = User.objects.create(username='test_admin')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.session_id = Session.objects.create(user=self.new_user).id
+
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=self.new_admin, semester='FL', section=1, year=2019,
+                                              start_time=datetime.time(hour=9), end_time=datetime.time(hour=10))
+        self.new_class.days_of_the_week.add(DayLookup.objects.get(id=0))
+        ClassEnrollment.objects.create(class_enrolled=self.new_class, student=self.new_student)
+
+        Position.objects.create(x=1, y=1, student=self.new_student, timestamp=datetime.datetime(2019, 4, 1, 9, 30))
+
+    def test_success_status(self):
+        request = rf.post('/api/class/meeting_summary?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': '04/01/2019',
+            'end_date': '04/07/2019'
+        })
+        json_obj = json.loads(class_meeting_summary(request).content.decode('utf-8'))
+
+        self.assertEqual('success', json_obj['status'])
+        self.assertEqual(['2019-04-01'], list(json_obj['data'].keys()))
+        self.assertEqual(1, json_obj['data']['2019-04-01']['sample_count'])
+
+    def test_class_does_not_exist(self):
+        request = rf.post('/api/class/meeting_summary?session_id=' + str(self.session_id), {
+            'class': 111,
+            'start_date': '04/01/2019',
+            'end_date': '04/07/2019'
+        })
+        response = class_meeting_summary(request)
+
+        self.assertTrue('"error_id": 407' in response.content.decode('utf-8'))
+
+    def test_invalid_date(self):
+        request = rf.post('/api/class/meeting_summary?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': '2019-04-01',
+            'end_date': '04/07/2019'
+        })
+        response = class_meeting_summary(request)
+
+        self.assertTrue('"error_id": 409' in response.content.decode('utf-8'))
+
+
+class ClassSelectAttendanceTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user')
+        self.new_admin = User.objects.create(username='test_admin')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.session_id = Session.objects.create(user=self.new_user).id
+
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        self.new_class = Class.objects.create(title='Test Class', admin=self.new_admin, semester='FL', section=1, year=2019,
+                                              start_time=datetime.time(hour=9), end_time=datetime.time(hour=10))
+        self.new_class.days_of_the_week.add(DayLookup.objects.get(id=0))
+        ClassEnrollment.objects.create(class_enrolled=self.new_class, student=self.new_student)
+
+        Position.objects.create(x=1, y=1, student=self.new_student, timestamp=datetime.datetime(2019, 4, 1, 9, 30))
+
+        self.request = rf.post('/api/class/attendance?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': '04/01/2019',
+            'end_date': '04/07/2019'
+        })
+
+    def test_attendance(self):
+        json_obj = json.loads(class_select_attendance(self.request).content.decode('utf-8'))
+
+        self.assertEqual('success', json_obj['status'])
+        self.assertEqual(1, len(json_obj['data']))
+        self.assertEqual('2019-04-01', json_obj['data'][0]['meeting_date'])
+        self.assertFalse(json_obj['data'][0]['present'])
+        self.assertEqual(1, json_obj['data'][0]['sample_count'])
+
+    def test_class_not_computed(self):
+        other_student = Student.objects.create(user=User.objects.create(username='other_user'))
+        ClassEnrollment.objects.create(class_enrolled=self.new_class, student=other_student)
+
+        class_select_attendance(self.request)
+
+        # The Attendance of the Class is left to the workers.
+        self.assertEqual(0, Attendance.objects.count())
+
+        Attendance.objects.create(student=self.new_student, associated_class=self.new_class, meeting_date=datetime.date(2019, 4, 1),
+                                  present=True, sample_count=20)
+        json_obj = json.loads(class_select_attendance(self.request).content.decode('utf-8'))
+        self.assertEqual([(True, 20)], [(x['present'], x['sample_count']) for x in json_obj['data']])
+
+    def test_invalid_date(self):
+        mock_request = rf.post('/api/class/attendance?session_id=' + str(self.session_id), {
+            'class': str(self.new_class.id),
+            'start_date': '04/01/2019',
+            'end_date': '04/31/2019'
+        })
+        response = class_select_attendance(mock_request)
+
+        self.assertTrue('"error_id": 409' in response.content.decode('utf-8'))
@@ -0,0 +1,178 @@
+from api.auth_views import register, request_password_reset, reset_password
+from api.models import Student, OutboundEmail
+from api.outbox import queue_email, claim_emails, deliver_outbox, purge_outbox
+
+from django.test import TestCase, override_settings
+from django.test.client import RequestFactory
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.contrib.auth.models import User
+
+import datetime
+
+rf = RequestFactory()
+
+
+# An email backend that counts the connections it opens and refuses the addresses in 'refused'.
+class RecordingBackend(BaseEmailBackend):
+    opened = 0
+    messages = []
+    refused = set()
+    down = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.is_open = False
+
+    def open(self):
+        if self.is_open:
+            return False
+        if RecordingBackend.down:
+            raise ConnectionRefusedError('Mail server is down')
+
+        RecordingBackend.opened += 1
+        self.is_open = True
+        return True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, email_messages):
+        new_connection = self.open()
+        try:
+            for message in email_messages:
+                if message.to[0] in RecordingBackend.refused:
+                    raise ValueError('Recipient refused')
+                RecordingBackend.messages.append(message)
+        finally:
+            if new_connection:
+                self.close()
+
+        return len(email_messages)
+
+
+class QueuedAuthEmailTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        Student.objects.create(user=self.new_user)
+
+    def test_register_queues_email(self):
+        response = register(rf.post('/api/auth/register', {
+            'username': 'test_user1', 'password': 'test_password1234', 'email': 'test1@test.com', 'first_name': 'test1',
+            'last_name': 'last1'}))
+
+        self.assertTrue('"status": "success"' in response.content.decode('utf-8'))
+        self.assertEqual(0, len(mail.outbox))
+
+        email = OutboundEmail.objects.get(to='test1@test.com')
+        self.assertEqual('Welcome to ICBA!', email.subject)
+        self.assertTrue('test1' in email.html_body and '<' not in email.body)
+        self.assertEqual(None, email.sent)
+
+        self.assertEqual(1, deliver_outbox())
+        self.assertEqual(['test1@test.com'], mail.outbox[0].to)
+        self.assertEqual('text/html', mail.outbox[0].alternatives[0][1])
+
+    def test_reset_emails_queued(self):
+        request_password_reset(rf.get('/api/auth/request_password_reset/test_user'), 'test_user')
+        reset_code = Student.objects.get(user=self.new_user).reset_password_code
+        reset_password(rf.post('/api/auth/reset_password/' + reset_code, {'new_password': 'new_password1234'}), reset_code)
+
+        self.assertEqual(0, len(mail.outbox))
+        self.assertEqual(2, deliver_outbox())
+        self.assertEqual(['ICBA - Reset Code', 'ICBA - Password Changed'], [x.subject for x in mail.outbox])
+        self.assertTrue(reset_code in mail.outbox[0].body)
+
+
+@override_settings(EMAIL_BACKEND='api_tests.outbox_tests.RecordingBackend',
+                   EMAIL_OUTBOX={'BATCH_SIZE': 2, 'MAX_ATTEMPTS': 3, 'RETRY_SECONDS': 60, 'LEASE_SECONDS': 300})
+class OutboxDeliveryTests(TestCase):
+
+    def setUp(self):
+        RecordingBackend.opened = 0
+        RecordingBackend.messages = []
+        RecordingBackend.refused = set()
+        RecordingBackend.down = False
+
+        self.emails = [queue_email('Test', 'welcome_email.html', {'user': {'first_name': 'first', 'last_name': 'last'}},
+                                   'test' + str(i) + '@test.com') for i in range(5)]
+        self.now = datetime.datetime.now()
+
+    def test_batches_share_one_connection(self):
+        self.assertEqual(5, deliver_outbox(self.now))
+
+        self.assertEqual(1, RecordingBackend.opened)
+        self.assertEqual(['test' + str(i) + '@test.com' for i in range(5)], [x.to[0] for x in RecordingBackend.messages])
+        self.assertEqual(5, len(OutboundEmail.objects.filter(sent=self.now, claim=None, body='', html_body='')))
+
+    def test_retry_with_backoff(self):
+        RecordingBackend.refused = {'test1@test.com'}
+
+        self.assertEqual(4, deliver_outbox(self.now))
+        failed = OutboundEmail.objects.get(to='test1@test.com')
+        self.assertEqual((1, None, 'Recipient refused'), (failed.attempts, failed.sent, failed.last_error))
+        self.assertEqual(self.now + datetime.timedelta(seconds=60), failed.next_attempt)
+
+        self.assertEqual(0, deliver_outbox(self.now + datetime.timedelta(seconds=59)))
+        self.assertEqual(0, deliver_outbox(self.now + datetime.timedelta(seconds=60)))
+        self.assertEqual(self.now + datetime.timedelta(seconds=180), OutboundEmail.objects.get(id=failed.id).next_attempt)
+
+        RecordingBackend.refused = set()
+        self.assertEqual(1, deliver_outbox(self.now + datetime.timedelta(seconds=180)))
+        self.assertEqual(3, OutboundEmail.objects.get(id=failed.id).attempts)
+
+    def test_server_down(self):
+        RecordingBackend.down = True
+
+        # Only the first batch is tried while the server is down, and it is not counted as an attempt.
+        with self.assertLogs('api.outbox', 'WARNING') as logs:
+            self.assertEqual(0, deliver_outbox(self.now))
+            for days in range(1, 10):
+                deliver_outbox(self.now + datetime.timedelta(days=days))
+
+        self.assertEqual(10, len([x for x in logs.output if 'could not open the email connection' in x]))
+        first = OutboundEmail.objects.get(id=self.emails[0].id)
+        self.assertEqual((0, None, 'Mail server is down'), (first.attempts, first.sent, first.last_error))
+        self.assertEqual([0, 0, 0, 0, 0], [x.attempts for x in OutboundEmail.objects.order_by('id')])
+
+        RecordingBackend.down = False
+        self.assertEqual(5, deliver_outbox(self.now + datetime.timedelta(days=30)))
+
+    def test_dead_letter_logged(self):
+        RecordingBackend.refused = {'test1@test.com'}
+        deliver_outbox(self.now)
+        deliver_outbox(self.now + datetime.timedelta(seconds=60))
+
+        with self.assertLogs('api.outbox', 'ERROR') as logs:
+            self.assertEqual(0, deliver_outbox(self.now + datetime.timedelta(seconds=180)))
+
+        failed = OutboundEmail.objects.get(to='test1@test.com')
+        self.assertEqual(1, len(logs.output))
+        self.assertTrue(str(failed.id) in logs.output[0] and 'Recipient refused' in logs.output[0])
+
+        # No email is tried again after MAX_ATTEMPTS.
+        RecordingBackend.refused = set()
+        self.assertEqual(0, deliver_outbox(self.now + datetime.timedelta(days=30)))
+        failed = OutboundEmail.objects.get(id=failed.id)
+        self.assertEqual((3, None), (failed.attempts, failed.sent))
+
+    @override_settings(EMAIL_OUTBOX={'MAX_ATTEMPTS': 1, 'RETENTION_DAYS': 7})
+    def test_old_emails_purged(self):
+        RecordingBackend.refused = {'test1@test.com'}
+        with self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(4, deliver_outbox(self.now))
+
+        # The sent emails and the one that is not tried again are kept for RETENTION_DAYS.
+        self.assertEqual(0, purge_outbox(self.now + datetime.timedelta(days=6)))
+        self.assertEqual(5, purge_outbox(self.now + datetime.timedelta(days=8)))
+        self.assertEqual(0, OutboundEmail.objects.count())
+
+    def test_stopped_worker(self):
+        # A worker that took a batch and stopped without sending it.
+        self.assertEqual(2, len(claim_emails(self.now)))
+
+        self.assertEqual(3, deliver_outbox(self.now))
+        self.assertEqual(2, deliver_outbox(self.now + datetime.timedelta(seconds=300)))
+        self.assertEqual(5, len(RecordingBackend.messages))
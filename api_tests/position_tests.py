@@ -1,13 +1,28 @@
-from api.position_views import position_create, position_select_all, position_select_id, position_summary
-from api.models import Student, Session, Position
-
-from django.test import TestCase
+from api.position_views import position_create, position_create_batch, position_select_all, position_select_id, position_summary, \
+    position_aggregate, POSITION_BATCH_MAX_SIZE
+from api.position_buffer import PositionWriteBuffer
+import api.position_buffer
+from api.models import Student, Session, Position, Class, ClassEnrollment, DayLookup, ColocationMeeting, MovementRollup
+from api.analytics.colocation import class_colocation
+from api.analytics.heatmap import class_heatmap
+from api.analytics.rollup import rollup_finished_meetings
+from api.analytics.attendance import class_attendance
+from api.session_cache import get_session_cache
+
+from django.test import TestCase, override_settings
 from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import OperationalError, connection
 from django.contrib.auth.models import User
 
+import io
 import json
+import queue
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, date, time, timedelta
+from unittest import mock
 
 rf = RequestFactory()
 
@@ -73,6 +88,331 @@ class PositionCreateTests(TestCase):
 
         self.assertTrue('"error_id": 302' in response.content.decode('utf-8'))
 
+    def test_invalid_position(self):
+        mock_request = rf.get('/api/position/create', {
+            'session_id': str(self.session_id),
+            'x': 'a',
+            'y': 1
+        })
+
+        response = position_create(mock_request)
+
+        self.assertTrue('"error_id": 308' in response.content.decode('utf-8'))
+        self.assertEqual(0, len(Position.objects.all()))
+
+    def test_non_finite_position(self):
+        for x, y in (('nan', 1), (1, 'inf'), ('-Infinity', 2)):
+            response = position_create(rf.get('/api/position/create', {'session_id': str(self.session_id), 'x': x, 'y': y}))
+            self.assertTrue('"error_id": 308' in response.content.decode('utf-8'))
+
+        self.assertEqual(0, len(Position.objects.all()))
+
+
+class PositionCreateBatchTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_user.set_password('test_password1234')
+        self.new_user.save()
+
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.new_student.save()
+
+        new_session = Session.objects.create(user=self.new_user)
+        new_session.save()
+        self.session_id = new_session.id
+
+        self.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {
+            'positions': json.dumps([
+                {'x': 1, 'y': 1, 'timestamp': self.timestamp},
+                {'x': 2.5, 'y': 3, 'timestamp': self.timestamp}
+            ])
+        })
+
+    def test_positions_created(self):
+        position_create_batch(self.request)
+
+        self.assertEqual(2, len(Position.objects.filter(student=self.new_student)))
+
+    def test_success_status(self):
+        response = position_create_batch(self.request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual('success', json_obj['status'])
+        self.assertEqual(['created', 'created'], json_obj['data'])
+
+    def test_single_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            position_create_batch(self.request)
+
+        inserts = [x for x in queries.captured_queries if x['sql'].startswith('INSERT')]
+        self.assertEqual(1, len(inserts))
+
+    @override_settings(POSITION_HEATMAP={'CACHE_ALIAS': 'default'})
+    def test_late_samples_clear_meeting_results(self):
+        caches['default'].clear()
+        admin = User.objects.create(username='test_admin')
+        for i in range(7):
+            DayLookup.objects.create(id=i, name=str(i))
+
+        new_class = Class.objects.create(title='Test Class', admin=admin, section=1, start_time=time(9, 0), end_time=time(10, 0))
+        new_class.days_of_the_week.set([0])
+        ClassEnrollment.objects.create(student=self.new_student, class_enrolled=new_class)
+
+        self.assertEqual(0, class_heatmap(new_class, date(2019, 4, 1), date(2019, 4, 1))['total'])
+        class_colocation(new_class, date(2019, 4, 1), date(2019, 4, 1))
+        self.assertEqual(1, ColocationMeeting.objects.count())
+        rollup_finished_meetings(datetime(2019, 4, 2))
+        self.assertEqual(0, MovementRollup.objects.get(meeting_date=date(2019, 4, 1)).sample_count)
+        self.assertEqual([0], [x.sample_count for x in class_attendance(new_class, date(2019, 4, 1), date(2019, 4, 1))])
+
+        # Samples sent now do not touch the finished meeting.
+        position_create_batch(self.request)
+        self.assertEqual(1, ColocationMeeting.objects.count())
+        self.assertEqual(1, MovementRollup.objects.filter(meeting_date=date(2019, 4, 1)).count())
+
+        mock_request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {
+            'positions': json.dumps([{'x': 1, 'y': 1, 'timestamp': '2019-04-01 09:30:00'}])
+        })
+        position_create_batch(mock_request)
+
+        self.assertEqual(0, ColocationMeeting.objects.count())
+        self.assertEqual(1, class_heatmap(new_class, date(2019, 4, 1), date(2019, 4, 1))['total'])
+
+        # The workers roll the meeting up again with the late sample.
+        self.assertEqual(0, MovementRollup.objects.filter(meeting_date=date(2019, 4, 1)).count())
+        rollup_finished_meetings(datetime(2019, 4, 2))
+        self.assertEqual(1, MovementRollup.objects.get(meeting_date=date(2019, 4, 1)).sample_count)
+
+        # The Attendance is counted again with it too.
+        self.assertEqual([1], [x.sample_count for x in class_attendance(new_class, date(2019, 4, 1), date(2019, 4, 1))])
+
+    def test_invalid_samples_reported(self):
+        mock_request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {
+            'positions': json.dumps([
+                {'x': 1, 'y': 1, 'timestamp': self.timestamp},
+                {'x': 'a', 'y': 1, 'timestamp': self.timestamp},
+                {'x': 1, 'y': 1, 'timestamp': '2019-03-26 13:04:65'},
+                {'x': 1, 'timestamp': self.timestamp}
+            ])
+        })
+        response = position_create_batch(mock_request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(['created', 'bad position', 'bad timestamp', 'missing data'], json_obj['data'])
+        self.assertEqual(1, len(Position.objects.filter(student=self.new_student)))
+
+    def test_wrong_request_type(self):
+        mock_request = rf.get('/api/position/create_batch', {
+            'session_id': self.session_id
+        })
+        response = position_create_batch(mock_request)
+
+        self.assertTrue('"error_id": 301' in response.content.decode('utf-8'))
+
+    def test_no_logged_in_user(self):
+        mock_request = rf.post('/api/position/create_batch', {
+            'positions': json.dumps([])
+        })
+        response = position_create_batch(mock_request)
+
+        self.assertTrue('"error_id": 300' in response.content.decode('utf-8'))
+
+    def test_not_enough_POST_data(self):
+        mock_request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {})
+        response = position_create_batch(mock_request)
+
+        self.assertTrue('"error_id": 307' in response.content.decode('utf-8'))
+
+    def test_invalid_positions_data(self):
+        mock_request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {
+            'positions': '{"x": 1'
+        })
+        response = position_create_batch(mock_request)
+
+        self.assertTrue('"error_id": 308' in response.content.decode('utf-8'))
+
+    def test_too_many_positions(self):
+        sample = {'x': 1, 'y': 1, 'timestamp': self.timestamp}
+        mock_request = rf.post('/api/position/create_batch?session_id=' + str(self.session_id), {
+            'positions': json.dumps([sample] * (POSITION_BATCH_MAX_SIZE + 1))
+        })
+        response = position_create_batch(mock_request)
+
+        self.assertTrue('"error_id": 309' in response.content.decode('utf-8'))
+        self.assertEqual(0, len(Position.objects.all()))
+
+
+class PositionWriteBufferTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_user.set_password('test_password1234')
+        self.new_user.save()
+
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.new_student.save()
+
+    def new_position(self):
+        return Position(student=self.new_student, x=1, y=1, timestamp=datetime.now())
+
+    def test_positions_written_on_flush(self):
+        position_buffer = PositionWriteBuffer(flush_size=2)
+        pending = [position_buffer.put(self.new_position()) for i in range(5)]
+
+        self.assertEqual(0, len(Position.objects.all()))
+
+        position_buffer.flush()
+
+        self.assertEqual(5, len(Position.objects.all()))
+        self.assertEqual(0, len(position_buffer))
+        self.assertTrue(all(x.wait(0) for x in pending))
+
+    def test_flush_uses_bulk_insert(self):
+        position_buffer = PositionWriteBuffer(flush_size=10)
+        for i in range(10):
+            position_buffer.put(self.new_position())
+
+        with CaptureQueriesContext(connection) as queries:
+            position_buffer.flush()
+
+        inserts = [x for x in queries.captured_queries if x['sql'].startswith('INSERT')]
+        self.assertEqual(1, len(inserts))
+
+    def test_pending_not_written_before_flush(self):
+        position_buffer = PositionWriteBuffer()
+        pending = position_buffer.put(self.new_position())
+
+        self.assertFalse(pending.wait(0))
+
+    def test_full_buffer(self):
+        position_buffer = PositionWriteBuffer(max_size=1, put_timeout_ms=0)
+        position_buffer.put(self.new_position())
+
+        with self.assertRaises(queue.Full):
+            position_buffer.put(self.new_position())
+
+    def test_retry_after_lost_connection(self):
+        bulk_create = Position.objects.bulk_create
+        calls = []
+
+        def lose_first_connection(positions):
+            calls.append(len(positions))
+            if len(calls) == 1:
+                raise OperationalError('server closed the connection unexpectedly')
+            return bulk_create(positions)
+
+        position_buffer = PositionWriteBuffer(retry_delay_ms=0)
+        pending = [position_buffer.put(self.new_position()) for i in range(3)]
+
+        with mock.patch.object(Position.objects, 'bulk_create', side_effect=lose_first_connection), \
+                self.assertLogs('api.position_buffer', 'WARNING'):
+            position_buffer.flush()
+
+        self.assertEqual([3, 3], calls)
+        self.assertEqual(3, len(Position.objects.all()))
+        self.assertTrue(all(x.wait(0) for x in pending))
+
+    def test_dropped_positions_logged(self):
+        position_buffer = PositionWriteBuffer(write_retries=1, retry_delay_ms=0)
+        pending = position_buffer.put(self.new_position())
+
+        with mock.patch.object(Position.objects, 'bulk_create', side_effect=OperationalError('database is down')), \
+                mock.patch.object(Position, 'save', side_effect=OperationalError('database is down')), \
+                self.assertLogs('api.position_buffer', 'WARNING') as logs:
+            position_buffer.flush()
+
+        self.assertFalse(pending.wait(0))
+        self.assertEqual(2, len([x for x in logs.output if x.startswith('WARNING')]))
+        self.assertEqual(1, len([x for x in logs.output if x.startswith('ERROR') and 'dropped position' in x]))
+
+    def test_cancelled_not_written(self):
+        position_buffer = PositionWriteBuffer()
+        pending = position_buffer.put(self.new_position())
+
+        self.assertTrue(pending.cancel())
+        position_buffer.flush()
+
+        self.assertEqual(0, len(Position.objects.all()))
+        self.assertFalse(pending.wait(0))
+
+    def test_put_after_stop(self):
+        position_buffer = PositionWriteBuffer()
+        position_buffer.stop()
+
+        # Nothing flushes a stopped buffer, so the Position is written right away.
+        self.assertTrue(position_buffer.put(self.new_position()).wait(0))
+        self.assertEqual(1, len(Position.objects.all()))
+        self.assertEqual(0, len(position_buffer))
+
+
+# A buffer that writes each Position as soon as it is added, so a view waiting on the flush gets its reply.
+class FlushOnPutBuffer(PositionWriteBuffer):
+
+    def put(self, position):
+        pending = super().put(position)
+        self.flush()
+        return pending
+
+
+@override_settings(POSITION_WRITE_BUFFER={'ENABLED': True, 'ACKNOWLEDGE': 'enqueue'})
+class PositionCreateBufferedTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.session_id = Session.objects.create(user=self.new_user).id
+
+        # The views use this buffer instead of starting the background thread.
+        self.use_buffer(PositionWriteBuffer())
+        self.addCleanup(setattr, api.position_buffer, '_buffer', None)
+
+    def use_buffer(self, position_buffer):
+        self.position_buffer = position_buffer
+        api.position_buffer._buffer = position_buffer
+
+    def create(self, x):
+        response = position_create(rf.get('/api/position/create', {'session_id': self.session_id, 'x': x, 'y': 2}))
+        return json.loads(response.content.decode('utf-8'))
+
+    def test_positions_buffered_until_flush(self):
+        responses = [self.create(i) for i in range(3)]
+
+        self.assertEqual(['success'] * 3, [x['status'] for x in responses])
+        self.assertEqual((None, self.new_student.id, 1.0, 2.0),
+                         tuple(responses[1]['data'][x] for x in ('id', 'student', 'x', 'y')))
+        self.assertEqual(0, len(Position.objects.all()))
+        self.assertEqual(3, len(self.position_buffer))
+
+        self.position_buffer.flush()
+
+        self.assertEqual([0.0, 1.0, 2.0], sorted(Position.objects.filter(student=self.new_student).values_list('x', flat=True)))
+
+    @override_settings(POSITION_WRITE_BUFFER={'ENABLED': True, 'ACKNOWLEDGE': 'flush'})
+    def test_reply_after_flush(self):
+        self.use_buffer(FlushOnPutBuffer())
+
+        self.assertEqual('success', self.create(1)['status'])
+        self.assertEqual(1, len(Position.objects.filter(student=self.new_student)))
+
+    @override_settings(POSITION_WRITE_BUFFER={'ENABLED': True, 'ACKNOWLEDGE': 'flush', 'ACK_TIMEOUT_MS': 0})
+    def test_flush_timeout(self):
+        self.assertEqual(311, self.create(1)['info']['error_id'])
+
+        # The Position the client was told failed is not written later.
+        self.position_buffer.flush()
+        self.assertEqual(0, len(Position.objects.all()))
+
+    def test_full_buffer(self):
+        self.use_buffer(PositionWriteBuffer(max_size=1, put_timeout_ms=0))
+
+        self.assertEqual('success', self.create(1)['status'])
+        self.assertEqual(310, self.create(2)['info']['error_id'])
+
 
 class PositionSelectAllTests(TestCase):
 
@@ -110,6 +450,67 @@ class PositionSelectAllTests(TestCase):
 
         self.assertEqual(2, len(json_obj['data']))
 
+    def test_query_count(self):
+        for i in range(10):
+            Position.objects.create(x=i, y=i, student=self.new_student, timestamp=datetime.now())
+
+        get_session_cache().clear()
+
+        # Session lookup and the Position objects
+        with self.assertNumQueries(2):
+            position_select_all(self.request)
+
+        # The Session is cached after the first call
+        with self.assertNumQueries(1):
+            position_select_all(self.request)
+
+    def test_ordered_by_time(self):
+        Position.objects.create(x=0, y=0, student=self.new_student, timestamp=datetime.now() - timedelta(days=1))
+        response = position_select_all(self.request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual([0, 1, 2], [x['x'] for x in json_obj['data']])
+
+    def test_pages_follow_cursor(self):
+        timestamp = datetime.now() - timedelta(days=1)
+        for i in range(5):
+            Position.objects.create(x=10 + i, y=0, student=self.new_student, timestamp=timestamp)
+
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            request = rf.get('/api/position/select/all', {'session_id': str(self.session_id), 'limit': 3, 'cursor': cursor})
+            json_obj = json.loads(position_select_all(request).content.decode('utf-8'))
+
+            self.assertTrue(len(json_obj['data']) <= 3)
+            seen.extend(x['id'] for x in json_obj['data'])
+            cursor = json_obj['next_cursor']
+
+        self.assertEqual(7, len(seen))
+        self.assertEqual(sorted(seen), sorted(set(seen)))
+        self.assertEqual(list(Position.objects.order_by('timestamp', 'id').values_list('id', flat=True)), seen)
+
+    def test_stream_matches_list(self):
+        list_response = position_select_all(self.request)
+        stream_request = rf.get('/api/position/select/all', {'session_id': str(self.session_id), 'stream': 'true'})
+        stream_response = position_select_all(stream_request)
+
+        self.assertTrue(stream_response.streaming)
+        streamed = b''.join(stream_response.streaming_content).decode('utf-8')
+        self.assertEqual(json.loads(list_response.content.decode('utf-8')), json.loads(streamed))
+
+    def test_invalid_cursor(self):
+        request = rf.get('/api/position/select/all', {'session_id': str(self.session_id), 'limit': 1, 'cursor': 'abc'})
+        response = position_select_all(request)
+
+        self.assertTrue('"error_id": 312' in response.content.decode('utf-8'))
+
+    def test_invalid_limit(self):
+        request = rf.get('/api/position/select/all', {'session_id': str(self.session_id), 'limit': 0})
+        response = position_select_all(request)
+
+        self.assertTrue('"error_id": 313' in response.content.decode('utf-8'))
+
     def test_wrong_request_type(self):
         mock_request = rf.post('/api/position/select/all?session_id=' + str(self.session_id))
         response = position_select_all(mock_request)
@@ -312,3 +713,154 @@ class PositionSummaryTests(TestCase):
         response = position_summary(request)
 
         self.assertTrue('"error_id": 305' in response.content.decode('utf-8'))
+
+    def test_simplified_summary(self):
+        start_time = datetime(2019, 4, 1, 9, 0)
+        Position.objects.bulk_create([
+            Position(x=i, y=i, student=self.new_student, timestamp=start_time + timedelta(seconds=i)) for i in range(100)
+        ])
+
+        request = rf.get('/api/position/summary', {
+            'session_id': str(self.session_id),
+            'start_time': '2019-04-01 08:00:00',
+            'end_time': '2019-04-01 10:00:00',
+            'simplify': '0.1'
+        })
+        json_obj = json.loads(position_summary(request).content.decode('utf-8'))
+
+        self.assertEqual([0, 99], [x['x'] for x in json_obj['data']])
+        self.assertEqual(self.new_student.id, json_obj['data'][0]['student'])
+        self.assertEqual('2019-04-01T09:00:00', json_obj['data'][0]['timestamp'])
+
+    def test_max_points_summary(self):
+        request = rf.get('/api/position/summary', {
+            'session_id': str(self.session_id),
+            'start_time': (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S"),
+            'end_time': (datetime.now() + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S"),
+            'max_points': '1'
+        })
+        json_obj = json.loads(position_summary(request).content.decode('utf-8'))
+
+        self.assertEqual([1], [x['x'] for x in json_obj['data']])
+
+    def test_invalid_simplify_options(self):
+        for parameter, value, error_id in [('simplify', 'abc', 314), ('simplify', '-1', 314), ('simplify', 'nan', 314),
+                                           ('max_points', '0', 315), ('max_points', '1.5', 315)]:
+            request = rf.get('/api/position/summary', {
+                'session_id': str(self.session_id),
+                'start_time': (datetime.now() - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S"),
+                'end_time': (datetime.now() + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S"),
+                parameter: value
+            })
+            response = position_summary(request)
+
+            self.assertTrue('"error_id": %d' % error_id in response.content.decode('utf-8'))
+
+
+class PositionAggregateTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.session_id = Session.objects.create(user=self.new_user).id
+
+        # Two samples in the first minute, one in the third minute
+        start_time = datetime(2019, 4, 1, 9, 0)
+        for seconds, x, y in [(10, 0, 0), (50, 2, 0), (130, 5, 5)]:
+            Position.objects.create(x=x, y=y, student=self.new_student, timestamp=start_time + timedelta(seconds=seconds))
+
+        self.parameters = {
+            'session_id': str(self.session_id),
+            'start_time': '2019-04-01 09:00:00',
+            'end_time': '2019-04-01 10:00:00',
+            'bucket': '1m'
+        }
+
+    def test_buckets(self):
+        response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual('success', json_obj['status'])
+        self.assertEqual([
+            {'start': '2019-04-01T09:00:00', 'count': 2, 'x': 1.0, 'y': 0.0, 'spread': 1.0},
+            {'start': '2019-04-01T09:02:00', 'count': 1, 'x': 5.0, 'y': 5.0, 'spread': 0.0}
+        ], json_obj['data'])
+
+    def test_single_query(self):
+        get_session_cache().clear()
+        request = rf.get('/api/position/aggregate', self.parameters)
+
+        # Session lookup and the grouped Positions
+        with self.assertNumQueries(2):
+            position_aggregate(request)
+
+    def test_bucket_widths(self):
+        for width, count in [('30', 3), ('10s', 3), ('5m', 1), ('1h', 1)]:
+            self.parameters['bucket'] = width
+            response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+
+            self.assertEqual(count, len(json.loads(response.content.decode('utf-8'))['data']))
+
+    def test_invalid_bucket(self):
+        for width in ['0m', '1d', 'abc', '-5s', '']:
+            self.parameters['bucket'] = width
+            response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+
+            self.assertTrue('"error_id": 316' in response.content.decode('utf-8'))
+
+    def test_not_enough_GET_data(self):
+        del self.parameters['bucket']
+        response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+
+        self.assertTrue('"error_id": 302' in response.content.decode('utf-8'))
+
+    def test_invalid_datetime_string(self):
+        self.parameters['start_time'] = '2019-04-01 09:00:65'
+        response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+
+        self.assertTrue('"error_id": 305' in response.content.decode('utf-8'))
+
+    def test_wrong_request_type(self):
+        response = position_aggregate(rf.post('/api/position/aggregate?session_id=' + str(self.session_id)))
+
+        self.assertTrue('"error_id": 301' in response.content.decode('utf-8'))
+
+    def test_no_logged_in_user(self):
+        del self.parameters['session_id']
+        response = position_aggregate(rf.get('/api/position/aggregate', self.parameters))
+
+        self.assertTrue('"error_id": 300' in response.content.decode('utf-8'))
+
+
+class PositionTimeRangeTests(TestCase):
+
+    def setUp(self):
+        self.new_user = User.objects.create(username='test_user', email='test@test.com', first_name='first_test',
+                                            last_name='last_test')
+        self.new_user.set_password('test_password1234')
+        self.new_user.save()
+
+        self.new_student = Student.objects.create(user=self.new_user)
+        self.new_student.save()
+
+        self.start_time = datetime(2019, 4, 1, 9, 0)
+        self.end_time = datetime(2019, 4, 1, 10, 0)
+        for minutes in [60, 0, 30, 90]:
+            Position.objects.create(x=minutes, y=1, student=self.new_student, timestamp=self.start_time + timedelta(minutes=minutes))
+
+    def test_inclusive_range(self):
+        positions = Position.objects.in_time_range(self.new_student.id, self.start_time, self.end_time)
+
+        self.assertEqual([0, 30, 60], [x.x for x in positions])
+
+    def test_exclusive_range(self):
+        positions = Position.objects.in_time_range(self.new_student.id, self.start_time, self.end_time, inclusive=False)
+
+        self.assertEqual([30], [x.x for x in positions])
+
+    def test_queries_use_index(self):
+        output = io.StringIO()
+        call_command('explain_position_queries', student=self.new_student.id, stdout=output)
+
+        self.assertEqual(3, output.getvalue().count('uses position_student_time_idx'))
@@ -1,13 +1,18 @@
 from api.survey_views import end_session_create_survey_instance, get_all_open_survey_instances, get_survey_by_id, add_responses_to_survey
 from api.models import Student, Session, Class, DayLookup, ClassEnrollment, Survey, SurveyResponse, SurveyQuestion, Position, SurveyInstance, SurveyPositionInstance, SurveyQuestionInstance
+from api.session_cache import get_session_cache
+from api.survey_generation import create_survey_instance, generate_finished_meetings
 
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.test.client import RequestFactory
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 import json
 import datetime
+from unittest import mock
 
 rf = RequestFactory()
 
@@ -75,6 +80,28 @@ class EndSessionCreateSurveyInstanceTests(TestCase):
         self.assertEqual(1, len(SurveyQuestionInstance.objects.filter(survey_instance=survey_instance)))
         self.assertEqual(1, len(SurveyPositionInstance.objects.filter(survey_instance=survey_instance)))
 
+    def test_entries_bulk_created(self):
+        Position.objects.bulk_create([
+            Position(student=self.new_student, timestamp=timezone.now() + datetime.timedelta(minutes=10, seconds=i), x=i, y=i)
+            for i in range(1, 1200)
+        ])
+
+        with CaptureQueriesContext(connection) as queries:
+            end_session_create_survey_instance(self.request)
+
+        # The SurveyInstance, then a parent and child insert for the question and for each chunk of 500 positions
+        inserts = [x for x in queries.captured_queries if 'INSERT' in x['sql']]
+        self.assertEqual(9, len(inserts))
+
+        survey_instance = SurveyInstance.objects.get(survey=self.new_survey)
+        position_instances = SurveyPositionInstance.objects.filter(survey_instance=survey_instance).select_related('position')
+
+        self.assertEqual(1200, len(position_instances))
+        self.assertEqual(1200, len(set(x.position_id for x in position_instances)))
+        self.assertTrue(all(x.position.student_id == self.new_student.id for x in position_instances))
+        self.assertEqual(self.new_survey_question.id,
+                         SurveyQuestionInstance.objects.get(survey_instance=survey_instance).question_id)
+
     def test_wrong_request_type(self):
         mock_request = rf.get('/api/survey/generate?session_id=' + str(self.session_id), {
             'class': str(self.new_class.id)
@@ -114,9 +141,118 @@ class EndSessionCreateSurveyInstanceTests(TestCase):
     def test_survey_instance_already_exists(self):
         new_survey = SurveyInstance.objects.create(survey=self.new_survey, student=self.new_student, date_generated=timezone.now().date())
         new_survey.save()
-        response = end_session_create_survey_instance(self.request)
+        response = json.loads(end_session_create_survey_instance(self.request).content.decode('utf-8'))
 
-        self.assertTrue('"error_id": 510' in response.content.decode('utf-8'))
+        self.assertEqual('success', response['status'])
+        self.assertEqual(new_survey.id, response['data']['id'])
+        self.assertEqual(1, len(SurveyInstance.objects.filter(survey=self.new_survey)))
+        # The Position saved in the Class is added to the SurveyInstance that was made before it.
+        self.assertEqual(1, len(SurveyPositionInstance.objects.filter(survey_instance=new_survey)))
+
+    def test_called_at_end_time(self):
+        now = datetime.datetime.now()
+        self.new_class.start_time = now - datetime.timedelta(minutes=50)
+        self.new_class.end_time = now
+        self.new_class.save()
+        self.new_class.days_of_the_week.add(DayLookup.objects.get(id=now.weekday()))
+        first = Position.objects.create(student=self.new_student, timestamp=now - datetime.timedelta(minutes=20), x=1, y=1)
+
+        # The task makes the SurveyInstance before the Class ends, then the Student saves another Position.
+        self.assertEqual(1, generate_finished_meetings(now - datetime.timedelta(minutes=3)))
+        last = Position.objects.create(student=self.new_student, timestamp=now - datetime.timedelta(minutes=1), x=2, y=2)
+
+        response = json.loads(end_session_create_survey_instance(self.request).content.decode('utf-8'))
+        survey_instance = SurveyInstance.objects.get(survey=self.new_survey)
+
+        self.assertEqual(survey_instance.id, response['data']['id'])
+        self.assertEqual([first.id, last.id], sorted(SurveyPositionInstance.objects.filter(survey_instance=survey_instance)
+                                                     .values_list('position_id', flat=True)))
+
+        # Calling it again does not add the Positions twice.
+        end_session_create_survey_instance(self.request)
+        self.assertEqual(2, len(SurveyPositionInstance.objects.filter(survey_instance=survey_instance)))
+
+    def test_instance_made_at_same_time(self):
+        def create_at_same_time(survey, student_id, question_ids, position_ids):
+            # The task makes the SurveyInstance between the lookup and the insert of the request.
+            SurveyInstance.objects.create(survey=survey, student_id=student_id)
+            return create_survey_instance(survey, student_id, question_ids, position_ids)
+
+        with mock.patch('api.survey_views.create_survey_instance', side_effect=create_at_same_time):
+            response = json.loads(end_session_create_survey_instance(self.request).content.decode('utf-8'))
+
+        self.assertEqual('success', response['status'])
+        self.assertEqual(SurveyInstance.objects.get(survey=self.new_survey).id, response['data']['id'])
+
+
+class SurveyGenerationTests(TestCase):
+
+    def setUp(self):
+        self.new_admin = User.objects.create(username='test_admin')
+        self.new_class = Class.objects.create(title='Test Class', admin=self.new_admin, section=1, start_time=datetime.time(9),
+                                              end_time=datetime.time(10))
+        self.new_class.days_of_the_week.set([DayLookup.objects.create(id=0, name='Monday'),
+                                             DayLookup.objects.create(id=2, name='Wednesday')])
+
+        self.new_survey = Survey.objects.create(admin=self.new_admin, associated_class=self.new_class)
+        self.question_ids = [SurveyQuestion.objects.create(survey=self.new_survey, type='SA', prompt_text='Question ' + str(i)).id
+                             for i in range(2)]
+
+        self.students = []
+        self.add_students(3)
+
+    def add_students(self, count):
+        for i in range(len(self.students), len(self.students) + count):
+            student = Student.objects.create(user=User.objects.create(username='test_user_' + str(i)))
+            ClassEnrollment.objects.create(class_enrolled=self.new_class, student=student)
+            self.students.append(student)
+
+            # Monday April 1st, 2019. Student i has i + 1 Positions in the meeting and one after it.
+            Position.objects.bulk_create([Position(student=student, x=j, y=j, timestamp=datetime.datetime(2019, 4, 1, 9, 10 + j))
+                                          for j in range(i + 1)] +
+                                         [Position(student=student, x=0, y=0, timestamp=datetime.datetime(2019, 4, 1, 10, 30))])
+
+    def test_instances_created(self):
+        self.assertEqual(3, generate_finished_meetings(datetime.datetime(2019, 4, 1, 10, 5)))
+
+        for i, student in enumerate(self.students):
+            survey_instance = SurveyInstance.objects.get(survey=self.new_survey, student=student)
+            position_instances = SurveyPositionInstance.objects.filter(survey_instance=survey_instance).select_related('position')
+
+            self.assertEqual(datetime.date(2019, 4, 1), survey_instance.date_generated)
+            self.assertEqual(self.question_ids, sorted(SurveyQuestionInstance.objects.filter(survey_instance=survey_instance)
+                                                       .values_list('question_id', flat=True)))
+            self.assertEqual(i + 1, len(position_instances))
+            self.assertTrue(all(x.position.student_id == student.id and x.position.timestamp.hour == 9 for x in position_instances))
+
+    def test_meeting_not_finished(self):
+        self.assertEqual(0, generate_finished_meetings(datetime.datetime(2019, 4, 1, 9, 54)))
+        self.assertEqual(0, generate_finished_meetings(datetime.datetime(2019, 4, 2, 10, 5)))
+        self.assertEqual(0, generate_finished_meetings(datetime.datetime(2019, 4, 1, 11, 30)))
+        self.assertEqual(0, len(SurveyInstance.objects.all()))
+
+    def test_instances_created_before_end(self):
+        self.assertEqual(3, generate_finished_meetings(datetime.datetime(2019, 4, 1, 9, 55)))
+        self.assertEqual(0, generate_finished_meetings(datetime.datetime(2019, 4, 1, 10, 5)))
+        self.assertEqual(3, len(SurveyInstance.objects.filter(date_generated=datetime.date(2019, 4, 1))))
+
+    def test_existing_instances_skipped(self):
+        SurveyInstance.objects.create(survey=self.new_survey, student=self.students[0], date_generated=datetime.date(2019, 4, 1))
+
+        self.assertEqual(2, generate_finished_meetings(datetime.datetime(2019, 4, 1, 10, 5)))
+        self.assertEqual(0, generate_finished_meetings(datetime.datetime(2019, 4, 1, 10, 6)))
+        self.assertEqual(3, len(SurveyInstance.objects.all()))
+
+    def test_constant_query_count(self):
+        def count_queries(now):
+            with CaptureQueriesContext(connection) as queries:
+                created = generate_finished_meetings(now)
+            return len(queries.captured_queries), created
+
+        before = count_queries(datetime.datetime(2019, 4, 1, 10, 5))[0]
+        self.add_students(20)
+
+        self.assertEqual((before, 20), count_queries(datetime.datetime(2019, 4, 1, 10, 6)))
 
 
 class OpenSurveyInstancesTests(TestCase):
@@ -191,6 +327,33 @@ class OpenSurveyInstancesTests(TestCase):
 
         self.assertEqual(0, len(json_obj['data']))
 
+    def test_entry_counts(self):
+        new_position = Position.objects.create(student=self.new_student, x=1, y=1, timestamp=timezone.now())
+        SurveyPositionInstance.objects.create(survey_instance=self.new_survey_instance, position=new_position)
+        SurveyResponse.objects.create(survey_entry=self.new_question_instance, response='Test Response')
+        SurveyResponse.objects.create(survey_entry=self.new_question_instance, response='Second Response')
+
+        response = get_all_open_survey_instances(self.request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(1, len(json_obj['data']))
+        self.assertEqual(1, json_obj['data'][0]['open_count'])
+        self.assertEqual(1, json_obj['data'][0]['answered_count'])
+
+    def test_query_count(self):
+        for i in range(5):
+            survey_instance = SurveyInstance.objects.create(survey=self.new_survey, student=self.new_student,
+                                                            date_generated=datetime.date(2019, 4, 1) + datetime.timedelta(days=i))
+            SurveyQuestionInstance.objects.create(survey_instance=survey_instance, question=self.new_survey_question)
+
+        get_session_cache().clear()
+
+        # Session lookup, the open SurveyInstance objects with their counts and Class, and the Class days
+        with self.assertNumQueries(3):
+            response = get_all_open_survey_instances(self.request)
+
+        self.assertEqual(6, len(json.loads(response.content.decode('utf-8'))['data']))
+
     def test_wrong_request_type(self):
         mock_request = rf.get('/api/survey/open_surveys?session_id=' + str(self.session_id), {})
         response = get_all_open_survey_instances(mock_request)
@@ -273,6 +436,35 @@ class GetSurveyById(TestCase):
         self.assertEqual(0, len(json_obj['data']['positions']))
         self.assertEqual(1, len(json_obj['data']['questions']))
 
+    def test_query_count(self):
+        for i in range(5):
+            new_position = Position.objects.create(student=self.new_student, timestamp=timezone.now(), x=i, y=i)
+            position_instance = SurveyPositionInstance.objects.create(survey_instance=self.new_survey_instance, position=new_position)
+            SurveyResponse.objects.create(survey_entry=position_instance, response='Test Response')
+
+        get_session_cache().clear()
+
+        # Session lookup, the SurveyInstance with its Class and days, the responses, the question entries and the position entries
+        with self.assertNumQueries(6):
+            response = get_survey_by_id(self.request)
+
+        self.assertEqual(5, len(json.loads(response.content.decode('utf-8'))['data']['positions']))
+
+    def test_responses_included(self):
+        SurveyResponse.objects.create(survey_entry=self.new_question_instance, response='Old Response')
+        new_response = SurveyResponse.objects.create(survey_entry=self.new_question_instance, response='Test Response')
+
+        response = get_survey_by_id(self.request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual({'id': new_response.id, 'response': 'Test Response'}, json_obj['data']['questions'][0]['response'])
+
+    def test_no_response(self):
+        response = get_survey_by_id(self.request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertIsNone(json_obj['data']['questions'][0]['response'])
+
     def test_wrong_request_type(self):
         mock_request = rf.get('/api/survey/get?session_id=' + str(self.session_id), {})
         response = get_survey_by_id(mock_request)
@@ -390,6 +582,66 @@ class SurveyResponseAddTests(TestCase):
         self.assertEqual('created', json_obj['data']['1'])
         self.assertEqual('updated', json_obj['data']['2'])
 
+    def test_responses_saved(self):
+        add_responses_to_survey(self.request)
+
+        self.assertEqual('test response', SurveyResponse.objects.get(survey_entry=self.new_question_instance).response)
+        self.assertEqual('test update again', SurveyResponse.objects.get(survey_entry=self.new_question_instance1).response)
+        self.assertEqual(2, SurveyResponse.objects.count())
+
+    def test_entry_of_other_survey_instance(self):
+        other_survey_instance = SurveyInstance.objects.create(survey=self.new_survey, student=self.new_student,
+                                                              date_generated=datetime.date(2019, 4, 1))
+        other_question_instance = SurveyQuestionInstance.objects.create(survey_instance=other_survey_instance,
+                                                                        question=self.new_survey_question)
+
+        mock_request = rf.post('/api/survey/respond?session_id=' + str(self.session_id), {
+            'survey_id': self.new_survey_instance.id,
+            other_question_instance.id: 'test response',
+            'not an id': 'test response'
+        })
+        response = add_responses_to_survey(mock_request)
+        json_obj = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual('bad id', json_obj['data'][str(other_question_instance.id)])
+        self.assertEqual('bad id', json_obj['data']['not an id'])
+        self.assertEqual(0, len(SurveyResponse.objects.filter(survey_entry=other_question_instance)))
+
+    def test_same_entry_sent_twice(self):
+        entry_id = self.new_question_instance.id
+        mock_request = rf.post('/api/survey/respond?session_id=' + str(self.session_id), {
+            'survey_id': self.new_survey_instance.id,
+            str(entry_id): 'first response',
+            '0' + str(entry_id): 'second response'
+        })
+        json_obj = json.loads(add_responses_to_survey(mock_request).content.decode('utf-8'))
+
+        self.assertEqual('created', json_obj['data']['0' + str(entry_id)])
+        self.assertEqual(1, len(SurveyResponse.objects.filter(survey_entry_id=entry_id)))
+
+    def test_constant_query_count(self):
+        for i in range(20):
+            SurveyQuestionInstance.objects.create(survey_instance=self.new_survey_instance, question=self.new_survey_question)
+
+        entry_ids = list(SurveyQuestionInstance.objects.filter(survey_instance=self.new_survey_instance).values_list('id', flat=True))
+        post_data = {str(x): 'test response' for x in entry_ids[:10]}
+        post_data['survey_id'] = self.new_survey_instance.id
+        add_responses_to_survey(rf.post('/api/survey/respond?session_id=' + str(self.session_id), post_data))
+
+        post_data = {str(x): 'test response again' for x in entry_ids}
+        post_data['survey_id'] = self.new_survey_instance.id
+        mock_request = rf.post('/api/survey/respond?session_id=' + str(self.session_id), post_data)
+
+        # The Session, the SurveyInstance, the entries, the existing responses, the insert and update, and the analytics version
+        with CaptureQueriesContext(connection) as queries:
+            response = add_responses_to_survey(mock_request)
+
+        self.assertEqual('success', json.loads(response.content.decode('utf-8'))['status'])
+        statements = [x for x in queries.captured_queries if 'SAVEPOINT' not in x['sql']]
+        self.assertEqual(7, len(statements))
+        self.assertEqual(22, len(SurveyResponse.objects.filter(survey_entry__survey_instance=self.new_survey_instance,
+                                                              response='test response again')))
+
     def test_wrong_request_type(self):
         mock_request = rf.get('/api/survey/respond?session_id=' + str(self.session_id), {
             'survey_id': self.new_survey_instance.id,
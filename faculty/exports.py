@@ -0,0 +1,106 @@
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api.models import SurveyResponse
+
+import csv
+
+# The number of rows read from the database at a time, and joined into one piece of the response.
+EXPORT_CHUNK_SIZE = 2000
+
+# The columns of an export and the field each one is read from, starting from the SurveyResponse.
+EXPORT_COLUMNS = [
+    ('response_id', 'id'),
+    ('survey_instance', 'survey_entry__survey_instance_id'),
+    ('date_generated', 'survey_entry__survey_instance__date_generated'),
+    ('student', 'survey_entry__survey_instance__student_id'),
+    ('first_name', 'survey_entry__survey_instance__student__user__first_name'),
+    ('last_name', 'survey_entry__survey_instance__student__user__last_name'),
+    ('entry', 'survey_entry_id'),
+    ('question', 'survey_entry__surveyquestioninstance__question_id'),
+    ('question_type', 'survey_entry__surveyquestioninstance__question__type'),
+    ('prompt', 'survey_entry__surveyquestioninstance__question__prompt_text'),
+    ('position', 'survey_entry__surveypositioninstance__position_id'),
+    ('timestamp', 'survey_entry__surveypositioninstance__position__timestamp'),
+    ('x', 'survey_entry__surveypositioninstance__position__x'),
+    ('y', 'survey_entry__surveypositioninstance__position__y'),
+    ('response', 'response')
+]
+
+
+# A file-like object for csv.writer that hands back each line instead of storing it.
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def survey_response_rows(survey):
+    """
+        Function Summary: This function is used to read every SurveyResponse of a Survey, with its entry, SurveyInstance, Student, and question or Position, in one joined query. The rows are read EXPORT_CHUNK_SIZE at a time.
+
+        Args:
+            survey -- The Survey object
+
+        Return:
+            Type: iterator
+            Data: A tuple for each SurveyResponse with the fields in EXPORT_COLUMNS, ordered by SurveyInstance and entry
+    """
+    return SurveyResponse.objects.filter(survey_entry__survey_instance__survey=survey) \
+        .order_by('survey_entry__survey_instance_id', 'survey_entry_id') \
+        .values_list(*[x[1] for x in EXPORT_COLUMNS]) \
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+# Join lines into pieces of EXPORT_CHUNK_SIZE. The first line is sent on its own so the client gets it without waiting.
+def chunk_lines(lines):
+    chunk = []
+    first = True
+    for line in lines:
+        chunk.append(line)
+
+        if first or len(chunk) == EXPORT_CHUNK_SIZE:
+            first = False
+            yield ''.join(chunk)
+            chunk = []
+
+    if len(chunk) != 0:
+        yield ''.join(chunk)
+
+
+def stream_csv(rows):
+    """
+        Function Summary: This function is used to turn export rows into CSV one piece at a time. The header is produced before any rows are read, so the first byte is sent straight away.
+
+        Args:
+            rows -- An iterable of tuples with the fields in EXPORT_COLUMNS
+
+        Return:
+            Type: generator
+            Data: The pieces of the CSV text, to be passed to a StreamingHttpResponse
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow([x[0] for x in EXPORT_COLUMNS])
+    yield from chunk_lines(writer.writerow(row) for row in rows)
+
+
+def stream_ndjson(rows):
+    """
+        Function Summary: This function is used to turn export rows into newline delimited JSON one piece at a time, with one JSON object for each row.
+
+        Args:
+            rows -- An iterable of tuples with the fields in EXPORT_COLUMNS
+
+        Return:
+            Type: generator
+            Data: The pieces of the NDJSON text, to be passed to a StreamingHttpResponse
+    """
+    encoder = DjangoJSONEncoder()
+    names = [x[0] for x in EXPORT_COLUMNS]
+    yield from chunk_lines(encoder.encode(dict(zip(names, row))) + '\n' for row in rows)
+
+
+# The content type and generator of each export format.
+EXPORT_FORMATS = {
+    'csv': ('text/csv', stream_csv),
+    'ndjson': ('application/x-ndjson', stream_ndjson)
+}
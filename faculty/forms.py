@@ -34,6 +34,14 @@ class ClassEnrollmentForm(ModelForm):
         fields = '__all__'
         exclude = ['id', 'admin']
 
+    def __init__(self, *args, admin_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The choices are named with their User, so get it with them instead of once per choice.
+        self.fields['student'].queryset = Student.objects.select_related('user')
+        self.fields['class_enrolled'].queryset = Class.objects.select_related('admin')
+        if admin_id is not None:
+            self.fields['class_enrolled'].queryset = self.fields['class_enrolled'].queryset.filter(admin_id=admin_id)
+
 
 class StudentForm(ModelForm):
     class Meta:
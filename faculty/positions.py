@@ -0,0 +1,56 @@
+from django.db.models import Avg, Count, Max, Min
+
+from api.models import ClassEnrollment, Position, Student
+
+import datetime
+
+
+def admin_positions(admin, start_date, end_date, class_id=None, student_id=None):
+    """
+        Function Summary: This function is used to get the Positions an admin may see on the positions dashboard, which are the Positions of the Students enrolled in their Classes. The filters match the (student, timestamp) index so the database only reads the Positions inside of the dates.
+
+        Args:
+            admin -- The User that is the admin of the Classes
+            start_date -- The first date to include
+            end_date -- The last date to include
+            class_id -- The ID of a Class to only get the Positions of its Students, or None for every Class of the admin
+            student_id -- The ID of a Student to only get the Positions of, or None for every Student
+
+        Return:
+            Type: QuerySet
+            Data: The Position objects, not yet ordered
+    """
+    enrollments = ClassEnrollment.objects.filter(class_enrolled__admin=admin)
+    if class_id is not None:
+        enrollments = enrollments.filter(class_enrolled_id=class_id)
+    if student_id is not None:
+        enrollments = enrollments.filter(student_id=student_id)
+
+    return Position.objects.filter(student_id__in=enrollments.values('student_id'), timestamp__gte=start_date,
+                                   timestamp__lt=end_date + datetime.timedelta(days=1))
+
+
+def student_summaries(positions):
+    """
+        Function Summary: This function is used to sum up Positions by Student with one grouped query, so the summary never has to read the Positions into Python.
+
+        Args:
+            positions -- The QuerySet of Positions from 'admin_positions()'
+
+        Return:
+            Type: list
+            Data: A dictionary for each Student with their 'student' ID, 'first_name', 'last_name', number of 'samples', 'first' and 'last' timestamp, and 'mean_x' and 'mean_y' position, ordered by last name
+    """
+    rows = positions.values('student_id') \
+        .annotate(samples=Count('id'), first=Min('timestamp'), last=Max('timestamp'), mean_x=Avg('x'), mean_y=Avg('y')) \
+        .order_by()
+    summaries = {x['student_id']: x for x in rows}
+
+    students = Student.objects.filter(id__in=list(summaries.keys())) \
+        .values_list('id', 'user__first_name', 'user__last_name') \
+        .order_by('user__last_name', 'user__first_name', 'id')
+
+    return [{'student': student_id, 'first_name': first_name, 'last_name': last_name,
+             'samples': summaries[student_id]['samples'], 'first': summaries[student_id]['first'],
+             'last': summaries[student_id]['last'], 'mean_x': summaries[student_id]['mean_x'],
+             'mean_y': summaries[student_id]['mean_y']} for student_id, first_name, last_name in students]
@@ -1,3 +1,306 @@
+from faculty.views import survey_export, responses_view, positions_dashboard, positions_data, dashboard, class_view, \
+    student_view_table, student_search
+from api.models import Student, Class, ClassEnrollment, DayLookup, Survey, SurveyQuestion, SurveyInstance, \
+    SurveyQuestionInstance, SurveyPositionInstance, SurveyResponse, Position
+
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from django.http import Http404
+
+import csv
+import io
+import json
+import datetime
+
+rf = RequestFactory()
+
+
+class SurveyExportTests(TestCase):
+
+    def setUp(self):
+        self.new_admin = User.objects.create(username='test_admin', is_staff=True)
+        self.new_student = Student.objects.create(user=User.objects.create(username='test_user', first_name='first_test',
+                                                                           last_name='last_test'))
+
+        new_class = Class.objects.create(title='Test Class', admin=self.new_admin, section=1, start_time=datetime.time(9),
+                                         end_time=datetime.time(10))
+        self.new_survey = Survey.objects.create(admin=self.new_admin, associated_class=new_class)
+        self.new_question = SurveyQuestion.objects.create(survey=self.new_survey, prompt_text='How was class?', type='SA')
+        self.new_position = Position.objects.create(student=self.new_student, x=1.5, y=2.5,
+                                                    timestamp=datetime.datetime(2019, 4, 1, 9, 30))
+
+        self.add_responses(3)
+
+    def add_responses(self, count):
+        # A Student has one SurveyInstance of a Survey per day.
+        start = SurveyInstance.objects.count()
+        for i in range(start, start + count):
+            survey_instance = SurveyInstance.objects.create(survey=self.new_survey, student=self.new_student,
+                                                            date_generated=datetime.date(2019, 4, 1) + datetime.timedelta(days=i))
+            question_entry = SurveyQuestionInstance.objects.create(survey_instance=survey_instance, question=self.new_question)
+            position_entry = SurveyPositionInstance.objects.create(survey_instance=survey_instance, position=self.new_position)
+
+            SurveyResponse.objects.create(survey_entry=question_entry, response='Good, ' + str(i - start))
+            SurveyResponse.objects.create(survey_entry=position_entry, response='Front')
+
+    def export(self, export_format):
+        request = rf.get('/faculty/' + str(self.new_survey.id) + '/export', {'format': export_format})
+        request.user = self.new_admin
+        return survey_export(request, self.new_survey.id)
+
+    def test_csv(self):
+        response = self.export('csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+        self.assertEqual('text/csv', response['Content-Type'])
+        self.assertEqual(7, len(rows))
+        self.assertEqual('response_id', rows[0][0])
+
+        question_row = dict(zip(rows[0], rows[1]))
+        self.assertEqual('How was class?', question_row['prompt'])
+        self.assertEqual('Good, 0', question_row['response'])
+        self.assertEqual('last_test', question_row['last_name'])
+        self.assertEqual('', question_row['position'])
+
+        position_row = dict(zip(rows[0], rows[2]))
+        self.assertEqual('1.5', position_row['x'])
+        self.assertEqual('', position_row['question'])
+
+    def test_ndjson(self):
+        response = self.export('ndjson')
+        rows = [json.loads(x) for x in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+
+        self.assertEqual(6, len(rows))
+        self.assertEqual(self.new_question.id, rows[0]['question'])
+        self.assertEqual(self.new_position.id, rows[1]['position'])
+
+    def test_header_sent_before_query(self):
+        response = self.export('csv')
+
+        with self.assertNumQueries(0):
+            self.assertTrue(next(iter(response.streaming_content)).startswith(b'response_id,'))
+
+    def test_one_query(self):
+        self.add_responses(20)
+        response = self.export('csv')
+
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content)
+
+        self.assertEqual(47, len(content.decode('utf-8').splitlines()))
+
+    def test_invalid_format(self):
+        response = self.export('xml')
+
+        self.assertTrue('"error_id": 703' in response.content.decode('utf-8'))
+
+    def test_other_admin(self):
+        request = rf.get('/faculty/' + str(self.new_survey.id) + '/export')
+        request.user = User.objects.create(username='other_admin', is_staff=True)
+
+        with self.assertRaises(Http404):
+            survey_export(request, self.new_survey.id)
+
+    def test_responses_view_constant_query_count(self):
+        def count_queries():
+            request = rf.get('/faculty/' + str(self.new_survey.id) + '/view_responses')
+            request.user = self.new_admin
+            with CaptureQueriesContext(connection) as queries:
+                response = responses_view(request, self.new_survey.id)
+            return len(queries.captured_queries), response.content.decode('utf-8').count('How was class?')
+
+        before, shown = count_queries()
+        self.add_responses(10)
+
+        self.assertEqual(3, shown)
+        self.assertEqual((before, 13), count_queries())
+
+
+class PositionsDashboardTests(TestCase):
+
+    def setUp(self):
+        self.new_admin = User.objects.create(username='test_admin', is_staff=True)
+        self.new_class = Class.objects.create(title='Test Class', admin=self.new_admin, section=1,
+                                              start_time=datetime.time(9), end_time=datetime.time(10))
+        other_class = Class.objects.create(title='Other Class', admin=User.objects.create(username='other_admin', is_staff=True),
+                                           section=1, start_time=datetime.time(9), end_time=datetime.time(10))
+
+        self.students = []
+        for i in range(3):
+            student = Student.objects.create(user=User.objects.create(username='test_user_' + str(i), first_name='first_' + str(i),
+                                                                      last_name='last_' + str(i)))
+            ClassEnrollment.objects.create(student=student, class_enrolled=other_class if i == 2 else self.new_class)
+            self.students.append(student)
+
+        self.add_positions(5)
+
+    def add_positions(self, count):
+        Position.objects.bulk_create([Position(student=x, x=i, y=2 * i, timestamp=datetime.datetime(2019, 4, 1, 9, i))
+                                      for x in self.students for i in range(count)])
+
+    def get_data(self, parameters):
+        parameters = dict({'start_date': '2019-04-01', 'end_date': '2019-04-01'}, **parameters)
+        request = rf.get('/faculty/positions_dashboard/data', parameters)
+        request.user = self.new_admin
+        return json.loads(positions_data(request).content.decode('utf-8'))
+
+    def test_dashboard_does_not_load_positions(self):
+        request = rf.get('/faculty/positions_dashboard/')
+        request.user = self.new_admin
+        response = positions_dashboard(request).content.decode('utf-8')
+
+        self.assertTrue('last_0, first_0' in response)
+        self.assertFalse('last_2, first_2' in response)
+        self.assertFalse('09:01' in response)
+
+    def test_pages(self):
+        first_page = self.get_data({'limit': 6})
+        second_page = self.get_data({'limit': 6, 'cursor': first_page['data']['next_cursor']})
+
+        self.assertEqual(6, len(first_page['data']['positions']))
+        self.assertEqual(4, len(second_page['data']['positions']))
+        self.assertEqual(None, second_page['data']['next_cursor'])
+        self.assertFalse('students' in second_page['data'])
+
+        positions = first_page['data']['positions'] + second_page['data']['positions']
+        self.assertEqual(10, len(set(x['id'] for x in positions)))
+        self.assertEqual('2019-04-01T09:04:00', positions[0]['timestamp'])
+        self.assertFalse(self.students[2].id in set(x['student'] for x in positions))
+
+    def test_summary(self):
+        summaries = self.get_data({'student': self.students[0].id})['data']['students']
+
+        self.assertEqual(1, len(summaries))
+        self.assertEqual(5, summaries[0]['samples'])
+        self.assertEqual(2.0, summaries[0]['mean_x'])
+        self.assertEqual(4.0, summaries[0]['mean_y'])
+        self.assertEqual('2019-04-01T09:00:00', summaries[0]['first'])
+        self.assertEqual('2019-04-01T09:04:00', summaries[0]['last'])
+
+    def test_filters(self):
+        self.assertEqual(10, len(self.get_data({'class': self.new_class.id})['data']['positions']))
+        self.assertEqual(0, len(self.get_data({'student': self.students[2].id})['data']['positions']))
+        self.assertEqual(0, len(self.get_data({'start_date': '2019-04-02', 'end_date': '2019-04-03'})['data']['positions']))
+
+        with self.assertRaises(Http404):
+            self.get_data({'class': self.new_class.id + 1})
+
+    def test_errors(self):
+        self.assertEqual(700, self.get_data({'start_date': '2019-01-01'})['info']['error_id'])
+        self.assertEqual(704, self.get_data({'limit': 0})['info']['error_id'])
+        self.assertEqual(705, self.get_data({'cursor': 'not a cursor'})['info']['error_id'])
+        self.assertEqual(706, self.get_data({'student': 'first_0'})['info']['error_id'])
+
+    def test_constant_query_count(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get_data({'limit': 10})
+            return len(queries.captured_queries), len(response['data']['positions'])
+
+        before = count_queries()
+        self.add_positions(50)
+
+        self.assertEqual((before[0], 10), count_queries())
+
+
+class RosterTests(TestCase):
+
+    def setUp(self):
+        self.new_admin = User.objects.create(username='test_admin', is_staff=True)
+        self.new_class = Class.objects.create(title='Test Class', admin=self.new_admin, section=1,
+                                              start_time=datetime.time(9), end_time=datetime.time(10))
+        self.new_class.days_of_the_week.set(DayLookup.objects.bulk_create([DayLookup(id=1, name='Monday'),
+                                                                            DayLookup(id=3, name='Wednesday')]))
+        self.add_students(3)
+
+    def add_students(self, count, enroll=True):
+        start = Student.objects.count()
+        for i in range(start, start + count):
+            student = Student.objects.create(user=User.objects.create(username='test_user_' + str(i), first_name='First' + str(i),
+                                                                      last_name='Last' + str(i).zfill(3)))
+            if enroll:
+                ClassEnrollment.objects.create(student=student, class_enrolled=self.new_class)
+
+    def count_queries(self, view, *args, path='/faculty/', parameters=None):
+        request = rf.get(path, parameters or {})
+        request.user = self.new_admin
+        with CaptureQueriesContext(connection) as queries:
+            response = view(request, *args)
+        return len(queries.captured_queries), response.content.decode('utf-8')
+
+    def test_dashboard_query_budget(self):
+        queries, content = self.count_queries(dashboard)
+
+        self.assertTrue('Wednesday' in content)
+        self.assertFalse('Last000' in content)
+        self.assertTrue(queries <= 4)
+
+        Class.objects.create(title='Second Class', admin=self.new_admin, section=2, start_time=datetime.time(11),
+                             end_time=datetime.time(12)).days_of_the_week.set([1])
+        self.add_students(20, enroll=False)
+
+        self.assertEqual(queries, self.count_queries(dashboard)[0])
+
+    def test_class_view_query_budget(self):
+        queries, content = self.count_queries(class_view, self.new_class.id)
+
+        self.assertTrue('Last002' in content)
+        self.assertTrue(queries <= 3)
+
+        self.add_students(20)
+        self.assertEqual(queries, self.count_queries(student_view_table, self.new_class.id)[0])
+
+    def test_roster_pages(self):
+        self.add_students(60)
+
+        first_page = self.count_queries(class_view, self.new_class.id)[1]
+        second_page = self.count_queries(class_view, self.new_class.id, parameters={'page': 2})[1]
+
+        self.assertTrue('Last000' in first_page and 'Last049' in first_page and 'Last050' not in first_page)
+        self.assertTrue('Last050' in second_page and 'Last062' in second_page)
+        self.assertTrue('Page 2 of 2 (63 students)' in second_page)
+
+    def test_roster_other_admin(self):
+        request = rf.get('/faculty/' + str(self.new_class.id) + '/view_student')
+        request.user = User.objects.create(username='other_admin', is_staff=True)
+
+        with self.assertRaises(Http404):
+            class_view(request, self.new_class.id)
+
+    def test_student_search(self):
+        self.add_students(20, enroll=False)
+
+        def search(query):
+            queries, content = self.count_queries(student_search, parameters={'q': query})
+            self.assertTrue(queries <= 1)
+            return [x['last_name'] for x in json.loads(content)['data']]
+
+        self.assertEqual(['Last010', 'Last011', 'Last012'], search('last01')[:3])
+        self.assertEqual(20, len(search('Last')))
+        self.assertEqual(['Last002', 'Last020', 'Last021', 'Last022'], search('first2'))
+        self.assertEqual(['Last012'], search('Last012, Fir'))
+        self.assertEqual([], search('Last012 Second'))
+        self.assertEqual([], search(''))
+
+    def test_student_search_any_case(self):
+        users = [User.objects.create(username='mcdonald', first_name='Ann', last_name='McDonald'),
+                 User.objects.create(username='de_vries', first_name='jan', last_name='de Vries')]
+        for user in users:
+            Student.objects.create(user=user)
+
+        def search(query):
+            return [x['last_name'] for x in json.loads(self.count_queries(student_search, parameters={'q': query})[1])['data']]
+
+        self.assertEqual(['McDonald'], search('mcd'))
+        self.assertEqual(['McDonald'], search('MCDONALD a'))
+        self.assertEqual(['de Vries'], search('de'))
+        self.assertEqual(['de Vries'], search('Jan'))
 
-# Create your tests here.
+        # Renaming the User renames the Student in the search.
+        users[0].last_name = 'Smith'
+        users[0].save()
+        self.assertEqual([], search('mcd'))
+        self.assertEqual(['Smith'], search('smi'))
@@ -8,11 +8,13 @@ urlpatterns = [
 
     path('dashboard/', dashboard, name='dashboard'),
     path('positions_dashboard/', positions_dashboard, name='positions_dashboard'),
+    path('positions_dashboard/data', positions_data, name='positions_data'),
     path('survey_dashboard/', survey_dashboard, name='survey_dashboard'),
     path('feedback/', feedback, name='feedback'),
     path('register/', register, name='register'),
     path('forgot_password/', forgot_password, name='forgot_password'),
-    path('student_view_table/', student_view_table, name='student_view_table'),
+    path('student_view_table/<int:class_id>', student_view_table, name='student_view_table'),
+    path('student_search', student_search, name='student_search'),
     path('survey_questions/', survey_questions, name='survey_questions'),
     path('survey_responses/', survey_responses, name='survey_responses'),
 
@@ -32,10 +34,17 @@ urlpatterns = [
     path('save_question_form', question_save_form),
 
     path('<int:class_id>/remove_student', class_remove_student),
+    path('<int:class_id>/heatmap', heatmap_dashboard, name='heatmap_dashboard'),
+    path('<int:class_id>/heatmap/data', heatmap_data, name='heatmap_data'),
+    path('<int:class_id>/metrics', class_metrics, name='class_metrics'),
+    path('<int:class_id>/colocation', colocation_data, name='colocation_data'),
+    path('<int:class_id>/attendance', attendance_dashboard, name='attendance_dashboard'),
 
 
     path('<int:survey_id>/view_responses', responses_view),
     path('<int:survey_id>/view_questions', questions_view),
+    path('<int:survey_id>/export', survey_export, name='survey_export'),
+    path('<int:survey_id>/analytics', survey_analytics, name='survey_analytics'),
 
     path('<int:class_id>/add_question', add_survey_question),
     path('<int:survey_id>/view_survey', survey_view)
@@ -1,38 +1,190 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
+from django.http import JsonResponse, StreamingHttpResponse
+from django.core.paginator import Paginator
+from django.forms import HiddenInput
 from api.models import *
+from api.analytics.heatmap import class_heatmap, get_heatmap_settings
+from api.analytics.movement import class_movement_metrics
+from api.analytics.colocation import class_colocation
+from api.analytics.attendance import class_attendance
+from api.analytics.survey import survey_range_analytics
+from api.pagination import paginate_by_time
+from api.response_functions import Response
+from faculty.exports import EXPORT_FORMATS, survey_response_rows
+from faculty.positions import admin_positions, student_summaries
 from faculty.forms import ClassForm, SurveyQuestionForm, SurveyForm, ClassEnrollmentForm
+from django.db.models import F, Q
 from django.db.utils import IntegrityError
 from django.contrib.admin.views.decorators import staff_member_required
 
+import datetime
+
+FACULTY_ERRORS = {
+    700: 'Invalid date',
+    701: 'Invalid resolution',
+    702: 'Invalid minimum time',
+    703: 'Invalid export format',
+    704: 'Invalid page size',
+    705: 'Invalid cursor',
+    706: 'Invalid filter'
+}
+
+# The number of days shown by the Class heatmap when no dates are given.
+HEATMAP_DEFAULT_DAYS = 30
+
+# The number of days the movement metrics cover when no dates are given, about a semester.
+METRICS_DEFAULT_DAYS = 120
+
+# The number of days shown by the attendance table when no dates are given.
+ATTENDANCE_DEFAULT_DAYS = 30
+
+# The number of days shown by the positions dashboard when no dates are given, and the most it will show at once. The
+# work of each request only grows with the Positions inside of the dates, not with the whole table.
+POSITIONS_DEFAULT_DAYS = 7
+POSITIONS_MAX_DAYS = 31
+
+# The number of Positions on each page of the positions dashboard, and the most a client may ask for.
+POSITIONS_PAGE_SIZE = 100
+POSITIONS_PAGE_MAX_SIZE = 1000
+
+# The number of Students on each page of a Class roster.
+ROSTER_PAGE_SIZE = 50
+
+# The most Students returned by one Student search.
+STUDENT_SEARCH_LIMIT = 20
+
+
+def parse_date_range(parameters, default_days):
+    try:
+        end_date = datetime.datetime.strptime(parameters['end_date'], '%Y-%m-%d').date() \
+            if parameters.get('end_date') else datetime.date.today()
+        start_date = datetime.datetime.strptime(parameters['start_date'], '%Y-%m-%d').date() \
+            if parameters.get('start_date') else end_date - datetime.timedelta(days=default_days)
+    except ValueError:
+        return None
+
+    if start_date > end_date:
+        return None
+
+    return start_date, end_date
+
 
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def dashboard(request):
-    classes = Class.objects.filter(admin=request.user)
-    students = Student.objects.filter()
-    students_enrolled = ClassEnrollment.objects.get_queryset()
+    classes = Class.objects.filter(admin=request.user).prefetch_related('days_of_the_week')
+
+    # Students are picked with the search instead of a list of every Student.
+    student_form = ClassEnrollmentForm(admin_id=request.user.id)
+    student_form.fields['student'].widget = HiddenInput()
+
     return render(request, 'faculty/dashboard.html',
-                  {'students_enrolled': students_enrolled, 'students': students, 'classes': classes,
-                   'class_form': ClassForm(), 'student_form': ClassEnrollmentForm()})
+                  {'classes': classes, 'class_form': ClassForm(), 'student_form': student_form})
+
+
+# The lookups that match every value of a field starting with a prefix.
+def prefix_range(field, prefix):
+    return {field + '__gte': prefix, field + '__lt': prefix + '\U0010ffff'}
+
+
+def render_roster(request, class_id):
+    current_class = get_object_or_404(Class, id=class_id, admin=request.user)
+    enrollments = ClassEnrollment.objects.filter(class_enrolled=current_class).select_related('student__user') \
+        .order_by('student__user__last_name', 'student__user__first_name', 'id')
+    page = Paginator(enrollments, ROSTER_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    return_data = {'class': current_class, 'students': page, 'page': page}
+    if 'error' in request.GET:
+        return_data['error_message'] = request.GET['error']
+
+    return render(request, 'faculty/student_view_table.html', return_data)
 
 
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def student_view_table(request, class_id):
-    current_class = Class.objects.filter(id=class_id)
-    students = current_class.classenrollment_set.all()
-    students_enrolled = ClassEnrollment.student.get_object(
-        instance=ClassEnrollment.objects.get(class_enrolled=class_id))
-    return render(request, 'faculty/student_view_table.html',
-                  {'class': current_class, 'students': students, 'students_enrolled': students_enrolled})
+    return render_roster(request, class_id)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def student_search(request):
+    # Each term only matches the start of a name, in any case. Prefixes of the lower case search names of the Students
+    # are searched as ranges instead of LIKE so the database can use their indexes. 'Smith J' and 'Smith, J' find the
+    # Students named J... Smith.
+    terms = request.GET.get('q', '').replace(',', ' ').lower().split()
+
+    students = Student.objects.none()
+    if len(terms) == 1:
+        students = Student.objects.filter(Q(**prefix_range('search_last_name', terms[0])) |
+                                          Q(**prefix_range('search_first_name', terms[0])))
+    elif len(terms) > 1:
+        students = Student.objects.filter(search_last_name=terms[0], **prefix_range('search_first_name', ' '.join(terms[1:])))
+
+    students = students.values_list('id', 'user__first_name', 'user__last_name') \
+        .order_by('search_last_name', 'search_first_name', 'id')[:STUDENT_SEARCH_LIMIT]
+
+    success_status = Response.get_success_status()
+    success_status['data'] = [{'id': student_id, 'first_name': first_name, 'last_name': last_name,
+                               'name': last_name + ', ' + first_name} for student_id, first_name, last_name in students]
+    return JsonResponse(success_status)
 
 
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def positions_dashboard(request):
-    positions = Position.objects.filter()
-    return render(request, 'faculty/positions_dashboard.html', {'positions': positions})
+    classes = Class.objects.filter(admin=request.user).order_by('title', 'section')
+    students = Student.objects.filter(classenrollment__class_enrolled__admin=request.user).select_related('user').distinct()
+    date_range = parse_date_range({}, POSITIONS_DEFAULT_DAYS)
+    return render(request, 'faculty/positions_dashboard.html',
+                  {'classes': classes, 'students': students, 'start_date': date_range[0], 'end_date': date_range[1],
+                   'page_size': POSITIONS_PAGE_SIZE})
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def positions_data(request):
+    date_range = parse_date_range(request.GET, POSITIONS_DEFAULT_DAYS)
+    if date_range is None or (date_range[1] - date_range[0]).days >= POSITIONS_MAX_DAYS:
+        return JsonResponse(Response.get_error_status(700, FACULTY_ERRORS))
+
+    try:
+        limit = int(request.GET.get('limit', POSITIONS_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse(Response.get_error_status(704, FACULTY_ERRORS))
+
+    if limit < 1 or limit > POSITIONS_PAGE_MAX_SIZE:
+        return JsonResponse(Response.get_error_status(704, FACULTY_ERRORS))
+
+    try:
+        class_id = int(request.GET['class']) if request.GET.get('class') else None
+        student_id = int(request.GET['student']) if request.GET.get('student') else None
+    except ValueError:
+        return JsonResponse(Response.get_error_status(706, FACULTY_ERRORS))
+
+    if class_id is not None:
+        get_object_or_404(Class, id=class_id, admin=request.user)
+
+    positions = admin_positions(request.user, date_range[0], date_range[1], class_id, student_id)
+    cursor = request.GET.get('cursor') or None
+
+    try:
+        page, next_cursor = paginate_by_time(positions.select_related('student__user'), cursor, limit, descending=True)
+    except ValueError:
+        return JsonResponse(Response.get_error_status(705, FACULTY_ERRORS))
+
+    success_status = Response.get_success_status()
+    success_status['data'] = {
+        'positions': [dict(x.to_dict(), name=str(x.student)) for x in page],
+        'next_cursor': next_cursor
+    }
+
+    # The summary covers every page, so it is only sent with the first one.
+    if cursor is None:
+        success_status['data']['students'] = student_summaries(positions)
+
+    return JsonResponse(success_status)
 
 
 @login_required
@@ -99,7 +251,7 @@ def forgot_password(request):
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def class_overview(request, class_id):
-    classes = Class.objects.filter(id=class_id)
+    classes = Class.objects.filter(id=class_id).prefetch_related('days_of_the_week')
     return_data = {'classes': classes}
 
     if 'error' in request.GET:
@@ -169,9 +321,10 @@ def survey_save_form(request):
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def enrollment_save_form(request):
     if 'class' in request.GET:
-        student_form = ClassEnrollmentForm(request.POST, instance=ClassEnrollment.objects.get(id=request.GET['class']))
+        student_form = ClassEnrollmentForm(request.POST, instance=ClassEnrollment.objects.get(id=request.GET['class']),
+                                           admin_id=request.user.id)
     else:
-        student_form = ClassEnrollmentForm(request.POST)
+        student_form = ClassEnrollmentForm(request.POST, admin_id=request.user.id)
 
     if not student_form.is_valid():
         print(student_form.errors)
@@ -253,10 +406,7 @@ def add_students_specific_class(request, class_id, first_name, last_name):
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def class_view(request, class_id):
-    current_class = Class.objects.get(id=class_id)
-    students = current_class.classenrollment_set.all()
-    return_data = {'class': current_class, 'students': students}
-    return render(request, 'faculty/student_view_table.html', return_data)
+    return render_roster(request, class_id)
 
 
 @login_required
@@ -271,25 +421,13 @@ def questions_view(request, survey_id):
 @login_required
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def responses_view(request, survey_id):
-    survey_instances = SurveyInstance.objects.filter(survey=survey_id)
-    survey_entry_instances = []
-    for survey_instance in survey_instances:
-        survey_entry_instances.extend([x for x in SurveyEntryInstance.objects.filter(survey_instance=survey_instance)])
-
-    responses = []
-    for survey_entry_instance in survey_entry_instances:
-        responses.extend([x for x in SurveyResponse.objects.filter(survey_entry=survey_entry_instance)])
-
-    question_responses = []
-    for response in responses:
-        try:
-            test_survey_entry = SurveyQuestionInstance.objects.get(id=response.survey_entry.id)
-            response.prompt = test_survey_entry.question.prompt_text
-            question_responses.append(response)
-        except SurveyQuestionInstance.DoesNotExist:
-            pass
-
-    return_data = {'responses': question_responses}
+    question_responses = SurveyResponse.objects \
+        .filter(survey_entry__survey_instance__survey=survey_id, survey_entry__surveyquestioninstance__isnull=False) \
+        .select_related('survey_entry__survey_instance__student__user') \
+        .annotate(prompt=F('survey_entry__surveyquestioninstance__question__prompt_text')) \
+        .order_by('survey_entry__survey_instance_id', 'survey_entry_id')
+
+    return_data = {'responses': question_responses, 'survey_id': survey_id}
     return render(request, 'faculty/survey_responses.html', return_data)
 
 
@@ -319,9 +457,10 @@ def survey_view(request, survey_id):
 @user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
 def student_view_form(request):
     if 'student' in request.GET:
-        student_form = ClassEnrollmentForm(instance=ClassEnrollment.objects.get(id=request.GET['student']))
+        student_form = ClassEnrollmentForm(instance=ClassEnrollment.objects.get(id=request.GET['student']),
+                                           admin_id=request.user.id)
     else:
-        student_form = ClassEnrollmentForm()
+        student_form = ClassEnrollmentForm(admin_id=request.user.id)
     return render(request, 'faculty/student_enrollment_form.html', {'student_form': student_form})
 
 
@@ -331,3 +470,135 @@ def class_remove_student(request, class_id):
     remove_student = ClassEnrollment.objects.get(class_enrolled=class_id)
     remove_student.delete()
     return redirect('/faculty/' + str(class_id) + '/view_student')
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def heatmap_dashboard(request, class_id):
+    current_class = get_object_or_404(Class, id=class_id, admin=request.user)
+    return render(request, 'faculty/heatmap_dashboard.html',
+                  {'class': current_class, 'default_bins': get_heatmap_settings()['DEFAULT_BINS']})
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def heatmap_data(request, class_id):
+    current_class = get_object_or_404(Class, id=class_id, admin=request.user)
+
+    date_range = parse_date_range(request.GET, HEATMAP_DEFAULT_DAYS)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(700, FACULTY_ERRORS))
+
+    heatmap_settings = get_heatmap_settings()
+    try:
+        bins = int(request.GET.get('bins', heatmap_settings['DEFAULT_BINS']))
+    except ValueError:
+        return JsonResponse(Response.get_error_status(701, FACULTY_ERRORS))
+
+    if bins < 1 or bins > heatmap_settings['MAX_BINS']:
+        return JsonResponse(Response.get_error_status(701, FACULTY_ERRORS))
+
+    success_status = Response.get_success_status()
+    success_status['data'] = class_heatmap(current_class, date_range[0], date_range[1], bins)
+    return JsonResponse(success_status)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def class_metrics(request, class_id):
+    current_class = get_object_or_404(Class, id=class_id, admin=request.user)
+
+    date_range = parse_date_range(request.GET, METRICS_DEFAULT_DAYS)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(700, FACULTY_ERRORS))
+
+    meetings, metrics = class_movement_metrics(current_class, date_range[0], date_range[1])
+    students = Student.objects.filter(id__in=list(metrics.keys())).select_related('user')
+
+    success_status = Response.get_success_status()
+    success_status['data'] = {
+        'start_date': str(date_range[0]),
+        'end_date': str(date_range[1]),
+        'meetings': meetings,
+        'students': [dict(metrics[x.id], id=x.id, name=str(x)) for x in students]
+    }
+    return JsonResponse(success_status)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def colocation_data(request, class_id):
+    current_class = get_object_or_404(Class, id=class_id, admin=request.user)
+
+    date_range = parse_date_range(request.GET, METRICS_DEFAULT_DAYS)
+    if date_range is None:
+        return JsonResponse(Response.get_error_status(700, FACULTY_ERRORS))
+
+    try:
+        min_seconds = float(request.GET.get('min_seconds', 0))
+    except ValueError:
+        return JsonResponse(Response.get_error_status(702, FACULTY_ERRORS))
+
+    if min_seconds < 0:
+        return JsonResponse(Response.get_error_status(702, FACULTY_ERRORS))
+
+    graph = class_colocation(current_class, date_range[0], date_range[1], min_seconds)
+    students = Student.objects.filter(classenrollment__class_enrolled=current_class).select_related('user')
+    graph['students'] = [{'id': x.id, 'name': str(x)} for x in students]
+
+    success_status = Response.get_success_status()
+    success_status['data'] = graph
+    return JsonResponse(success_status)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def attendance_dashboard(request, class_id):
+    current_class = get_object_or_404(Class.objects.prefetch_related('days_of_the_week'), id=class_id, admin=request.user)
+    return_data = {'class': current_class}
+
+    date_range = parse_date_range(request.GET, ATTENDANCE_DEFAULT_DAYS)
+    if date_range is None:
+        return_data['error_message'] = FACULTY_ERRORS[700]
+        date_range = parse_date_range({}, ATTENDANCE_DEFAULT_DAYS)
+
+    attendance = {}
+    for record in class_attendance(current_class, date_range[0], date_range[1]):
+        attendance.setdefault(record.student_id, {})[record.meeting_date] = record
+
+    dates = sorted(set(x for records in attendance.values() for x in records))
+    students = Student.objects.filter(classenrollment__class_enrolled=current_class).select_related('user')
+
+    return_data.update({
+        'start_date': date_range[0],
+        'end_date': date_range[1],
+        'dates': dates,
+        'rows': [{'student': x, 'cells': [attendance.get(x.id, {}).get(y) for y in dates],
+                  'present': sum(1 for y in attendance.get(x.id, {}).values() if y.present)} for x in students]
+    })
+    return render(request, 'faculty/attendance_dashboard.html', return_data)
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def survey_export(request, survey_id):
+    survey = get_object_or_404(Survey, id=survey_id, admin=request.user)
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(Response.get_error_status(703, FACULTY_ERRORS))
+
+    content_type, stream = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(survey_response_rows(survey)), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="survey_%d_responses.%s"' % (survey.id, export_format)
+    return response
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff, login_url='/accounts/login')
+def survey_analytics(request, survey_id):
+    survey = get_object_or_404(Survey, id=survey_id, admin=request.user)
+
+    success_status = Response.get_success_status()
+    success_status['data'] = survey_range_analytics(survey)
+    return JsonResponse(success_status)